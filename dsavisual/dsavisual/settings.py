@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'visualizer.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,6 +68,12 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 50,
 }
 
+# Code execution sandbox (see visualizer/services/conf.py for all options)
+CODE_EXECUTION = {
+    'PYTHON_POOL_SIZE': 4,
+    'PYTHON_POOL_MAX_JOBS': 100,
+}
+
 # CORS — allow React dev server
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:5173',
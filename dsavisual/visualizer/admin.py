@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import VisualizationConfig, AnimationStep
+from .models import VisualizationConfig, AnimationStep, PrecomputedTrace
 
 
 class AnimationStepInline(admin.TabularInline):
@@ -19,3 +19,10 @@ class VisualizationConfigAdmin(admin.ModelAdmin):
 class AnimationStepAdmin(admin.ModelAdmin):
     list_display = ("config", "action_name", "display_order")
     list_filter = ("action_name",)
+
+
+@admin.register(PrecomputedTrace)
+class PrecomputedTraceAdmin(admin.ModelAdmin):
+    list_display = ("snippet", "source_hash", "computed_at")
+    readonly_fields = ("snippet", "source_hash", "computed_at")
+    exclude = ("data",)
@@ -1,5 +1,49 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
 
 class VisualizerConfig(AppConfig):
     name = 'visualizer'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .services import conf, java_runner, worker_pool
+
+        serving = _is_serving()
+        if _warms_up(conf.get("PYTHON_POOL_WARM_UP"), serving):
+            worker_pool.warm_up()
+        if _warms_up(conf.get("JAVA_POOL_WARM_UP"), serving):
+            java_runner.warm_up()
+
+
+# Programs that serve the project's WSGI/ASGI application.
+SERVERS = {"gunicorn", "uvicorn", "daphne", "hypercorn", "uwsgi"}
+
+
+def _warms_up(setting, serving):
+    """Whether a pool whose warm-up ``setting`` is this starts now."""
+    if setting == "always":
+        return True
+    return bool(setting) and serving
+
+
+def _is_serving():
+    """Whether this process will handle requests (not a one-off command)."""
+    if not sys.argv or not sys.argv[0]:
+        # python -c, embedded interpreters.
+        return False
+    program = os.path.basename(sys.argv[0])
+    if program == "__main__.py":
+        # python -m gunicorn ...
+        program = os.path.basename(os.path.dirname(sys.argv[0]))
+    if program in SERVERS:
+        return True
+    if program != "manage.py":
+        return False
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command != "runserver":
+        return False
+    # Under the autoreloader only the child process serves requests.
+    return "--noreload" in sys.argv or os.environ.get("RUN_MAIN") == "true"
@@ -0,0 +1,7 @@
+"""
+Benchmarks for the code executor.
+
+``corpus`` holds the programs, ``runner`` times them; use the
+``benchmark_executor`` management command or ``bench_executor.py`` (with
+pytest-benchmark) to run them.
+"""
@@ -0,0 +1,29 @@
+"""
+pytest-benchmark entry point for the executor corpus.
+
+Not collected by a plain test run; invoke it explicitly, e.g.::
+
+    pytest visualizer/benchmarks/bench_executor.py --benchmark-json=out.json
+
+Requires the pytest-benchmark plugin and skips itself without it.
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from visualizer.benchmarks import corpus, runner  # noqa: E402
+from visualizer.services.executor import execute_code  # noqa: E402
+
+
+@pytest.mark.parametrize("case", corpus.CASES, ids=[c["name"] for c in corpus.CASES])
+def test_execute(benchmark, case):
+    missing = runner.missing_toolchain(case["language"])
+    if missing:
+        pytest.skip(f"{missing} not installed")
+    kwargs = {k: v for k, v in case.items() if k != "name"}
+
+    result = benchmark(execute_code, timeout=10, **kwargs)
+
+    assert result["success"], result["error"]
+    benchmark.extra_info["trace_steps"] = len(result.get("steps", []))
+    benchmark.extra_info["execution_time_ms"] = result.get("execution_time_ms", 0)
@@ -0,0 +1,237 @@
+"""
+Programs the executor benchmarks run.
+
+Each case is a dict with ``name``, ``language``, ``code`` and optional
+``input_data`` or ``watch``, i.e. ``execute_code`` keyword arguments plus a
+name. The built-in cases mirror the seeded sorting snippets and add stress programs
+for deep recursion, long loops and large outputs in every language.
+"""
+
+SELECTION_SORT_PY = '''\
+def selection_sort(arr):
+    n = len(arr)
+    for i in range(n - 1):
+        min_idx = i
+        for j in range(i + 1, n):
+            if arr[j] < arr[min_idx]:
+                min_idx = j
+        arr[i], arr[min_idx] = arr[min_idx], arr[i]
+    return arr
+
+print(selection_sort(list(_input_data["array"])))
+'''
+
+MERGE_SORT_PY = '''\
+def merge_sort(arr):
+    if len(arr) <= 1:
+        return arr
+    mid = len(arr) // 2
+    left, right = merge_sort(arr[:mid]), merge_sort(arr[mid:])
+    merged, i, j = [], 0, 0
+    while i < len(left) and j < len(right):
+        if left[i] <= right[j]:
+            merged.append(left[i])
+            i += 1
+        else:
+            merged.append(right[j])
+            j += 1
+    return merged + left[i:] + right[j:]
+
+print(merge_sort(list(_input_data["array"])))
+'''
+
+BINARY_SEARCH_PY = '''\
+def binary_search(arr, target):
+    lo, hi = 0, len(arr) - 1
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if arr[mid] == target:
+            return mid
+        if arr[mid] < target:
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return -1
+
+arr = sorted(_input_data["array"])
+print([binary_search(arr, x) for x in arr])
+'''
+
+DEEP_RECURSION_PY = '''\
+def depth(n):
+    return 0 if n == 0 else 1 + depth(n - 1)
+
+print(depth(900))
+'''
+
+BIG_LOOP_PY = '''\
+total = 0
+for i in range(200000):
+    total += i * i
+print(total)
+'''
+
+LARGE_OUTPUT_PY = '''\
+for i in range(20000):
+    print("line", i)
+'''
+
+SELECTION_SORT_C = '''\
+#include <stdio.h>
+
+int main(void) {
+    int arr[] = {64, 25, 12, 22, 11, 90, 3, 47, 58, 1};
+    int n = sizeof(arr) / sizeof(arr[0]);
+    for (int i = 0; i < n - 1; i++) {
+        int min_idx = i;
+        for (int j = i + 1; j < n; j++)
+            if (arr[j] < arr[min_idx]) min_idx = j;
+        int tmp = arr[i]; arr[i] = arr[min_idx]; arr[min_idx] = tmp;
+    }
+    for (int i = 0; i < n; i++) printf("%d ", arr[i]);
+    printf("\\n");
+    return 0;
+}
+'''
+
+DEEP_RECURSION_C = '''\
+#include <stdio.h>
+
+static int depth(int n) { return n == 0 ? 0 : 1 + depth(n - 1); }
+
+int main(void) {
+    printf("%d\\n", depth(100000));
+    return 0;
+}
+'''
+
+BIG_LOOP_C = '''\
+#include <stdio.h>
+
+int main(void) {
+    volatile long long total = 0;
+    for (long long i = 0; i < 50000000; i++) total += i * i;
+    printf("%lld\\n", total);
+    return 0;
+}
+'''
+
+LARGE_OUTPUT_C = '''\
+#include <stdio.h>
+
+int main(void) {
+    for (int i = 0; i < 20000; i++) printf("line %d\\n", i);
+    return 0;
+}
+'''
+
+QUICK_SORT_CPP = '''\
+#include <iostream>
+#include <vector>
+using namespace std;
+
+int partition(vector<int>& a, int lo, int hi) {
+    int pivot = a[hi], i = lo - 1;
+    for (int j = lo; j < hi; j++)
+        if (a[j] <= pivot) swap(a[++i], a[j]);
+    swap(a[i + 1], a[hi]);
+    return i + 1;
+}
+
+void quick_sort(vector<int>& a, int lo, int hi) {
+    if (lo < hi) {
+        int p = partition(a, lo, hi);
+        quick_sort(a, lo, p - 1);
+        quick_sort(a, p + 1, hi);
+    }
+}
+
+int main() {
+    vector<int> a = {10, 80, 30, 90, 40, 50, 70};
+    quick_sort(a, 0, a.size() - 1);
+    for (int x : a) cout << x << " ";
+    cout << endl;
+    return 0;
+}
+'''
+
+LARGE_OUTPUT_CPP = '''\
+#include <iostream>
+using namespace std;
+
+int main() {
+    for (int i = 0; i < 20000; i++) cout << "line " << i << "\\n";
+    return 0;
+}
+'''
+
+SELECTION_SORT_JAVA = '''\
+public class Main {
+    public static void main(String[] args) {
+        int[] arr = {64, 25, 12, 22, 11, 90, 3, 47, 58, 1};
+        for (int i = 0; i < arr.length - 1; i++) {
+            int minIdx = i;
+            for (int j = i + 1; j < arr.length; j++)
+                if (arr[j] < arr[minIdx]) minIdx = j;
+            int tmp = arr[i]; arr[i] = arr[minIdx]; arr[minIdx] = tmp;
+        }
+        StringBuilder out = new StringBuilder();
+        for (int x : arr) out.append(x).append(' ');
+        System.out.println(out);
+    }
+}
+'''
+
+BIG_LOOP_JAVA = '''\
+public class Main {
+    public static void main(String[] args) {
+        long total = 0;
+        for (long i = 0; i < 50000000L; i++) total += i * i;
+        System.out.println(total);
+    }
+}
+'''
+
+_ARRAY = {"array": [64, 25, 12, 22, 11, 90, 3, 47, 58, 1]}
+
+CASES = [
+    {"name": "py-selection-sort", "language": "python",
+     "code": SELECTION_SORT_PY, "input_data": _ARRAY},
+    {"name": "py-merge-sort", "language": "python",
+     "code": MERGE_SORT_PY, "input_data": _ARRAY},
+    {"name": "py-binary-search", "language": "python",
+     "code": BINARY_SEARCH_PY, "input_data": _ARRAY},
+    {"name": "py-deep-recursion", "language": "python", "code": DEEP_RECURSION_PY},
+    {"name": "py-big-loop", "language": "python", "code": BIG_LOOP_PY},
+    {"name": "py-big-loop-watched", "language": "python", "code": BIG_LOOP_PY,
+     "watch": {"variables": ["total"], "lines": [[3, 3]], "sample_every": 1000}},
+    {"name": "py-large-output", "language": "python", "code": LARGE_OUTPUT_PY},
+    {"name": "c-selection-sort", "language": "c", "code": SELECTION_SORT_C},
+    {"name": "c-deep-recursion", "language": "c", "code": DEEP_RECURSION_C},
+    {"name": "c-big-loop", "language": "c", "code": BIG_LOOP_C},
+    {"name": "c-large-output", "language": "c", "code": LARGE_OUTPUT_C},
+    {"name": "cpp-quick-sort", "language": "cpp", "code": QUICK_SORT_CPP},
+    {"name": "cpp-large-output", "language": "cpp", "code": LARGE_OUTPUT_CPP},
+    {"name": "java-selection-sort", "language": "java", "code": SELECTION_SORT_JAVA},
+    {"name": "java-big-loop", "language": "java", "code": BIG_LOOP_JAVA},
+]
+
+
+def seeded_cases():
+    """Cases for the final snippets stored in the database (needs Django)."""
+    from concepts.models import CodeSnippet
+
+    snippets = CodeSnippet.objects.filter(is_final_code=True).select_related(
+        "section__concept__visualization"
+    )
+    cases = []
+    for snippet in snippets:
+        concept = snippet.section.concept
+        config = getattr(concept, "visualization", None)
+        cases.append({
+            "name": f"seeded-{concept.slug}-{snippet.language}",
+            "language": snippet.language,
+            "code": snippet.code,
+            "input_data": config.default_input if config is not None else None,
+        })
+    return cases
@@ -0,0 +1,183 @@
+"""
+Times executor runs and aggregates them into a JSON-serializable report.
+
+Every case is run once cold (compile cache and worker pool as found), then
+``warmup`` untimed times, then ``iterations`` timed times spread over
+``concurrency`` threads. Per case the report has latency percentiles, the
+split between time spent inside the program (``execution_time_ms``) and
+everything around it (spawn, compile, IPC, parsing), the trace size, and
+the response size in each wire format and content coding available.
+"""
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from ..middleware import CODINGS
+from ..renderers import BINARY_RENDERERS
+from ..services.executor import COMPILED_LANGUAGES, execute_code
+
+# Toolchain a language needs beyond the compiler in COMPILED_LANGUAGES.
+_RUNTIMES = {"java": "java"}
+
+
+def percentile(values, pct):
+    """``pct``-th percentile of ``values`` by linear interpolation."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _summary(values):
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def missing_toolchain(language):
+    """Name of a required program that is not installed, if any."""
+    required = []
+    if language in COMPILED_LANGUAGES:
+        required.append(COMPILED_LANGUAGES[language]["compiler"])
+    if language in _RUNTIMES:
+        required.append(_RUNTIMES[language])
+    return next((name for name in required if shutil.which(name) is None), None)
+
+
+def wire_bytes(result):
+    """Response body size of ``result`` per ``format[+coding]``."""
+    bodies = {"json": json.dumps(result).encode("utf-8")}
+    for renderer in BINARY_RENDERERS:
+        bodies[renderer.format] = renderer().render(result)
+    sizes = {}
+    for name, body in bodies.items():
+        sizes[name] = len(body)
+        for coding, compress in CODINGS.items():
+            sizes[f"{name}+{coding}"] = len(compress(body))
+    return sizes
+
+
+def _timed_run(case, timeout):
+    kwargs = {k: v for k, v in case.items() if k != "name"}
+    start = time.perf_counter()
+    result = execute_code(timeout=timeout, **kwargs)
+    latency_ms = (time.perf_counter() - start) * 1000
+    return latency_ms, result
+
+
+def run_case(case, iterations, concurrency=1, warmup=1, timeout=10):
+    """Benchmark one corpus case; returns its report entry."""
+    missing = missing_toolchain(case["language"])
+    if missing:
+        return {"language": case["language"], "skipped": f"{missing} not installed"}
+
+    cold_ms, result = _timed_run(case, timeout)
+    for _ in range(warmup):
+        _timed_run(case, timeout)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        runs = list(pool.map(lambda _: _timed_run(case, timeout), range(iterations)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in runs]
+    run_times = [r.get("execution_time_ms", 0) for _, r in runs]
+    overheads = [latency - run for latency, run in zip(latencies, run_times)]
+    steps = result.get("steps", [])
+    return {
+        "language": case["language"],
+        "success": all(r.get("success") for _, r in runs),
+        "error": next((r["error"] for _, r in runs if r.get("error")), ""),
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "cold_ms": round(cold_ms, 3),
+        "latency_ms": _summary(latencies),
+        "run_ms": _summary(run_times),
+        "overhead_ms": _summary(overheads),
+        "throughput_per_s": round(iterations / elapsed, 2),
+        "trace_steps": len(steps),
+        "trace_bytes": len(json.dumps(steps)),
+        "output_bytes": len(result.get("output", "")),
+        "wire_bytes": wire_bytes(result),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(cases, iterations=20, concurrency=1, warmup=1, timeout=10, progress=None):
+    """
+    Benchmark ``cases`` one after another and return the full report.
+
+    ``progress``, if given, is called with each case name before it runs.
+    Peak RSS is the high-water mark of this process and of all reaped child
+    processes; warm pool workers are only counted once they are recycled.
+    """
+    report = {
+        "meta": {
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "iterations": iterations,
+            "concurrency": concurrency,
+            "warmup": warmup,
+        },
+        "cases": {},
+    }
+    for case in cases:
+        if progress is not None:
+            progress(case["name"])
+        report["cases"][case["name"]] = run_case(
+            case, iterations, concurrency, warmup, timeout
+        )
+
+    # ru_maxrss is in KiB on Linux but bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    report["peak_rss_bytes"] = {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale,
+    }
+    return report
+
+
+def compare(baseline, current):
+    """
+    Per-case latency change between two reports.
+
+    Returns ``{name: {"p50": pct, "p95": pct}}`` with the relative change in
+    percent for cases present and not skipped in both.
+    """
+    changes = {}
+    for name, entry in current["cases"].items():
+        before = baseline["cases"].get(name)
+        if not before or "skipped" in before or "skipped" in entry:
+            continue
+        changes[name] = {
+            key: round(
+                100 * (entry["latency_ms"][key] - before["latency_ms"][key])
+                / before["latency_ms"][key], 1
+            ) if before["latency_ms"][key] else None
+            for key in ("p50", "p95")
+        }
+    return changes
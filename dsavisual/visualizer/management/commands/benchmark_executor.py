@@ -0,0 +1,97 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from visualizer.benchmarks import corpus, runner
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the code executor on the built-in corpus and report "
+        "latency percentiles, throughput, peak RSS and trace sizes as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20,
+                            help="Timed runs per case (default: 20).")
+        parser.add_argument("--concurrency", type=int, default=1,
+                            help="Runs in flight at once (default: 1).")
+        parser.add_argument("--warmup", type=int, default=1,
+                            help="Untimed runs per case after the cold run.")
+        parser.add_argument("--timeout", type=int, default=10,
+                            help="Per-run timeout in seconds (default: 10).")
+        parser.add_argument("--language", action="append", dest="languages",
+                            help="Only cases in this language (may be repeated).")
+        parser.add_argument("--case", action="append", dest="names",
+                            help="Only cases whose name contains this (may be repeated).")
+        parser.add_argument("--seeded", action="store_true",
+                            help="Also run the final snippets stored in the database.")
+        parser.add_argument("--no-pool", action="store_true",
+                            help="Disable the warm Python and Java worker pools.")
+        parser.add_argument("--trace-backend",
+                            choices=["auto", "settrace", "monitoring"],
+                            help="Python tracing hook to benchmark.")
+        parser.add_argument("--output", "-o",
+                            help="Write the JSON report here instead of stdout.")
+        parser.add_argument("--compare", metavar="BASELINE",
+                            help="Print latency changes against an earlier report.")
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--iterations and --concurrency must be positive.")
+
+        cases = list(corpus.CASES)
+        if options["seeded"]:
+            cases += corpus.seeded_cases()
+        if options["languages"]:
+            cases = [c for c in cases if c["language"] in options["languages"]]
+        if options["names"]:
+            cases = [
+                c for c in cases
+                if any(name in c["name"] for name in options["names"])
+            ]
+        if not cases:
+            raise CommandError("No benchmark cases selected.")
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)
+
+        execution = dict(getattr(settings, "CODE_EXECUTION", {}))
+        if options["no_pool"]:
+            execution["PYTHON_POOL_SIZE"] = 0
+            execution["JAVA_POOL_SIZE"] = 0
+        if options["trace_backend"]:
+            execution["TRACE_BACKEND"] = options["trace_backend"]
+        with override_settings(CODE_EXECUTION=execution):
+            report = runner.run(
+                cases,
+                iterations=options["iterations"],
+                concurrency=options["concurrency"],
+                warmup=options["warmup"],
+                timeout=options["timeout"],
+                progress=lambda name: self.stderr.write(f"running {name}"),
+            )
+        report["meta"]["python_pool"] = not options["no_pool"]
+        report["meta"]["trace_backend"] = execution.get("TRACE_BACKEND", "auto")
+
+        encoded = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(encoded + "\n")
+        else:
+            self.stdout.write(encoded)
+
+        if baseline is not None:
+            for name, change in runner.compare(baseline, report).items():
+                self.stderr.write(
+                    f"{name}: p50 {_signed(change['p50'])}, "
+                    f"p95 {_signed(change['p95'])}"
+                )
+
+
+def _signed(pct):
+    return "n/a" if pct is None else f"{pct:+.1f}%"
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from concepts.models import CodeSnippet
+from visualizer.services import precompute
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every final code snippet on its concept's default input and "
+        "store the compressed trace."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concept", action="append", dest="concepts", metavar="SLUG",
+            help="Only this concept (may be repeated).",
+        )
+        parser.add_argument(
+            "--force", action="store_true",
+            help="Recompute traces that are already up to date.",
+        )
+
+    def handle(self, *args, **options):
+        snippets = CodeSnippet.objects.filter(is_final_code=True).select_related(
+            "section__concept__visualization"
+        )
+        if options["concepts"]:
+            snippets = snippets.filter(section__concept__slug__in=options["concepts"])
+
+        counts = {}
+        for snippet in snippets:
+            outcome = precompute.precompute(snippet, force=options["force"])
+            counts[outcome] = counts.get(outcome, 0) + 1
+            label = f"{snippet.section.concept.slug} [{snippet.language}]"
+            if outcome == "failed":
+                self.stderr.write(f"{label}: execution failed, nothing stored")
+            elif outcome == "skipped":
+                self.stdout.write(f"{label}: language not supported, skipped")
+            elif outcome == "computed":
+                self.stdout.write(f"{label}: computed")
+
+        summary = ", ".join(f"{n} {outcome}" for outcome, n in sorted(counts.items()))
+        self.stdout.write(self.style.SUCCESS(f"Done: {summary or 'no snippets'}."))
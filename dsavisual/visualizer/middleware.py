@@ -0,0 +1,100 @@
+"""
+Response compression negotiated through ``Accept-Encoding``.
+
+Unlike Django's ``GZipMiddleware`` this also speaks zstd and brotli (when
+``zstandard`` / ``brotli`` are installed), which compress repetitive traces
+better and faster than gzip. Only API payload types are compressed, so HTML
+pages carrying CSRF tokens are never exposed to BREACH-style attacks, and
+streaming responses are left alone so events still arrive as they happen.
+"""
+import gzip
+
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .services import conf
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install zstandard
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/msgpack", "application/cbor",
+)
+
+
+def _zstd(data):
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=5)
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+CODINGS = {
+    name: compress for name, compress, module in (
+        ("zstd", _zstd, zstandard), ("br", _brotli, brotli), ("gzip", _gzip, gzip),
+    )
+    if module is not None
+}
+
+
+def accepted_codings(header):
+    """Content codings in an ``Accept-Encoding`` header with a non-zero q."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compresses API responses with the best coding the client accepts."""
+
+    def process_response(self, request, response):
+        if response.streaming or response.has_header("Content-Encoding"):
+            return response
+        content_type = response.get("Content-Type", "").split(";")[0].strip()
+        if content_type not in COMPRESSIBLE_TYPES:
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < conf.get("COMPRESSION_MIN_BYTES"):
+            return response
+
+        accepted = accepted_codings(request.headers.get("Accept-Encoding"))
+        coding = next(
+            (name for name in conf.get("COMPRESSION_CODINGS")
+             if name in accepted and name in CODINGS),
+            None,
+        )
+        if coding is None:
+            return response
+        compressed = CODINGS[coding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = coding
+        # The representation changed, so a strong ETag no longer matches it.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
@@ -0,0 +1,23 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('concepts', '0001_initial'),
+        ('visualizer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedTrace',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_hash', models.CharField(max_length=64)),
+                ('data', models.BinaryField(help_text='gzip-compressed JSON execution result.')),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+                ('snippet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='precomputed_trace', to='concepts.codesnippet')),
+            ],
+        ),
+    ]
@@ -1,6 +1,6 @@
 from django.db import models
 
-from concepts.models import Concept
+from concepts.models import Concept, CodeSnippet
 
 
 class VisualizationConfig(models.Model):
@@ -58,3 +58,22 @@ class AnimationStep(models.Model):
 
     def __str__(self):
         return f"{self.config} — {self.action_name} (step {self.display_order})"
+
+
+class PrecomputedTrace(models.Model):
+    """Execution trace of a final code snippet run on its concept's default input.
+
+    Stored as gzip-compressed JSON so it can be served without re-running the
+    code. ``source_hash`` identifies the code, language and input the trace
+    was computed from; a trace whose hash no longer matches is stale.
+    """
+
+    snippet = models.OneToOneField(
+        CodeSnippet, on_delete=models.CASCADE, related_name="precomputed_trace"
+    )
+    source_hash = models.CharField(max_length=64)
+    data = models.BinaryField(help_text="gzip-compressed JSON execution result.")
+    computed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Trace for {self.snippet}"
@@ -0,0 +1,148 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+try:
+    import msgpack
+except ImportError:  # optional: pip install msgpack
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # optional: pip install cbor2
+    cbor2 = None
+
+# Step fields whose dicts are keyed by variable (or field) names.
+_NAMED_FIELDS = ("locals", "changed")
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets views answer ``Accept: text/event-stream`` (Server-Sent Events).
+
+    The views stream their own body, so this only takes part in content
+    negotiation and renders error payloads as a single event.
+    """
+
+    media_type = "text/event-stream"
+    format = "sse"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return f"event: error\ndata: {json.dumps(data)}\n\n".encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Lets views answer ``Accept: application/x-ndjson`` (one JSON per line)."""
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return (json.dumps(data) + "\n").encode(self.charset)
+
+
+def columnar_steps(steps):
+    """
+    Re-lay a trace's ``steps`` out as one array per step field.
+
+    Returns ``{"layout": "columnar", "length": N, "names": [...], <field>:
+    [...]}``: each field present in any step gets an array of N values,
+    ``None`` where a step lacks it. Variable, field and type names are
+    interned into ``names``, so ``locals``/``changed`` become flat
+    ``[name index, value, ...]`` lists, ``removed`` a list of name indexes
+    and ``heap`` a flat ``[node id, type index, [name index, value, ...],
+    ...]`` list.
+    """
+    names, index = [], {}
+
+    def intern(name):
+        n = index.get(name)
+        if n is None:
+            n = index[name] = len(names)
+            names.append(name)
+        return n
+
+    def flat(mapping):
+        out = []
+        for k, v in mapping.items():
+            out += (intern(k), v)
+        return out
+
+    columns = {}
+    for n, step in enumerate(steps):
+        for field, value in step.items():
+            column = columns.get(field)
+            if column is None:
+                column = columns[field] = [None] * len(steps)
+            if field in _NAMED_FIELDS:
+                value = flat(value)
+            elif field == "removed":
+                value = [intern(k) for k in value]
+            elif field == "heap":
+                value = [
+                    part
+                    for node_id, node in value.items()
+                    for part in (int(node_id), intern(node["type"]), flat(node["fields"]))
+                ]
+            column[n] = value
+    return {"layout": "columnar", "length": len(steps), "names": names, **columns}
+
+
+def compact(data):
+    """``data`` with a trace's ``steps`` list in the columnar layout."""
+    if isinstance(data, dict) and isinstance(data.get("steps"), list) and all(
+        isinstance(step, dict) and "line" in step for step in data["steps"]
+    ):
+        return {**data, "steps": columnar_steps(data["steps"])}
+    return data
+
+
+class MessagePackRenderer(BaseRenderer):
+    """``Accept: application/msgpack``: MessagePack with columnar traces."""
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(compact(data), use_bin_type=True)
+
+
+class CBORRenderer(BaseRenderer):
+    """``Accept: application/cbor``: CBOR with columnar traces."""
+
+    media_type = "application/cbor"
+    format = "cbor"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return cbor2.dumps(compact(data))
+
+
+# Binary renderers whose libraries are installed.
+BINARY_RENDERERS = [
+    renderer for renderer, module in (
+        (MessagePackRenderer, msgpack), (CBORRenderer, cbor2),
+    )
+    if module is not None
+]
+
+
+def binary_renderer_for(accept):
+    """
+    A binary renderer the ``Accept`` header asks for by name, or ``None``.
+
+    For plain Django views; DRF views negotiate through ``renderer_classes``.
+    """
+    media_types = [part.split(";")[0].strip() for part in (accept or "").split(",")]
+    for renderer in BINARY_RENDERERS:
+        if renderer.media_type in media_types:
+            return renderer()
+    return None
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
 from .models import VisualizationConfig, AnimationStep
+from .services import complexity, conf, executor
 
 
 class AnimationStepSerializer(serializers.ModelSerializer):
@@ -23,6 +24,38 @@ class VisualizationConfigSerializer(serializers.ModelSerializer):
         ]
 
 
+class WatchSerializer(serializers.Serializer):
+    """Restricts a Python trace to what the visualization actually shows."""
+
+    variables = serializers.ListField(
+        child=serializers.CharField(), required=False,
+        help_text="Only snapshot these local variables.",
+    )
+    functions = serializers.ListField(
+        child=serializers.CharField(), required=False,
+        help_text="Only trace these functions ('<module>' for top-level code).",
+    )
+    lines = serializers.ListField(
+        child=serializers.ListField(
+            child=serializers.IntegerField(min_value=1), min_length=2, max_length=2,
+        ),
+        required=False,
+        help_text="Only record steps on these inclusive [first, last] line ranges.",
+    )
+    sample_every = serializers.IntegerField(
+        min_value=1, default=1,
+        help_text="Record every Nth matching step.",
+    )
+
+    def validate_lines(self, value):
+        for first, last in value:
+            if first > last:
+                raise serializers.ValidationError(
+                    f"Range [{first}, {last}] ends before it starts."
+                )
+        return value
+
+
 class CodeExecutionSerializer(serializers.Serializer):
     """Validates user-submitted code for sandbox execution."""
 
@@ -32,7 +65,111 @@ class CodeExecutionSerializer(serializers.Serializer):
         default="python",
     )
     input_data = serializers.JSONField(required=False, default=list)
+    input_cases = serializers.ListField(
+        child=serializers.JSONField(), required=False, min_length=1,
+        help_text="Inputs to run the code on one after another, in a single "
+                  "process or build, instead of input_data. The result has "
+                  "one result per input in 'cases'.",
+    )
     viz_type = serializers.ChoiceField(
         choices=["array", "linked_list", "stack", "queue", "tree", "graph", "heap"],
         required=False,
     )
+    trace_mode = serializers.ChoiceField(
+        choices=["full", "delta"],
+        default="full",
+        help_text="'delta' records only the locals that changed at each step.",
+    )
+    max_steps = serializers.IntegerField(required=False, min_value=1)
+    watch = WatchSerializer(required=False)
+    optimization = serializers.ChoiceField(
+        choices=["O0", "O2"],
+        default="O0",
+        help_text="C/C++ optimization level: 'O0' compiles fastest, 'O2' "
+                  "for timing programs.",
+    )
+    trace = serializers.BooleanField(
+        default=False,
+        help_text="Trace C/C++ programs line by line (Python is always "
+                  "traced). Traced builds are unoptimized.",
+    )
+    mode = serializers.ChoiceField(
+        choices=["trace", "count", "profile", "sample"],
+        default="trace",
+        help_text="'count' runs Python code without recording steps and "
+                  "returns its comparisons, swaps, reads and writes of list "
+                  "items in 'operations'; 'profile' returns the hits and "
+                  "time of each line in 'profile'; 'sample' samples the "
+                  "call stack of Python, C or C++ code and returns it as "
+                  "collapsed stacks and a speedscope file in 'flamegraph'.",
+    )
+    cache = serializers.BooleanField(
+        default=True,
+        help_text="Set to false to always run the code instead of reusing "
+                  "a cached result.",
+    )
+    paged = serializers.BooleanField(
+        default=False,
+        help_text="Store the trace server-side and return its id instead of "
+                  "the steps, which are then fetched from "
+                  "/api/traces/<id>/steps/.",
+    )
+
+    def validate_input_cases(self, value):
+        limit = conf.get("BATCH_MAX_CASES")
+        if len(value) > limit:
+            raise serializers.ValidationError(
+                f"At most {limit} input cases can be run at once."
+            )
+        return value
+
+    def validate(self, data):
+        if data.get("input_cases") is not None and data["paged"]:
+            raise serializers.ValidationError(
+                {"paged": "Batches of input cases cannot be paged."}
+            )
+        if data["mode"] != "trace":
+            error = executor.mode_error(data["mode"], data["language"])
+            if error:
+                raise serializers.ValidationError({"mode": error})
+            if data["paged"]:
+                raise serializers.ValidationError(
+                    {"paged": f"Runs in {data['mode']} mode have no steps to page."}
+                )
+        return data
+
+
+class ComplexityAnalysisSerializer(serializers.Serializer):
+    """Validates a request to measure how a program's run time grows."""
+
+    code = serializers.CharField()
+    language = serializers.ChoiceField(
+        choices=["python", "c", "cpp", "java"],
+        default="python",
+    )
+    input_kind = serializers.ChoiceField(
+        choices=complexity.INPUT_KINDS,
+        default="random",
+        help_text="Order of the generated arrays.",
+    )
+    min_size = serializers.IntegerField(min_value=2, default=16)
+    max_size = serializers.IntegerField(min_value=2, required=False)
+    growth = serializers.FloatField(
+        min_value=1.25, max_value=10, default=2.0,
+        help_text="Factor between successive input sizes.",
+    )
+    repetitions = serializers.IntegerField(min_value=1, max_value=50, default=5)
+    warmup = serializers.IntegerField(min_value=0, max_value=10, default=1)
+    time_budget = serializers.FloatField(
+        min_value=0.1, required=False,
+        help_text="Seconds to spend at most, up to the server's limit.",
+    )
+    optimization = serializers.ChoiceField(choices=["O0", "O2"], default="O2")
+    seed = serializers.IntegerField(default=0)
+
+    def validate(self, data):
+        if data.get("max_size") is not None and data["max_size"] < data["min_size"]:
+            raise serializers.ValidationError(
+                {"max_size": "Must be at least min_size."}
+            )
+        return data
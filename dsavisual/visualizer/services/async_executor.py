@@ -0,0 +1,383 @@
+"""
+Asyncio variant of ``execute_code`` for the ASGI server.
+
+Programs run through ``asyncio.create_subprocess_exec``, so one event loop
+can hold many executions in flight without a thread each. A per-loop
+semaphore caps how many run at once, and a cancelled request (client
+disconnect) or an expired timeout kills the child process. Batches too run
+this way, so a disconnect also stops the cases not yet run.
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import weakref
+
+from . import compile_cache, conf, java_runner, metrics, process, sandbox, worker_pool
+from .executor import (
+    COMPILED_LANGUAGES,
+    batch_timeout,
+    compilation_error_result,
+    compile_source,
+    compiled_result,
+    OPTIMIZATION_LEVELS,
+    error_result,
+    execute_batch,
+    execute_c_code,
+    execute_cpp_code,
+    execute_java_pooled,
+    mark_failed_cases,
+    mode_error,
+    python_batch_from_events,
+    python_job,
+    program_input,
+    python_result_from_events,
+    run_command,
+    split_tracer_stdout,
+    timeout_result,
+)
+
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _semaphore():
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(conf.get("ASYNC_MAX_CONCURRENCY"))
+    return _semaphores[loop]
+
+
+async def _communicate(command, stdin, timeout, timer, cwd=None, channel=False,
+                       preexec_fn=None, output_limit=None, env=None, on_channel=None):
+    """
+    Run ``command`` to completion, timing the spawn and run phases.
+
+    Returns ``(returncode, stdout, stderr, channel_data, output_truncated)``;
+    with ``channel`` the child gets an extra pipe via ``--channel-fd`` whose
+    contents end up in ``channel_data``, or are passed chunk by chunk to
+    ``on_channel`` as they arrive (``channel_data`` is then empty).
+    ``preexec_fn`` applies the sandbox limits, and the child is killed once
+    it writes more than ``output_limit`` bytes to stdout or stderr. ``env``
+    is the child's environment (default: the server's).
+    """
+    loop = asyncio.get_running_loop()
+    pass_fds = ()
+    if channel:
+        read_fd, write_fd = os.pipe()
+        read_pipe = os.fdopen(read_fd, "rb")
+        command = [*command, "--channel-fd", str(write_fd)]
+        pass_fds = (write_fd,)
+    start = loop.time()
+    try:
+        child = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            pass_fds=pass_fds,
+            cwd=cwd,
+            preexec_fn=preexec_fn,
+            env=env,
+        )
+    except BaseException:
+        if channel:
+            read_pipe.close()
+        raise
+    finally:
+        if channel:
+            os.close(write_fd)
+    timer.add("spawn", loop.time() - start)
+
+    async def read_channel():
+        if not channel:
+            return b""
+        reader = asyncio.StreamReader()
+        transport, _ = await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(reader), read_pipe,
+        )
+        try:
+            if on_channel is None:
+                return await reader.read()
+            while True:
+                data = await reader.read(process.CHUNK_SIZE)
+                if not data:
+                    return b""
+                on_channel(data)
+        finally:
+            transport.close()
+
+    def kill():
+        try:
+            child.kill()
+        except ProcessLookupError:
+            pass
+
+    output = [process.OutputBuffer(output_limit, kill) for _ in range(2)]
+
+    async def read_output(stream, buffer):
+        # Read to EOF even past the limit: the child is being killed, and
+        # wait() only returns once its pipes are closed.
+        while True:
+            data = await stream.read(process.CHUNK_SIZE)
+            if not data:
+                return
+            buffer.add(data)
+
+    async def write_input():
+        try:
+            child.stdin.write(stdin)
+            await child.stdin.drain()
+            child.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def run():
+        # The channel is read alongside stdout/stderr so the child never
+        # blocks on a full pipe.
+        channel_task = asyncio.ensure_future(read_channel())
+        try:
+            await asyncio.gather(
+                write_input(),
+                read_output(child.stdout, output[0]),
+                read_output(child.stderr, output[1]),
+            )
+            await child.wait()
+            return await channel_task
+        finally:
+            channel_task.cancel()
+
+    start = loop.time()
+    try:
+        channel_data = await asyncio.wait_for(run(), timeout)
+        timer.add("run", loop.time() - start)
+    except BaseException:
+        # Timeout or cancellation: never leave the child running.
+        if child.returncode is None:
+            child.kill()
+        await asyncio.shield(child.wait())
+        raise
+    finally:
+        # Already closed with its transport unless the channel was never
+        # read (cancelled before it started).
+        if channel:
+            read_pipe.close()
+    stdout, stderr = output
+    return (
+        child.returncode,
+        stdout.text(),
+        stderr.text(),
+        channel_data.decode("utf-8", errors="replace"),
+        stdout.truncated or stderr.truncated,
+    )
+
+
+async def _execute_python(code, input_data, timeout, trace_mode, max_steps, watch,
+                          mode="trace"):
+    # The sandbox reports its own run time, which replaces the wall time of
+    # the whole child process in the result's timings.
+    timer = metrics.PhaseTimer()
+    cpu_seconds = sandbox.cpu_seconds(timeout)
+    with timer.phase("write"):
+        job = json.dumps(python_job(
+            code, input_data, trace_mode, max_steps, watch,
+            cpu_seconds=cpu_seconds, mode=mode,
+        ))
+    _, stdout, stderr, channel_data, truncated = await _communicate(
+        [sys.executable, worker_pool.TRACER_PATH], job.encode("utf-8"), timeout,
+        timer, channel=process.CHANNEL_SUPPORTED,
+        preexec_fn=sandbox.preexec("python", cpu_seconds),
+        output_limit=conf.get("OUTPUT_MAX_BYTES"),
+        env=sandbox.python_env(),
+    )
+    if process.CHANNEL_SUPPORTED:
+        event_lines = channel_data.splitlines()
+    else:
+        event_lines, stdout = split_tracer_stdout(stdout)
+    return python_result_from_events(event_lines, stdout, stderr, timer, truncated)
+
+
+async def _execute_compiled(language, code, timeout, optimization="O0",
+                            trace=False, max_steps=None, input_data=None,
+                            mode="trace"):
+    if (trace or mode == "sample") and language in ("c", "cpp"):
+        # Traced and sampled runs post-process their logs; keep them off the loop.
+        execute = execute_c_code if language == "c" else execute_cpp_code
+        return await asyncio.to_thread(
+            execute, code, timeout, optimization, trace, max_steps, input_data,
+            mode,
+        )
+    if language == "java":
+        pool = java_runner.get_pool()
+        if pool is not None:
+            # Warm JVMs are checked out and read with blocking calls.
+            return await asyncio.to_thread(
+                execute_java_pooled, pool, code, timeout, input_data
+            )
+    # Compilation goes through the shared cache, whose single-flight locks
+    # are thread based; cache hits return from the worker thread at once.
+    timer = metrics.PhaseTimer()
+    try:
+        artifact_dir = await asyncio.to_thread(
+            compile_source, language, code, timeout, timer, optimization
+        )
+    except compile_cache.CompilationFailed as e:
+        return compilation_error_result(e, timer)
+    return await _run_build(language, artifact_dir, input_data, timeout, timer)
+
+
+async def _run_build(language, artifact_dir, input_data, timeout, timer):
+    extra_env = sandbox.native_env(language)
+    with tempfile.TemporaryDirectory() as run_dir:
+        returncode, stdout, stderr, _, truncated = await _communicate(
+            run_command(language, artifact_dir),
+            program_input(input_data).encode("utf-8"), timeout, timer, cwd=run_dir,
+            preexec_fn=sandbox.preexec(language, sandbox.cpu_seconds(timeout)),
+            output_limit=conf.get("OUTPUT_MAX_BYTES"),
+            env={**os.environ, **extra_env} if extra_env else None,
+        )
+    return compiled_result(returncode, stdout, stderr, timer, truncated)
+
+
+async def _python_batch(code, input_cases, timeout, total, trace_mode, max_steps,
+                        watch, mode):
+    """``(cases, result)`` of a Python batch, run in one tracer process."""
+    timer = metrics.PhaseTimer()
+    cpu_seconds = sandbox.cpu_seconds(timeout)
+    with timer.phase("write"):
+        job = json.dumps(python_job(
+            code, None, trace_mode, max_steps, watch,
+            cpu_seconds=cpu_seconds, cases=input_cases, mode=mode,
+        ))
+    received = bytearray()
+    try:
+        _, stdout, stderr, _, truncated = await _communicate(
+            [sys.executable, worker_pool.TRACER_PATH], job.encode("utf-8"), total,
+            timer, channel=process.CHANNEL_SUPPORTED,
+            preexec_fn=sandbox.preexec("python", cpu_seconds),
+            output_limit=conf.get("OUTPUT_MAX_BYTES"),
+            env=sandbox.python_env(),
+            on_channel=received.extend,
+        )
+    except asyncio.TimeoutError:
+        # Keep the results of the cases that finished.
+        cases, _ = python_batch_from_events(received.split(b"\n")[:-1], "", "")
+        return cases, timeout_result(total)
+    if process.CHANNEL_SUPPORTED:
+        event_lines = received.split(b"\n")[:-1]
+    else:
+        event_lines, stdout = split_tracer_stdout(stdout)
+    return python_batch_from_events(event_lines, stdout, stderr, timer, truncated)
+
+
+async def _compiled_batch(language, code, input_cases, timeout, total, optimization):
+    """``(cases, result)`` of a C/C++/Java batch, run on one build."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + total
+    timer = metrics.PhaseTimer()
+    try:
+        artifact_dir = await asyncio.to_thread(
+            compile_source, language, code, timeout, timer, optimization
+        )
+    except compile_cache.CompilationFailed as e:
+        return [], compilation_error_result(e, timer)
+    except subprocess.TimeoutExpired:
+        return [], timeout_result(total)
+    cases = []
+    for index, input_data in enumerate(input_cases):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return cases, timeout_result(total)
+        case_timer = metrics.PhaseTimer()
+        try:
+            result = await _run_build(
+                language, artifact_dir, input_data, min(timeout, remaining), case_timer
+            )
+        except asyncio.TimeoutError:
+            result = timeout_result(timeout)
+        for phase, seconds in case_timer.seconds.items():
+            timer.add(phase, seconds)
+        cases.append({"index": index, **result})
+    # Its time is that of the runs.
+    return cases, compiled_result(0, "", "", timer)
+
+
+async def _execute_batch(code, language, input_cases, timeout, trace_mode, max_steps,
+                         watch, optimization, trace, mode):
+    """Awaitable counterpart of ``executor.execute_batch``."""
+    language = language.lower()
+    if (
+        optimization not in OPTIMIZATION_LEVELS
+        or (language != "python" and language not in COMPILED_LANGUAGES)
+        or mode_error(mode, language)
+        or ((trace or mode == "sample") and language in ("c", "cpp"))
+        or (language == "java" and java_runner.get_pool() is not None)
+    ):
+        # Rejected requests, and runs that block as in _execute_compiled.
+        async with _semaphore():
+            return await asyncio.to_thread(
+                execute_batch, code, language, input_cases, timeout, trace_mode,
+                max_steps, watch, optimization, trace, mode,
+            )
+    total = batch_timeout(timeout, len(input_cases))
+    async with _semaphore():
+        try:
+            if language == "python":
+                cases, result = await _python_batch(
+                    code, input_cases, timeout, total, trace_mode, max_steps, watch, mode
+                )
+            else:
+                cases, result = await _compiled_batch(
+                    language, code, input_cases, timeout, total, optimization
+                )
+        except Exception as e:
+            cases, result = [], error_result(f"Execution error: {str(e)}")
+    mark_failed_cases(result, sum(not case["success"] for case in cases), len(input_cases))
+    metrics.observe_result(language, result)
+    result["steps"] = []
+    result["cases"] = cases
+    return result
+
+
+async def execute_code_async(
+    code: str, language: str = 'python', input_data=None, timeout: int = 5,
+    trace_mode: str = "full", max_steps: int = None, watch: dict = None,
+    optimization: str = "O0", trace: bool = False, input_cases: list = None,
+    mode: str = "trace",
+) -> dict:
+    """Awaitable counterpart of ``executor.execute_code`` with the same result."""
+    if input_cases is not None:
+        # Batches run their cases in turn on one tracer or build.
+        return await _execute_batch(
+            code, language, input_cases, timeout, trace_mode, max_steps, watch,
+            optimization, trace, mode,
+        )
+    language = language.lower()
+    if optimization not in OPTIMIZATION_LEVELS:
+        return error_result(f"Unsupported optimization level: {optimization}")
+
+    if language != 'python' and language not in ('c', 'cpp', 'java'):
+        return error_result(f"Unsupported language: {language}")
+    if mode_error(mode, language):
+        return error_result(mode_error(mode, language))
+
+    async with _semaphore():
+        try:
+            if language == 'python':
+                result = await _execute_python(
+                    code, input_data, timeout, trace_mode, max_steps, watch, mode
+                )
+            else:
+                result = await _execute_compiled(
+                    language, code, timeout, optimization, trace, max_steps,
+                    input_data, mode,
+                )
+        except (asyncio.TimeoutError, subprocess.TimeoutExpired):
+            result = timeout_result(timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result = error_result(f"Execution error: {str(e)}")
+    metrics.observe_result(language, result)
+    return result
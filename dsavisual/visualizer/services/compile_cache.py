@@ -0,0 +1,252 @@
+"""
+Content-addressed cache of compiled C/C++/Java artifacts.
+
+Entries are directories named after a hash of the language, compiler
+identity, flags and source, so re-running an unchanged program skips the
+compiler entirely. The cache is bounded by total size with least-recently
+used eviction, and concurrent builds of the same key are collapsed into one.
+Builds run in a scratch directory on tmpfs where available (see
+``work_root()``), so compilers never touch the disk until the artifact is
+published.
+"""
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from . import conf
+
+
+class CompilationFailed(Exception):
+    """The compiler rejected the source; ``stderr`` holds its diagnostics."""
+
+    def __init__(self, stderr):
+        super().__init__(stderr)
+        self.stderr = stderr
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_identity(compiler):
+    """First line of ``<compiler> --version``, so upgrades change every key."""
+    try:
+        result = subprocess.run(
+            [compiler, "--version"], capture_output=True, text=True, timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return compiler
+    banner = (result.stdout or result.stderr).strip().splitlines()
+    return banner[0] if banner else compiler
+
+
+def work_root():
+    """
+    Directory for compiler scratch space: ``COMPILE_WORK_DIR``, else
+    ``/dev/shm`` when it is a writable tmpfs, else ``None`` (build in place).
+    """
+    configured = conf.get("COMPILE_WORK_DIR")
+    if configured:
+        os.makedirs(configured, exist_ok=True)
+        return configured
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        path = os.path.join("/dev/shm", "dsavisual-build")
+        os.makedirs(path, exist_ok=True)
+        return path
+    return None
+
+
+def compiler_env(workdir):
+    """Environment for a compiler run in ``workdir``, keeping its temp files there."""
+    return {**os.environ, "TMPDIR": workdir}
+
+
+def _tree_size(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class CompileCache:
+    """
+    Build-once store of compiler outputs under ``root``.
+
+    With ``work_root``, builds run in a scratch directory there and are
+    copied under ``root`` once they succeed.
+    """
+
+    def __init__(self, root, max_bytes, work_root=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.work_root = work_root
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._building = {}
+        self._index = None  # key -> [size, last_used]
+
+    @staticmethod
+    def make_key(*parts):
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _load_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        index = {}
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            index[name] = [_tree_size(path), os.path.getmtime(path)]
+        self._index = index
+
+    def _key_lock(self, key):
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+            entry = self._building.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        return entry
+
+    def _release_key_lock(self, key, entry):
+        with self._lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._building[key]
+
+    def get(self, key):
+        """The artifact directory of ``key`` if it is built, else ``None``."""
+        path = os.path.join(self.root, key)
+        with self._lock:
+            if self._index is None:
+                self._load_index()
+        if not os.path.isdir(path):
+            return None
+        self._touch(key, path)
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def _publish(self, workdir, path):
+        """Move a finished build from ``workdir`` to ``path``."""
+        if self.work_root is not None:
+            staged = tempfile.mkdtemp(prefix=".build-", dir=self.root)
+            try:
+                shutil.copytree(workdir, staged, dirs_exist_ok=True)
+            except BaseException:
+                shutil.rmtree(staged, ignore_errors=True)
+                raise
+            shutil.rmtree(workdir, ignore_errors=True)
+            workdir = staged
+        try:
+            os.rename(workdir, path)
+        except OSError:
+            # Another process published the same key first.
+            shutil.rmtree(workdir, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+
+    def get_or_build(self, key, build):
+        """
+        Return ``(path, hit)`` for the artifact directory of ``key``.
+
+        On a miss ``build(workdir)`` is called to fill a scratch directory,
+        which is then published atomically under the key. Only one caller per
+        key builds at a time; the others wait and reuse its result.
+        """
+        path = os.path.join(self.root, key)
+        entry = self._key_lock(key)
+        try:
+            with entry[0]:
+                if os.path.isdir(path):
+                    self._touch(key, path)
+                    with self._lock:
+                        self.hits += 1
+                    return path, True
+
+                with self._lock:
+                    self.misses += 1
+                os.makedirs(self.root, exist_ok=True)
+                workdir = tempfile.mkdtemp(
+                    prefix=".build-", dir=self.work_root or self.root
+                )
+                try:
+                    build(workdir)
+                    self._publish(workdir, path)
+                except BaseException:
+                    shutil.rmtree(workdir, ignore_errors=True)
+                    raise
+                with self._lock:
+                    self._index[key] = [_tree_size(path), time.time()]
+                self._evict(keep=key)
+                return path, False
+        finally:
+            self._release_key_lock(key, entry)
+
+    def _touch(self, key, path):
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self._index.setdefault(key, [_tree_size(path), now])[1] = now
+
+    def _evict(self, keep):
+        with self._lock:
+            total = sum(size for size, _ in self._index.values())
+            victims = []
+            for key, (size, _) in sorted(
+                self._index.items(), key=lambda item: item[1][1]
+            ):
+                if total <= self.max_bytes:
+                    break
+                if key == keep or key in self._building:
+                    continue
+                victims.append(key)
+                total -= size
+            for key in victims:
+                del self._index[key]
+                self.evictions += 1
+        for key in victims:
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._index or {}),
+                "bytes": sum(size for size, _ in (self._index or {}).values()),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide compile cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompileCache(
+                root=conf.get("COMPILE_CACHE_DIR") or os.path.join(
+                    tempfile.gettempdir(), "dsavisual-compile-cache"
+                ),
+                max_bytes=conf.get("COMPILE_CACHE_MAX_BYTES"),
+                work_root=work_root(),
+            )
+    return _cache
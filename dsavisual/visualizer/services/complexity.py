@@ -0,0 +1,321 @@
+"""
+Empirical time complexity of submitted programs.
+
+``analyze()`` runs a program untraced on generated inputs whose size n
+grows geometrically: a few warm-up runs, then ``repetitions`` timed runs
+per size. The median times are fitted against each class in
+``COMPLEXITY_CLASSES``. Sizes stop once the next one would not finish
+within the time budget (``ANALYSIS_TIME_BUDGET``).
+
+Inputs are ``{"n": n, "array": [...]}``: Python programs read
+``_input_data["array"]``, compiled ones get n and then the array on stdin
+(see ``executor.program_input``). Python is timed inside the tracer
+process and Java inside the warm JVM where there is one. Other compiled
+programs are timed from outside, so their times include starting the
+process, which the fitted constant absorbs.
+"""
+import math
+import random
+import statistics
+import subprocess
+import time
+
+from . import compile_cache, conf, java_runner, metrics, sandbox, worker_pool
+from .executor import (
+    COMPILED_LANGUAGES,
+    compile_source,
+    execute_java_pooled,
+    python_job,
+    run_compiled,
+    stream_python_job,
+)
+
+# Growth of each class, by the name shown to users.
+COMPLEXITY_CLASSES = {
+    "O(1)": lambda n: 1.0,
+    "O(log n)": lambda n: math.log2(n),
+    "O(n)": lambda n: float(n),
+    "O(n log n)": lambda n: n * math.log2(n),
+    "O(n^2)": lambda n: float(n) ** 2,
+    "O(n^3)": lambda n: float(n) ** 3,
+}
+
+INPUT_KINDS = ("random", "sorted", "reversed")
+
+# Sizes measured before a fit is attempted.
+MIN_FIT_SIZES = 4
+
+
+class ProgramFailed(Exception):
+    """The program failed on a generated input; ``result`` says how."""
+
+    def __init__(self, result):
+        super().__init__(result.get("error", ""))
+        self.result = result
+
+
+class BudgetExceeded(Exception):
+    """A run did not finish within what was left of the time budget."""
+
+
+def generate_input(kind: str, n: int, seed: int = 0) -> dict:
+    """An input of size ``n``: ``n`` integers, shuffled, sorted or reversed."""
+    rng = random.Random(f"{seed}:{n}")
+    array = rng.choices(range(10 * n), k=n)
+    if kind == "sorted":
+        array.sort()
+    elif kind == "reversed":
+        array.sort(reverse=True)
+    return {"n": n, "array": array}
+
+
+def input_sizes(min_size: int, max_size: int, growth: float):
+    """``min_size``, then sizes ``growth`` times larger up to ``max_size``."""
+    n = min_size
+    while n <= max_size:
+        yield n
+        n = max(n + 1, round(n * growth))
+
+
+def fit(sizes, times) -> list:
+    """
+    Fit ``times`` (seconds, one per size) against every complexity class.
+
+    Each class is fitted as ``constant + coefficient * f(n)`` (``O(1)`` as
+    a constant alone) by least squares on relative errors, as the times
+    span orders of magnitude. The ``confidence`` of a class is its Akaike
+    weight: the likelihood, among these classes, that it models the times
+    best. Returns the fits, most likely first.
+    """
+    m = len(sizes)
+    weights = [1 / max(t, 1e-9) ** 2 for t in times]
+    fits = []
+    for name, growth in COMPLEXITY_CLASSES.items():
+        xs = [growth(n) for n in sizes]
+        constant, coefficient = _weighted_fit(xs, times, weights, name != "O(1)")
+        rss = sum(
+            w * (constant + coefficient * x - t) ** 2
+            for x, t, w in zip(xs, times, weights)
+        )
+        k = 1 if coefficient == 0 or constant == 0 else 2
+        # AIC corrected for the few points there are.
+        aic = m * math.log(max(rss / m, 1e-12)) + 2 * k
+        if m > k + 1:
+            aic += 2 * k * (k + 1) / (m - k - 1)
+        fits.append({
+            "complexity": name,
+            "constant_ms": constant * 1000,
+            "coefficient_ms": coefficient * 1000,
+            "relative_error": math.sqrt(rss / m),
+            "aic": aic,
+        })
+    best = min(f["aic"] for f in fits)
+    likelihoods = [math.exp((best - f.pop("aic")) / 2) for f in fits]
+    total = sum(likelihoods)
+    for f, likelihood in zip(fits, likelihoods):
+        f["confidence"] = round(likelihood / total, 3)
+        f["relative_error"] = round(f["relative_error"], 4)
+    fits.sort(key=lambda f: -f["confidence"])
+    return fits
+
+
+def _weighted_fit(xs, ys, weights, with_slope):
+    """``(constant, coefficient)`` minimizing the weighted squared errors, both >= 0."""
+    w = sum(weights)
+    sy = sum(wi * y for wi, y in zip(weights, ys))
+    if not with_slope:
+        return sy / w, 0.0
+    sx = sum(wi * x for wi, x in zip(weights, xs))
+    sxx = sum(wi * x * x for wi, x in zip(weights, xs))
+    sxy = sum(wi * x * y for wi, x, y in zip(weights, xs, ys))
+    det = w * sxx - sx * sx
+    if det <= 0:
+        return sy / w, 0.0
+    coefficient = (w * sxy - sx * sy) / det
+    if coefficient <= 0:
+        return sy / w, 0.0
+    constant = (sy - coefficient * sx) / w
+    if constant < 0:
+        return 0.0, sxy / sxx
+    return constant, coefficient
+
+
+def _python_runner(code):
+    def measure(input_data, warmup, repetitions, timeout):
+        job = python_job(code, input_data, cpu_seconds=sandbox.cpu_seconds(timeout))
+        job["timing"] = {"warmup": warmup, "repetitions": repetitions}
+        times, result = [], {}
+        try:
+            for event in stream_python_job(job, timeout):
+                if event["event"] == "timing":
+                    times = [ns / 1e9 for ns in event["data"]["times_ns"]]
+                elif event["event"] == "result":
+                    result = event["data"]
+        except (worker_pool.WorkerTimeout, subprocess.TimeoutExpired):
+            raise BudgetExceeded()
+        _check(result)
+        return times
+
+    return measure
+
+
+def _compiled_runner(language, code, optimization, timeout):
+    pool = java_runner.get_pool() if language == "java" else None
+    if pool is None:
+        artifact_dir = compile_source(language, code, timeout, optimization=optimization)
+
+    def measure(input_data, warmup, repetitions, timeout):
+        times = []
+        deadline = time.monotonic() + timeout
+        for run in range(warmup + repetitions):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise BudgetExceeded()
+            if pool is not None:
+                # Timed inside the JVM.
+                result = execute_java_pooled(pool, code, remaining, input_data)
+                _check(result)
+                seconds = result["timings"]["run"] / 1000
+            else:
+                timer = metrics.PhaseTimer()
+                try:
+                    result = run_compiled(
+                        language, artifact_dir, remaining, input_data, timer=timer
+                    )
+                except subprocess.TimeoutExpired:
+                    raise BudgetExceeded()
+                _check(result)
+                seconds = timer.seconds["run"]
+            if run >= warmup:
+                times.append(seconds)
+        return times
+
+    return measure
+
+
+def _check(result):
+    if result.get("success"):
+        return
+    if result.get("limit_exceeded") == "cpu_time" or result.get(
+        "error", ""
+    ).startswith("Code execution timed out"):
+        # The run was given what was left of the budget.
+        raise BudgetExceeded()
+    raise ProgramFailed(result)
+
+
+def _ran_out(failure):
+    """Whether ``failure`` hit a resource limit or crashed the tracer worker."""
+    if isinstance(failure, worker_pool.WorkerCrashed):
+        return True
+    return bool(failure.result.get("limit_exceeded"))
+
+
+def analyze(code: str, language: str = "python", input_kind: str = "random",
+            min_size: int = 16, max_size: int = None, growth: float = 2.0,
+            repetitions: int = 5, warmup: int = 1, time_budget: float = None,
+            optimization: str = "O2", seed: int = 0) -> dict:
+    """
+    Measure how the run time of ``code`` grows with its input size.
+
+    ``max_size`` and ``time_budget`` can lower, but not raise,
+    ``ANALYSIS_MAX_SIZE`` and ``ANALYSIS_TIME_BUDGET``. C/C++ are built
+    at ``optimization``. The result has the ``measurements`` (per size n,
+    the times of the repetitions in ms and their median), the ``fits`` (see
+    ``fit()``), the most likely ``complexity`` and why the sizes ``stopped``:
+    "max_size", "time_budget" or "error". A size past the first that runs
+    into a resource limit or crashes counts as "time_budget"; the result is
+    only a ``success`` with a fit and no error.
+    """
+    language = language.lower()
+    if language != "python" and language not in COMPILED_LANGUAGES:
+        return _analysis_result(language, input_kind, f"Unsupported language: {language}")
+    max_size = min(max_size or conf.get("ANALYSIS_MAX_SIZE"), conf.get("ANALYSIS_MAX_SIZE"))
+    budget = conf.get("ANALYSIS_TIME_BUDGET")
+    budget = min(time_budget or budget, budget)
+    start = time.monotonic()
+    deadline = start + budget
+
+    try:
+        if language == "python":
+            measure = _python_runner(code)
+        else:
+            measure = _compiled_runner(language, code, optimization, budget)
+    except compile_cache.CompilationFailed as e:
+        return _analysis_result(language, input_kind, f"Compilation error:\n{e.stderr}")
+    except subprocess.TimeoutExpired:
+        return _analysis_result(
+            language, input_kind, "Compilation did not finish within the time budget."
+        )
+    except Exception as e:
+        return _analysis_result(language, input_kind, f"Execution error: {str(e)}")
+
+    measurements = []
+    stopped, error = "max_size", ""
+    for n in input_sizes(min_size, max_size, growth):
+        remaining = deadline - time.monotonic()
+        if measurements:
+            # Skip a size that would not finish, guessing its times grow
+            # as they did from the size before.
+            last = measurements[-1]["median_ms"]
+            ratio = last / measurements[-2]["median_ms"] if len(measurements) > 1 else growth
+            if (warmup + repetitions) * last / 1000 * max(ratio, 1.0) > remaining:
+                stopped = "time_budget"
+                break
+        if remaining <= 0:
+            stopped = "time_budget"
+            break
+        try:
+            times = measure(generate_input(input_kind, n, seed), warmup, repetitions, remaining)
+        except BudgetExceeded:
+            stopped = "time_budget"
+            break
+        except (ProgramFailed, worker_pool.WorkerCrashed) as e:
+            if measurements and _ran_out(e):
+                # It ran on the smaller sizes, so this one is too large.
+                stopped = "time_budget"
+            else:
+                detail = e.result.get("error", "") if isinstance(e, ProgramFailed) else e
+                stopped, error = "error", f"n={n}: {detail}"
+            break
+        except Exception as e:
+            stopped, error = "error", f"Execution error: {str(e)}"
+            break
+        measurements.append({
+            "n": n,
+            "times_ms": [round(t * 1000, 4) for t in times],
+            "median_ms": max(statistics.median(times) * 1000, 1e-6),
+        })
+
+    fits = []
+    if len(measurements) >= MIN_FIT_SIZES:
+        fits = fit(
+            [m["n"] for m in measurements],
+            [m["median_ms"] / 1000 for m in measurements],
+        )
+    elif not error:
+        error = (
+            f"Only {len(measurements)} input sizes ran within the time budget; "
+            f"at least {MIN_FIT_SIZES} are needed to fit a complexity class."
+        )
+    for m in measurements:
+        m["median_ms"] = round(m["median_ms"], 4)
+    return _analysis_result(
+        language, input_kind, error, measurements, fits, stopped,
+        int((time.monotonic() - start) * 1000),
+    )
+
+
+def _analysis_result(language, input_kind, error, measurements=(), fits=(),
+                     stopped="error", elapsed_ms=0):
+    return {
+        "success": bool(fits) and stopped != "error",
+        "error": error,
+        "language": language,
+        "input_kind": input_kind,
+        "measurements": list(measurements),
+        "fits": list(fits),
+        "complexity": fits[0]["complexity"] if fits else None,
+        "stopped": stopped,
+        "elapsed_ms": elapsed_ms,
+    }
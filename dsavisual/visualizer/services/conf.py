@@ -0,0 +1,149 @@
+"""
+Executor settings.
+
+Every value can be overridden from the ``CODE_EXECUTION`` dict in the Django
+settings module, e.g. ``CODE_EXECUTION = {"PYTHON_POOL_SIZE": 8}``.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+DEFAULTS = {
+    # Warm Python tracer workers kept alive between requests (0 disables).
+    "PYTHON_POOL_SIZE": 4,
+    # Jobs a worker serves before it is replaced by a fresh interpreter.
+    "PYTHON_POOL_MAX_JOBS": 100,
+    # Start the pool when Django starts instead of on the first request:
+    # True under runserver and WSGI/ASGI servers (gunicorn, uvicorn...),
+    # "always" in every process that loads the project (e.g. other
+    # servers), False never.
+    "PYTHON_POOL_WARM_UP": True,
+    # Warm JVMs compiling and running Java in-process (0 disables; Java
+    # then runs through javac and java). Each holds a heap of up to
+    # LIMIT_MEMORY_BYTES.
+    "JAVA_POOL_SIZE": 1,
+    "JAVA_POOL_MAX_JOBS": 50,
+    # Start the JVMs (in the background) when Django starts; same values.
+    "JAVA_POOL_WARM_UP": True,
+    # Directory for compiled C/C++/Java artifacts (None: system temp dir).
+    "COMPILE_CACHE_DIR": None,
+    # Total size the compile cache may use before evicting old entries.
+    "COMPILE_CACHE_MAX_BYTES": 256 * 1024 * 1024,
+    # Scratch directory compilers run in (None: /dev/shm when writable, a
+    # tmpfs on Linux, else the compile cache directory).
+    "COMPILE_WORK_DIR": None,
+    # Directory for precompiled C/C++ headers (None: system temp dir).
+    "PCH_CACHE_DIR": None,
+    "PCH_CACHE_MAX_BYTES": 512 * 1024 * 1024,
+    # Compiles of a program's include set before a PCH is built for it.
+    "PCH_MIN_USES": 2,
+    "PCH_BUILD_TIMEOUT": 120,
+    # Threads running queued jobs submitted to /api/jobs/.
+    "JOB_WORKERS": 4,
+    # Jobs waiting to start before new submissions get 429.
+    "JOB_QUEUE_SIZE": 100,
+    # Maximum jobs running at once per language.
+    "JOB_LANGUAGE_LIMITS": {"python": 4, "c": 2, "cpp": 2, "java": 1},
+    # Seconds a finished job's result stays available for polling.
+    "JOB_RESULT_TTL": 300,
+    # Executions in flight at once per event loop on the async endpoint.
+    "ASYNC_MAX_CONCURRENCY": 100,
+    # Upper bounds on a recorded Python trace; past them recording stops
+    # and the result carries a "truncated" marker.
+    "TRACE_MAX_STEPS": 20000,
+    "TRACE_MAX_BYTES": 16 * 1024 * 1024,
+    # Items kept per list/dict in a snapshot before it is cut short.
+    "TRACE_MAX_ITEMS": 1000,
+    # User objects (list nodes, tree nodes...) encoded per step; the rest
+    # are shown by their repr.
+    "TRACE_MAX_NODES": 1000,
+    # Caps for traces stored server-side and fetched page by page.
+    "TRACE_PAGED_MAX_STEPS": 1_000_000,
+    "TRACE_PAGED_MAX_BYTES": 512 * 1024 * 1024,
+    # Seconds a paged execution may run (recording long traces is slow).
+    "TRACE_PAGED_TIMEOUT": 30,
+    # Directory for stored traces (None: system temp dir).
+    "TRACE_STORE_DIR": None,
+    # Seconds a stored trace stays available.
+    "TRACE_STORE_TTL": 3600,
+    # Disk space all stored traces may use; the oldest are deleted first.
+    "TRACE_STORE_MAX_BYTES": 2 * 1024 * 1024 * 1024,
+    # Steps between the checkpoints that make any page cheap to start.
+    "TRACE_SEGMENT_STEPS": 1000,
+    # Most steps served by one /api/traces/<id>/steps/ request.
+    "TRACE_PAGE_MAX_STEPS": 1000,
+    # Watched lines a traced Python program may run, recorded or not; past
+    # this it is stopped with "limit_exceeded": "steps".
+    "TRACE_MAX_LINES": 5_000_000,
+    "TRACE_PAGED_MAX_LINES": 50_000_000,
+    # Python tracing hook: "settrace", "monitoring" (sys.monitoring, 3.12+)
+    # or "auto" for monitoring where the interpreter supports it.
+    "TRACE_BACKEND": "auto",
+    # C/C++ line tracing: "gdb" (lines and locals), "instrument" (lines
+    # only, close to full speed) or "auto" for gdb where it is installed.
+    "NATIVE_TRACE_BACKEND": "auto",
+    # Inputs one batch execution (input_cases) may run the code on, the
+    # steps recorded per input, and the seconds the whole batch may take.
+    "BATCH_MAX_CASES": 50,
+    "BATCH_CASE_MAX_STEPS": 1000,
+    "BATCH_TIMEOUT": 60,
+    # Seconds a complexity analysis (/api/analyze/) may run at most, and
+    # the largest input size it may generate.
+    "ANALYSIS_TIME_BUDGET": 10,
+    "ANALYSIS_MAX_SIZE": 1 << 20,
+    # Comparisons, swaps and writes logged by a run in "count" mode; past
+    # this they are only counted.
+    "COUNT_MAX_EVENTS": 500_000,
+    # Microseconds between call-stack samples in "sample" mode (Python's
+    # timer signal, or perf's sampling frequency for C/C++), the frames
+    # walked per Python sample, and the share of the run time Python
+    # sampling may take before its interval is doubled.
+    "SAMPLE_INTERVAL_US": 1000,
+    "SAMPLE_MAX_DEPTH": 256,
+    "SAMPLE_MAX_OVERHEAD": 0.05,
+    # Resource limits for every sandboxed program (see services/sandbox.py);
+    # None disables one. CPU seconds default to 80% of the wall-clock
+    # timeout, so busy loops stop with "limit_exceeded" before timing out.
+    "LIMIT_CPU_SECONDS": None,
+    # Address space, except for Java, which gets the same as -Xmx.
+    "LIMIT_MEMORY_BYTES": 512 * 1024 * 1024,
+    # RLIMIT_NPROC counts every process and thread of the user the server
+    # runs as, so this must leave room for the server itself (root is
+    # exempt).
+    "LIMIT_PROCESSES": 1024,
+    # Largest file a program may write.
+    "LIMIT_FILE_BYTES": 16 * 1024 * 1024,
+    # Bytes of stdout and of stderr kept per execution; a program printing
+    # more is stopped and its result has "output_truncated".
+    "OUTPUT_MAX_BYTES": 1024 * 1024,
+    # Where results of deterministic programs are cached: "locmem", "file",
+    # "django", a dotted path to a backend class, or None to disable.
+    "RESULT_CACHE_BACKEND": "locmem",
+    # Seconds a cached result stays valid (since last use for "file").
+    "RESULT_CACHE_TTL": 3600,
+    # Bounds for the "locmem" and "file" backends; least recently used
+    # entries are evicted first.
+    "RESULT_CACHE_MAX_ENTRIES": 1000,
+    "RESULT_CACHE_MAX_BYTES": 64 * 1024 * 1024,
+    # Directory for "file" (None: system temp dir) or cache alias for
+    # "django" (None: "default").
+    "RESULT_CACHE_LOCATION": None,
+    # Recompute precomputed concept traces on the job queue whenever a final
+    # snippet or a default input is saved.
+    "PRECOMPUTE_ON_SAVE": True,
+    # Content codings for API responses, most preferred first; those whose
+    # library is missing ("zstd": zstandard, "br": brotli) are skipped.
+    "COMPRESSION_CODINGS": ["zstd", "br", "gzip"],
+    # Responses smaller than this are sent uncompressed.
+    "COMPRESSION_MIN_BYTES": 1024,
+    # Client addresses allowed to read /api/metrics/ (None: everyone).
+    "METRICS_ALLOWED_IPS": ["127.0.0.1", "::1"],
+}
+
+
+def get(name):
+    """Return the configured value for ``name``, falling back to the default."""
+    try:
+        overrides = getattr(settings, "CODE_EXECUTION", {})
+    except ImproperlyConfigured:
+        overrides = {}
+    return overrides.get(name, DEFAULTS[name])
@@ -1,355 +1,914 @@
 import json
 import subprocess
 import sys
-import textwrap
 import tempfile
+import time
 import os
 
+from . import (
+    compile_cache, conf, flamegraph, java_runner, metrics, native_profiler,
+    native_tracer, pch, process, sandbox, tracer, worker_pool,
+)
+
+# Bump whenever the shape or content of execution results changes, so that
+# results cached by earlier versions are no longer served.
+EXECUTOR_VERSION = 11
+
+# Per-language compiler settings for the compiled runners.
+COMPILED_LANGUAGES = {
+    "c": {"source": "main.c", "compiler": "gcc", "flags": ["-pipe"]},
+    "cpp": {"source": "main.cpp", "compiler": "g++", "flags": ["-std=c++17", "-pipe"]},
+    "java": {"source": "Main.java", "compiler": "javac", "flags": []},
+}
+
+# C/C++ optimization levels: -O0 compiles fastest, -O2 for timing programs.
+OPTIMIZATION_LEVELS = {"O0": "-O0", "O2": "-O2"}
+
+# What a run records: "trace" its steps, or for Python only, "count" the
+# array operations it makes (see ``tracer.OperationCounter``) or "profile"
+# the hits and time of each line (see ``tracer.LineProfiler``); or for
+# Python, C and C++, "sample" its call stacks (see ``flamegraph``).
+EXECUTION_MODES = ("trace", "count", "profile", "sample")
+
+
+def timeout_result(timeout: int) -> dict:
+    return {
+        "success": False,
+        "output": "",
+        "error": f"Code execution timed out ({timeout} second limit).",
+        "steps": [],
+        "execution_time_ms": timeout * 1000,
+    }
+
+
+def error_result(error: str) -> dict:
+    return {
+        "success": False,
+        "output": "",
+        "error": error,
+        "steps": [],
+        "execution_time_ms": 0,
+    }
+
+
+def mode_error(mode: str, language: str) -> str:
+    """Why ``language`` cannot run in ``mode``, or ``""`` if it can."""
+    language = language.lower()
+    if mode not in EXECUTION_MODES:
+        return f"Unsupported mode: {mode}"
+    if mode == "sample" and language in ("c", "cpp"):
+        if not native_profiler.available():
+            return "Sampling C/C++ programs needs perf, which is not installed."
+        return ""
+    if mode == "sample" and language != "python":
+        return "The sample mode is only supported for Python, C and C++."
+    if mode != "trace" and language != "python":
+        return f"The {mode} mode is only supported for Python."
+    return ""
+
+
+def is_transient(result: dict) -> bool:
+    """Whether ``result`` reflects a timeout or executor failure, not the program."""
+    # CPU time, like wall time, depends on how loaded the machine was.
+    return result.get("limit_exceeded") == "cpu_time" or result.get(
+        "error", ""
+    ).startswith(("Code execution timed out", "Execution error:")) or any(
+        is_transient(case) for case in result.get("cases", ())
+    )
+
+
+def python_job(code: str, input_data=None, trace_mode: str = "full",
+               max_steps: int = None, watch: dict = None,
+               paged: bool = False, cpu_seconds: int = None,
+               cases: list = None, mode: str = "trace") -> dict:
+    """
+    The JSON job understood by ``tracer.py``.
+
+    ``max_steps`` can lower, but not raise, the configured trace step cap.
+    ``watch`` limits tracing to some variables, functions, line ranges
+    and/or every Nth step (see ``tracer.StepRecorder``). ``paged`` traces
+    are stored on disk rather than held in memory (see ``trace_store``) and
+    get the higher ``TRACE_PAGED_*`` caps. ``cpu_seconds`` is the CPU budget
+    a pool worker sets for the job (one-shot tracers get theirs as an
+    rlimit, see ``sandbox``); the program is stopped once it prints more
+    than ``OUTPUT_MAX_BYTES`` to stdout or stderr.
+
+    With ``cases``, a list of inputs, the job is a batch run once per case
+    (see ``tracer.run_batch``); each case gets the ``BATCH_CASE_MAX_STEPS``
+    step cap, its share of ``TRACE_MAX_BYTES`` and ``cpu_seconds``.
+    ``mode="count"`` records operation counts instead of steps, with up to
+    ``COUNT_MAX_EVENTS`` logged operations, ``mode="profile"`` a line
+    profile and ``mode="sample"`` call-stack samples (``SAMPLE_*``).
+    """
+    prefix = "TRACE_PAGED_" if paged else "TRACE_"
+    step_cap = conf.get("BATCH_CASE_MAX_STEPS" if cases else prefix + "MAX_STEPS")
+    max_bytes = conf.get(prefix + "MAX_BYTES")
+    job = {
+        "code": code,
+        "input_data": input_data or [],
+        "trace": {
+            "mode": trace_mode,
+            "max_steps": min(max_steps or step_cap, step_cap),
+            "max_bytes": max_bytes // len(cases) if cases and max_bytes else max_bytes,
+            "max_items": conf.get("TRACE_MAX_ITEMS"),
+            "max_nodes": conf.get("TRACE_MAX_NODES"),
+            "max_lines": conf.get(prefix + "MAX_LINES"),
+            "watch": watch,
+            "backend": conf.get("TRACE_BACKEND"),
+            "max_events": conf.get("COUNT_MAX_EVENTS"),
+        },
+        "limits": {
+            "cpu_seconds": cpu_seconds,
+            "output_bytes": conf.get("OUTPUT_MAX_BYTES"),
+        },
+    }
+    if cases:
+        job["cases"] = cases
+    if mode != "trace":
+        job["mode"] = mode
+    if mode == "sample":
+        job["trace"]["sampling"] = {
+            "interval_us": conf.get("SAMPLE_INTERVAL_US"),
+            "max_depth": conf.get("SAMPLE_MAX_DEPTH"),
+            "max_overhead": conf.get("SAMPLE_MAX_OVERHEAD"),
+        }
+    return job
 
-def execute_python_code(code: str, input_data=None, timeout: int = 5) -> dict:
-    """
-    Execute user-submitted Python code in a subprocess with timeout.
-    """
-    tracer_code = textwrap.dedent(f"""\
-        import sys, json, time
-
-        _trace_steps = []
-        _input_data = {json.dumps(input_data or [])}
-
-        def _to_jsonable(value, depth=0):
-            if depth > 3:
-                return repr(value)
-            if isinstance(value, (str, int, float, bool)) or value is None:
-                return value
-            if isinstance(value, (list, tuple)):
-                return [_to_jsonable(item, depth + 1) for item in value]
-            if isinstance(value, dict):
-                return {{
-                    str(k): _to_jsonable(v, depth + 1)
-                    for k, v in value.items()
-                }}
-            return repr(value)
-
-        def _tracer(frame, event, arg):
-            if event == 'line' and frame.f_code.co_filename == '<user_code>':
-                local_vars = {{
-                    k: _to_jsonable(v) for k, v in frame.f_locals.items()
-                    if not k.startswith('_')
-                }}
-                _trace_steps.append({{
-                    "line": frame.f_lineno,
-                    "locals": local_vars,
-                }})
-            return _tracer
-
-        _start = time.perf_counter_ns()
-        try:
-            _code = compile(
-                {repr(code)},
-                '<user_code>',
-                'exec'
-            )
-            sys.settrace(_tracer)
-            exec(_code)
-            sys.settrace(None)
-            _elapsed = (time.perf_counter_ns() - _start) // 1_000_000
-            print("__TRACE__" + json.dumps({{
-                "success": True,
-                "steps": _trace_steps,
-                "execution_time_ms": _elapsed,
-            }}))
-        except Exception as e:
-            sys.settrace(None)
-            _elapsed = (time.perf_counter_ns() - _start) // 1_000_000
-            print("__TRACE__" + json.dumps({{
-                "success": False,
-                "error": str(e),
-                "steps": _trace_steps,
-                "execution_time_ms": _elapsed,
-            }}))
-    """)
 
-    try:
-        with tempfile.NamedTemporaryFile(
-            mode="w", suffix=".py", delete=False
-        ) as f:
-            f.write(tracer_code)
-            tmp_path = f.name
-
-        result = subprocess.run(
-            [sys.executable, tmp_path],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
+def _python_result(trace_data: dict, output: str, stderr: str,
+                   timer: metrics.PhaseTimer = None) -> dict:
+    """
+    Build an execution result (without ``steps``) from a tracer payload.
 
-        stdout = result.stdout
-        stderr = result.stderr
+    ``timings`` combines the phases measured in the sandbox with those in
+    ``timer``.
+    """
+    result = {
+        "success": trace_data.get("success", False),
+        "output": output.strip(),
+        "error": trace_data.get("error", "") or stderr.strip(),
+        "execution_time_ms": trace_data.get("execution_time_ms", 0),
+    }
+    if trace_data.get("truncated"):
+        result["truncated"] = trace_data["truncated"]
+    if trace_data.get("limit_exceeded"):
+        result["limit_exceeded"] = trace_data["limit_exceeded"]
+    if trace_data.get("output_truncated"):
+        result["output_truncated"] = True
+    if "operations" in trace_data:
+        result["operations"] = trace_data["operations"]
+    if "profile" in trace_data:
+        result["profile"] = trace_data["profile"]
+    if "stack_samples" in trace_data:
+        result["flamegraph"] = flamegraph.render(trace_data["stack_samples"], "python")
+    if timer is not None:
+        result["timings"] = timer.as_dict(trace_data.get("timings"))
+    return result
+
+
+def output_limit_payload(payload: dict) -> dict:
+    """``payload`` of a tracer killed for printing past ``OUTPUT_MAX_BYTES``."""
+    return {
+        **payload,
+        "success": False,
+        "error": sandbox.limit_error("output"),
+        "limit_exceeded": "output",
+        "output_truncated": True,
+    }
+
+
+def _result_event(result: dict) -> dict:
+    data = {k: v for k, v in result.items() if k != "steps"}
+    return {"event": "result", "data": data}
+
+
+def split_tracer_stdout(stdout: str):
+    """
+    Separate ``__TRACE__`` event lines from user output.
 
-        trace_data = {"success": False, "steps": [], "execution_time_ms": 0}
-        output_lines = []
+    Only needed where the tracer cannot be given its own event descriptor
+    (see ``process.CHANNEL_SUPPORTED``).
+    """
+    events, output_lines = [], []
+    for line in stdout.split("\n"):
+        if line.startswith(tracer.EVENT_PREFIX + "{"):
+            events.append(line[len(tracer.EVENT_PREFIX):])
+        else:
+            output_lines.append(line)
+    return events, "\n".join(output_lines)
+
+
+def python_result_from_events(event_lines, output: str, stderr: str,
+                              timer: metrics.PhaseTimer = None,
+                              output_truncated: bool = False) -> dict:
+    """
+    Assemble a complete result from a finished one-shot tracer run.
 
-        for line in stdout.split("\n"):
-            if line.startswith("__TRACE__"):
-                trace_data = json.loads(line[len("__TRACE__"):])
+    ``output_truncated`` means the run was killed for printing too much.
+    """
+    timer = timer or metrics.PhaseTimer()
+    steps, payload = [], {}
+    with timer.phase("parse"):
+        for line in event_lines:
+            event = json.loads(line)
+            if event["event"] == "step":
+                steps.append(event["data"])
             else:
-                output_lines.append(line)
+                payload = event["data"]
+    if output_truncated:
+        payload = output_limit_payload(payload)
+    result = _python_result(payload, output, stderr, timer)
+    result["steps"] = steps
+    return result
 
-        user_output = "\n".join(output_lines).strip()
 
-        return {
-            "success": trace_data.get("success", False),
-            "output": user_output,
-            "error": trace_data.get("error", "") or stderr.strip(),
-            "steps": trace_data.get("steps", []),
-            "execution_time_ms": trace_data.get("execution_time_ms", 0),
-        }
+def python_batch_from_events(event_lines, output: str, stderr: str,
+                             timer: metrics.PhaseTimer = None,
+                             output_truncated: bool = False):
+    """
+    ``(cases, result)`` of a one-shot tracer run of a batch job.
 
-    except subprocess.TimeoutExpired:
-        return {
-            "success": False,
-            "output": "",
-            "error": "Code execution timed out (5 second limit).",
-            "steps": [],
-            "execution_time_ms": 5000,
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "output": "",
-            "error": f"Execution error: {str(e)}",
-            "steps": [],
-            "execution_time_ms": 0,
-        }
+    ``cases`` are the results of the cases whose events are in
+    ``event_lines``; ``result`` is that of the whole batch, see
+    ``python_result_from_events``.
+    """
+    timer = timer or metrics.PhaseTimer()
+    cases, payload = [], {}
+    with timer.phase("parse"):
+        for line in event_lines:
+            event = json.loads(line)
+            if event["event"] == "case":
+                cases.append(_case_event(event["data"])["data"])
+            else:
+                payload = event["data"]
+    if output_truncated:
+        payload = output_limit_payload(payload)
+    return cases, _python_result(payload, output, stderr, timer)
+
+
+def _case_event(data: dict) -> dict:
+    """The ``case`` event for a batch case's tracer payload."""
+    result = _python_result(
+        data, data.get("output", ""), data.get("stderr", ""), metrics.PhaseTimer()
+    )
+    result["steps"] = data.get("steps", [])
+    return {"event": "case", "data": {"index": data["index"], **result}}
+
+
+def _stream_pooled(pool, job: dict, timeout: int):
+    timer = metrics.PhaseTimer()
+    for event in pool.stream(job, timeout, timer):
+        if event["event"] == "result":
+            data = event["data"]
+            event = _result_event(_python_result(
+                data, data.get("output", ""), data.get("stderr", ""), timer
+            ))
+        elif event["event"] == "case":
+            event = _case_event(event["data"])
+        yield event
+
+
+def _stream_cold(job: dict, timeout: int):
+    timer = metrics.PhaseTimer()
+    with timer.phase("write"):
+        job_data = json.dumps(job).encode("utf-8")
+    child = process.TracedProcess(
+        [sys.executable, worker_pool.TRACER_PATH],
+        job_data,
+        event_prefix=tracer.EVENT_PREFIX,
+        preexec_fn=sandbox.preexec("python", sandbox.cpu_seconds(timeout)),
+        output_limit=job["limits"]["output_bytes"],
+        env=sandbox.python_env(),
+    )
+    deadline = time.monotonic() + timeout
+    try:
+        payload = {}
+        for line in child.events(deadline):
+            start = time.perf_counter()
+            event = json.loads(line)
+            timer.add("parse", time.perf_counter() - start)
+            if event["event"] == "result":
+                payload = event["data"]
+            elif event["event"] == "case":
+                yield _case_event(event["data"])
+            else:
+                yield event
+        _, stdout, stderr = child.finish(deadline)
+        if child.output_truncated:
+            payload = output_limit_payload(payload)
     finally:
-        try:
-            os.unlink(tmp_path)
-        except OSError:
-            pass
+        child.kill()
+    timer.add("spawn", child.spawn_seconds)
+    timer.add("write", child.write_seconds)
+    yield _result_event(_python_result(payload, stdout, stderr, timer))
 
 
-def execute_c_code(code: str, timeout: int = 5) -> dict:
-    """Execute C code using gcc."""
+def stream_python_job(job: dict, timeout: int):
+    """
+    Run a ``python_job`` on a warm worker, or a fresh tracer without a pool.
+
+    Yields its events, ending with the ``result`` one.
+    """
+    pool = worker_pool.get_pool()
+    if pool is not None:
+        yield from _stream_pooled(pool, job, timeout)
+    else:
+        yield from _stream_cold(job, timeout)
+
+
+def stream_python_code(code: str, input_data=None, timeout: int = 5,
+                       trace_mode: str = "full", max_steps: int = None,
+                       watch: dict = None, paged: bool = False, mode: str = "trace"):
+    """
+    Run Python code under the tracer, yielding trace events as they arrive.
+
+    Yields ``{"event": "step", "data": step}`` for every recorded step and
+    finally one ``{"event": "result", "data": result}``, where ``result``
+    has the keys of an ``execute_python_code`` result except ``steps``.
+    Closing the generator early kills the running program.
+    """
+    job = python_job(
+        code, input_data, trace_mode, max_steps, watch, paged,
+        sandbox.cpu_seconds(timeout), mode=mode,
+    )
     try:
-        # Create temp C file
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".c", delete=False) as f:
+        yield from stream_python_job(job, timeout)
+    except (worker_pool.WorkerTimeout, subprocess.TimeoutExpired):
+        yield _result_event(timeout_result(timeout))
+    except Exception as e:
+        yield _result_event(error_result(f"Execution error: {str(e)}"))
+
+
+def execute_python_code(code: str, input_data=None, timeout: int = 5,
+                        trace_mode: str = "full", max_steps: int = None,
+                        watch: dict = None, mode: str = "trace") -> dict:
+    """
+    Execute user-submitted Python code under the tracer with a timeout.
+
+    Jobs go to a warm worker from the pool when pooling is enabled and fall
+    back to a fresh interpreter otherwise. ``trace_mode="delta"`` records
+    only the locals that change between steps (see ``tracer.StepRecorder``).
+    ``mode="count"`` records no steps but the result's ``operations``,
+    ``mode="profile"`` its ``profile`` and ``mode="sample"`` its
+    ``flamegraph``.
+    """
+    steps, result = [], {}
+    for event in stream_python_code(
+        code, input_data, timeout, trace_mode, max_steps, watch, mode=mode
+    ):
+        if event["event"] == "step":
+            steps.append(event["data"])
+        else:
+            result = event["data"]
+    result["steps"] = steps
+    return result
+
+
+def compile_source(language: str, code: str, timeout: int,
+                   timer: metrics.PhaseTimer = None,
+                   optimization: str = "O0", tracing=None) -> str:
+    """
+    Compile ``code`` through the compile cache and return the artifact dir.
+
+    Raises ``CompilationFailed`` with the compiler diagnostics on error.
+    ``timer`` gets the time spent writing the source and compiling (or
+    finding the cached build). C/C++ get the ``optimization`` level and a
+    precompiled header for their includes when one is ready (see ``pch``),
+    or with a ``native_tracer`` backend as ``tracing``, a traced build
+    (``native_profiler.PerfSampler`` builds keep the optimization level).
+    """
+    spec = COMPILED_LANGUAGES[language]
+    compiler, flags = spec["compiler"], spec["flags"]
+    traced = ()
+    if tracing is not None:
+        flags = [*flags, *tracing.compile_flags(language)]
+        traced = (tracing.name, tracing.identity())
+        if tracing.optimized:
+            flags.append(OPTIMIZATION_LEVELS[optimization])
+    elif language in pch.HEADER_TYPES:
+        flags = [*flags, OPTIMIZATION_LEVELS[optimization]]
+    cache = compile_cache.get_cache()
+    key = cache.make_key(
+        language, compile_cache.compiler_identity(compiler), *flags, *traced, code
+    )
+    write_seconds = 0.0
+
+    def build(workdir):
+        nonlocal write_seconds
+        start = time.perf_counter()
+        with open(os.path.join(workdir, spec["source"]), "w") as f:
             f.write(code)
-            c_file = f.name
-
-        # Compile
-        exe_file = c_file.replace('.c', '')
-        compile_result = subprocess.run(
-            ['gcc', c_file, '-o', exe_file],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
+        write_seconds = time.perf_counter() - start
+        header = None
+        if language == "java":
+            command = [compiler, *flags, spec["source"]]
+        else:
+            command = [compiler, spec["source"], "-o", "main", *flags]
+            if tracing is not None:
+                command += tracing.link_inputs(workdir, timeout)
+            header = pch.header_for(language, compiler, flags, code)
+
+        def run(command):
+            return subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+                cwd=workdir,
+                env=compile_cache.compiler_env(workdir),
+            )
+
+        if header is None:
+            result = run(command)
+        else:
+            result = run([*command, "-include", header])
+            if result.returncode != 0 and not os.path.exists(header):
+                # The PCH was evicted while in use.
+                result = run(command)
+        if result.returncode != 0:
+            raise compile_cache.CompilationFailed(result.stderr)
+        if tracing is not None:
+            tracing.after_build(workdir, spec["source"])
+
+    start = time.perf_counter()
+    try:
+        artifact_dir, _ = cache.get_or_build(key, build)
+    finally:
+        if timer is not None:
+            timer.add("write", write_seconds)
+            timer.add("compile", time.perf_counter() - start - write_seconds)
+    return artifact_dir
+
+
+def compilation_error_result(error: compile_cache.CompilationFailed,
+                             timer: metrics.PhaseTimer = None) -> dict:
+    result = error_result(f"Compilation error:\n{error.stderr}")
+    if timer is not None:
+        result["timings"] = timer.as_dict()
+    return result
+
+
+def run_command(language: str, artifact_dir: str) -> list:
+    """Command line that runs a build produced by ``compile_source``."""
+    if language == "java":
+        return ["java", *sandbox.java_options(), "-cp", artifact_dir, "Main"]
+    return [os.path.join(artifact_dir, "main")]
+
+
+def program_input(input_data) -> str:
+    """
+    ``input_data`` as the stdin text of a compiled program.
+
+    A string is passed as is. A list gives a line per item, with the items
+    of a nested list separated by spaces: ``[3, [5, 1, 4]]`` is read as
+    ``"3\n5 1 4\n"``, as is ``{"n": 3, "array": [5, 1, 4]}``, a dict being
+    read like the list of its values. Anything else is written as JSON.
+    """
+    def token(value):
+        return value if isinstance(value, str) else json.dumps(value)
+
+    if input_data is None:
+        return ""
+    if isinstance(input_data, str):
+        return input_data
+    if isinstance(input_data, dict):
+        input_data = list(input_data.values())
+    if isinstance(input_data, list):
+        return "".join(
+            (" ".join(map(token, item)) if isinstance(item, list) else token(item))
+            + "\n"
+            for item in input_data
         )
+    return json.dumps(input_data) + "\n"
 
-        if compile_result.returncode != 0:
-            return {
-                "success": False,
-                "output": "",
-                "error": f"Compilation error:\n{compile_result.stderr}",
-                "steps": [],
-                "execution_time_ms": 0,
-            }
 
-        # Run
-        run_result = subprocess.run(
-            [exe_file],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
+def run_program(command: list, timeout: int, cwd: str = None,
+                timer: metrics.PhaseTimer = None, preexec_fn=None, env: dict = None,
+                stdin: bytes = b""):
+    """
+    Run a compiled program to completion.
+
+    Returns ``(returncode, stdout, stderr, output_truncated)``; a program
+    printing more than ``OUTPUT_MAX_BYTES`` to either stream is killed.
+    Starting the process and running it are timed as separate phases.
+    ``preexec_fn`` (see ``sandbox.preexec``) applies the resource limits;
+    ``env`` is added to the server's environment. ``stdin`` is the
+    program's input.
+    """
+    timer = timer or metrics.PhaseTimer()
+    with timer.phase("spawn"):
+        child = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            preexec_fn=preexec_fn,
+            env={**os.environ, **env} if env else None,
         )
+    with timer.phase("run"):
+        stdout, stderr, truncated = process.communicate(
+            child, timeout, conf.get("OUTPUT_MAX_BYTES"), stdin
+        )
+    return child.returncode, stdout, stderr, truncated
+
+
+def compiled_result(returncode: int, stdout: str, stderr: str,
+                    timer: metrics.PhaseTimer = None,
+                    output_truncated: bool = False) -> dict:
+    stderr, allocation_failed = sandbox.split_allocation_marker(stderr)
+    result = {
+        "success": returncode == 0,
+        "output": stdout.strip(),
+        "error": stderr.strip(),
+        "steps": [],
+        "execution_time_ms": 0,
+    }
+    if output_truncated:
+        result["output_truncated"] = True
+        limit = "output"
+    else:
+        limit = sandbox.limit_exceeded(returncode, stderr, allocation_failed)
+        killed = sandbox.signal_error(returncode)
+        if killed:
+            result["error"] = f"{result['error']}\n{killed}".strip()
+    if limit:
+        result["success"] = False
+        result["error"] = sandbox.limit_error(limit, result["error"])
+        result["limit_exceeded"] = limit
+    if timer is not None:
+        result["execution_time_ms"] = int(timer.seconds.get("run", 0) * 1000)
+        result["timings"] = timer.as_dict()
+    return result
+
+
+def native_step_cap(max_steps: int = None, batch: bool = False) -> int:
+    """
+    Steps a traced C/C++ run may record; ``max_steps`` can only lower it.
+
+    A ``batch`` case gets ``BATCH_CASE_MAX_STEPS``.
+    """
+    step_cap = conf.get("BATCH_CASE_MAX_STEPS" if batch else "TRACE_MAX_STEPS")
+    return min(max_steps or step_cap, step_cap)
 
-        return {
-            "success": run_result.returncode == 0,
-            "output": run_result.stdout.strip(),
-            "error": run_result.stderr.strip(),
-            "steps": [],
-            "execution_time_ms": 0,
-        }
 
+def run_compiled(language: str, artifact_dir: str, timeout: int,
+                 input_data=None, tracing=None, max_steps: int = None,
+                 timer: metrics.PhaseTimer = None) -> dict:
+    """
+    Run a build from ``compile_source`` once, with ``input_data`` on stdin.
+
+    ``tracing`` is the ``native_tracer`` backend the build was made for, if
+    any; the result then has up to ``max_steps`` line steps, or for a
+    ``native_profiler.PerfSampler``, a ``flamegraph``. Raises
+    ``subprocess.TimeoutExpired`` after ``timeout`` seconds.
+    """
+    timer = timer or metrics.PhaseTimer()
+    stdin = program_input(input_data).encode("utf-8")
+    with tempfile.TemporaryDirectory() as run_dir:
+        command = run_command(language, artifact_dir)
+        traced = None
+        if tracing is not None:
+            traced = tracing(
+                artifact_dir, COMPILED_LANGUAGES[language]["source"], run_dir,
+                max_steps, timeout,
+            )
+            command = traced.command(command)
+            stdin = traced.feed(stdin)
+        returncode, stdout, stderr, truncated = run_program(
+            command, timeout, run_dir, timer,
+            sandbox.preexec(language, sandbox.cpu_seconds(timeout)),
+            {**sandbox.native_env(language), **(traced.env() if traced else {})},
+            stdin,
+        )
+        if traced is not None:
+            with timer.phase("parse"):
+                returncode, stdout, stderr, truncated = traced.finish(
+                    returncode, stdout, stderr, truncated
+                )
+
+    result = compiled_result(returncode, stdout, stderr, timer, truncated)
+    if isinstance(traced, native_profiler.PerfSampler):
+        result["flamegraph"] = flamegraph.render(traced.profile, language)
+    elif traced is not None:
+        result["steps"] = traced.steps
+        result["trace_backend"] = traced.name
+        if traced.truncated:
+            # Shaped like the ``truncated`` of Python traces.
+            result["truncated"] = {
+                "reason": traced.truncated, "steps": len(traced.steps),
+            }
+    return result
+
+
+def native_backend(trace: bool = False, mode: str = "trace"):
+    """The ``native_tracer`` backend or sampler a C/C++ build runs with, if any."""
+    if mode == "sample":
+        return native_profiler.PerfSampler
+    return native_tracer.get_backend() if trace else None
+
+
+def _execute_compiled(language: str, code: str, timeout: int,
+                      optimization: str = "O0", trace: bool = False,
+                      max_steps: int = None, input_data=None,
+                      mode: str = "trace") -> dict:
+    """
+    Compile (or reuse a cached build of) ``code`` and run it.
+
+    With ``trace`` (C/C++), the result has the program's line steps, see
+    ``native_tracer``, and with ``mode="sample"`` its ``flamegraph``, see
+    ``native_profiler``.
+    """
+    timer = metrics.PhaseTimer()
+    tracing = native_backend(trace, mode)
+    try:
+        try:
+            artifact_dir = compile_source(
+                language, code, timeout, timer, optimization, tracing
+            )
+        except compile_cache.CompilationFailed as e:
+            return compilation_error_result(e, timer)
+        return run_compiled(
+            language, artifact_dir, timeout, input_data, tracing,
+            native_step_cap(max_steps), timer,
+        )
     except subprocess.TimeoutExpired:
-        return {
-            "success": False,
-            "output": "",
-            "error": "Code execution timed out (5 second limit).",
-            "steps": [],
-            "execution_time_ms": 5000,
-        }
+        return timeout_result(timeout)
     except Exception as e:
-        return {
-            "success": False,
-            "output": "",
-            "error": f"Execution error: {str(e)}",
-            "steps": [],
-            "execution_time_ms": 0,
-        }
-    finally:
-        try:
-            os.unlink(c_file)
-            if os.path.exists(exe_file):
-                os.unlink(exe_file)
-        except OSError:
-            pass
+        return error_result(f"Execution error: {str(e)}")
+
 
+def execute_c_code(code: str, timeout: int = 5, optimization: str = "O0",
+                   trace: bool = False, max_steps: int = None,
+                   input_data=None, mode: str = "trace") -> dict:
+    """Execute C code using gcc, optionally traced line by line or sampled."""
+    return _execute_compiled(
+        "c", code, timeout, optimization, trace, max_steps, input_data, mode
+    )
 
-def execute_cpp_code(code: str, timeout: int = 5) -> dict:
-    """Execute C++ code using g++."""
+
+def execute_cpp_code(code: str, timeout: int = 5, optimization: str = "O0",
+                     trace: bool = False, max_steps: int = None,
+                     input_data=None, mode: str = "trace") -> dict:
+    """Execute C++ code using g++, optionally traced line by line or sampled."""
+    return _execute_compiled(
+        "cpp", code, timeout, optimization, trace, max_steps, input_data, mode
+    )
+
+
+def execute_java_pooled(pool, code: str, timeout: int, input_data=None) -> dict:
+    """
+    Execute Java code on a warm JVM from ``pool`` (see ``java_runner``).
+
+    Falls back to ``javac`` and ``java`` if the JVM dies without answering.
+    """
+    timer = metrics.PhaseTimer()
+    job = {"code": code, "stdin": program_input(input_data)}
     try:
-        # Create temp CPP file
-        with tempfile.NamedTemporaryFile(mode="w", suffix=".cpp", delete=False) as f:
-            f.write(code)
-            cpp_file = f.name
-
-        # Compile
-        exe_file = cpp_file.replace('.cpp', '')
-        compile_result = subprocess.run(
-            ['g++', cpp_file, '-o', exe_file, '-std=c++17'],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
+        for event in pool.stream(job, timeout, timer):
+            answer = event["data"]
+    except worker_pool.WorkerTimeout:
+        return timeout_result(timeout)
+    except worker_pool.WorkerCrashed:
+        return _execute_compiled("java", code, timeout, input_data=input_data)
+    except Exception as e:
+        return error_result(f"Execution error: {str(e)}")
+    timer.add("compile", answer["compile_ms"] / 1000)
+    timer.add("run", answer["run_ms"] / 1000)
+    if answer["status"] == "compile_error":
+        return compilation_error_result(
+            compile_cache.CompilationFailed(answer["stderr"]), timer
         )
+    return compiled_result(
+        answer["returncode"], answer["stdout"], answer["stderr"], timer,
+        answer["output_truncated"],
+    )
 
-        if compile_result.returncode != 0:
-            return {
-                "success": False,
-                "output": "",
-                "error": f"Compilation error:\n{compile_result.stderr}",
-                "steps": [],
-                "execution_time_ms": 0,
-            }
 
-        # Run
-        run_result = subprocess.run(
-            [exe_file],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
+def execute_java_code(code: str, timeout: int = 5, input_data=None) -> dict:
+    """Execute Java code on a warm JVM, or using javac and java."""
+    pool = java_runner.get_pool()
+    if pool is not None:
+        return execute_java_pooled(pool, code, timeout, input_data)
+    return _execute_compiled("java", code, timeout, input_data=input_data)
 
-        return {
-            "success": run_result.returncode == 0,
-            "output": run_result.stdout.strip(),
-            "error": run_result.stderr.strip(),
-            "steps": [],
-            "execution_time_ms": 0,
-        }
 
-    except subprocess.TimeoutExpired:
-        return {
-            "success": False,
-            "output": "",
-            "error": "Code execution timed out (5 second limit).",
-            "steps": [],
-            "execution_time_ms": 5000,
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "output": "",
-            "error": f"Execution error: {str(e)}",
-            "steps": [],
-            "execution_time_ms": 0,
-        }
-    finally:
-        try:
-            os.unlink(cpp_file)
-            if os.path.exists(exe_file):
-                os.unlink(exe_file)
-        except OSError:
-            pass
+def batch_timeout(timeout: int, cases: int) -> int:
+    """Wall-clock limit of a batch: ``timeout`` per case, up to ``BATCH_TIMEOUT``."""
+    return min(timeout * cases, conf.get("BATCH_TIMEOUT"))
 
 
-def execute_java_code(code: str, timeout: int = 5) -> dict:
-    """Execute Java code using javac and java."""
+def _stream_compiled_batch(language: str, code: str, input_cases: list,
+                           timeout: int, deadline: float, optimization: str,
+                           trace: bool, max_steps: int, timer: metrics.PhaseTimer,
+                           mode: str = "trace"):
+    """Compile ``code`` once, then yield a ``case`` event per run of the build."""
+    tracing = native_backend(trace, mode)
+    pool = java_runner.get_pool() if language == "java" else None
+    if pool is None:
+        try:
+            artifact_dir = compile_source(
+                language, code, timeout, timer, optimization, tracing
+            )
+        except compile_cache.CompilationFailed as e:
+            yield _result_event(compilation_error_result(e, timer))
+            return
+    for index, input_data in enumerate(input_cases):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise subprocess.TimeoutExpired(code, remaining)
+        case_timeout = min(timeout, remaining)
+        case_timer = metrics.PhaseTimer()
+        if pool is not None:
+            # The JVMs keep compiled classes, so only the first case compiles.
+            result = execute_java_pooled(pool, code, case_timeout, input_data)
+            if result["error"].startswith("Compilation error"):
+                yield _result_event(result)
+                return
+        else:
+            try:
+                result = run_compiled(
+                    language, artifact_dir, case_timeout, input_data, tracing,
+                    native_step_cap(max_steps, batch=True), case_timer,
+                )
+            except subprocess.TimeoutExpired:
+                result = timeout_result(timeout)
+        for phase, seconds in case_timer.seconds.items():
+            timer.add(phase, seconds)
+        yield {"event": "case", "data": {"index": index, **result}}
+
+
+def stream_batch(code: str, language: str = 'python', input_cases: list = (),
+                 timeout: int = 5, trace_mode: str = "full", max_steps: int = None,
+                 watch: dict = None, optimization: str = "O0", trace: bool = False,
+                 mode: str = "trace"):
+    """
+    Run ``code`` once per input in ``input_cases``, yielding each case's result.
+
+    Yields ``{"event": "case", "data": result}`` per case as it finishes,
+    where ``result`` is what ``execute_code`` would return for that input
+    plus its ``index``, then one ``{"event": "result", "data": result}`` for
+    the whole batch, which succeeds if every case does. Python cases run
+    one after another in a single tracer (see ``tracer.run_batch``), and
+    C/C++/Java ones on a single build, so the batch pays for one process
+    start or compile. Each case may record ``BATCH_CASE_MAX_STEPS`` steps
+    (``max_steps`` can lower that) and take ``timeout`` seconds; the batch
+    is stopped after ``batch_timeout()``.
+    """
+    language = language.lower()
+    if optimization not in OPTIMIZATION_LEVELS:
+        yield _result_event(error_result(f"Unsupported optimization level: {optimization}"))
+        return
+    if language != 'python' and language not in COMPILED_LANGUAGES:
+        yield _result_event(error_result(f"Unsupported language: {language}"))
+        return
+    if mode_error(mode, language):
+        yield _result_event(error_result(mode_error(mode, language)))
+        return
+
+    total = batch_timeout(timeout, len(input_cases))
+    timer = metrics.PhaseTimer()
+    failed = 0
     try:
-        # Create temp directory for Java files
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Create Main.java file
-            java_file = os.path.join(tmpdir, "Main.java")
-            with open(java_file, "w") as f:
-                f.write(code)
-
-            # Compile
-            compile_result = subprocess.run(
-                ['javac', java_file],
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                cwd=tmpdir,
+        if language == 'python':
+            job = python_job(
+                code, None, trace_mode, max_steps, watch,
+                cpu_seconds=sandbox.cpu_seconds(timeout), cases=input_cases,
+                mode=mode,
             )
-
-            if compile_result.returncode != 0:
-                return {
-                    "success": False,
-                    "output": "",
-                    "error": f"Compilation error:\n{compile_result.stderr}",
-                    "steps": [],
-                    "execution_time_ms": 0,
-                }
-
-            # Run
-            run_result = subprocess.run(
-                ['java', 'Main'],
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                cwd=tmpdir,
+            events = stream_python_job(job, total)
+        else:
+            events = _stream_compiled_batch(
+                language, code, input_cases, timeout, time.monotonic() + total,
+                optimization, trace, max_steps, timer, mode,
             )
+        result = None
+        for event in events:
+            if event["event"] == "case":
+                failed += not event["data"]["success"]
+                yield event
+            else:
+                result = event["data"]
+        if result is None:
+            # A compiled batch: its time is that of the runs.
+            result = compiled_result(0, "", "", timer)
+    except (worker_pool.WorkerTimeout, subprocess.TimeoutExpired):
+        result = timeout_result(total)
+    except Exception as e:
+        result = error_result(f"Execution error: {str(e)}")
+    mark_failed_cases(result, failed, len(input_cases))
+    metrics.observe_result(language, result)
+    yield _result_event(result)
 
-            return {
-                "success": run_result.returncode == 0,
-                "output": run_result.stdout.strip(),
-                "error": run_result.stderr.strip(),
-                "steps": [],
-                "execution_time_ms": 0,
-            }
 
-    except subprocess.TimeoutExpired:
-        return {
-            "success": False,
-            "output": "",
-            "error": "Code execution timed out (5 second limit).",
-            "steps": [],
-            "execution_time_ms": 5000,
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "output": "",
-            "error": f"Execution error: {str(e)}",
-            "steps": [],
-            "execution_time_ms": 0,
-        }
+def mark_failed_cases(result: dict, failed: int, count: int):
+    """Make the ``result`` of a batch with ``failed`` failed cases a failure."""
+    if failed:
+        result["success"] = False
+        result["error"] = result["error"] or f"{failed} of {count} cases failed"
 
 
-def execute_code(code: str, language: str = 'python', input_data=None, timeout: int = 5) -> dict:
+def execute_batch(code: str, language: str = 'python', input_cases: list = (),
+                  timeout: int = 5, trace_mode: str = "full", max_steps: int = None,
+                  watch: dict = None, optimization: str = "O0",
+                  trace: bool = False, mode: str = "trace") -> dict:
+    """
+    Batch counterpart of ``execute_code``, see ``stream_batch``.
+
+    The result has the per-case results, in order, as ``cases``; a batch
+    stopped by its timeout has those of the cases that finished.
+    """
+    cases, result = [], {}
+    for event in stream_batch(code, language, input_cases, timeout, trace_mode,
+                              max_steps, watch, optimization, trace, mode):
+        if event["event"] == "case":
+            cases.append(event["data"])
+        else:
+            result = event["data"]
+    result["steps"] = []
+    result["cases"] = cases
+    return result
+
+
+def execute_code(code: str, language: str = 'python', input_data=None, timeout: int = 5,
+                 trace_mode: str = "full", max_steps: int = None,
+                 watch: dict = None, optimization: str = "O0",
+                 trace: bool = False, input_cases: list = None,
+                 mode: str = "trace") -> dict:
     """
     Execute code in various languages.
-    
+
     Args:
         code: The source code to execute
         language: 'python', 'c', 'cpp', or 'java'
         input_data: Input data for the program
         timeout: Execution timeout in seconds
+        trace_mode: 'full' or 'delta' step recording (Python only)
+        max_steps: Lower cap on recorded trace steps (Python, traced C/C++)
+        watch: What to trace, see ``python_job`` (Python only)
+        optimization: 'O0' or 'O2' (C/C++ only, ignored when traced)
+        trace: Trace C/C++ line by line (Python is always traced)
+        input_cases: Inputs to run the code on in one batch instead of
+            ``input_data``, see ``execute_batch``
+        mode: 'trace', or 'count' for operation counts or 'profile' for a
+            line profile (Python only), or 'sample' for a flame graph of
+            sampled call stacks (Python, C/C++)
     """
+    if input_cases is not None:
+        return execute_batch(code, language, input_cases, timeout, trace_mode,
+                             max_steps, watch, optimization, trace, mode)
     language = language.lower()
-    
+    if optimization not in OPTIMIZATION_LEVELS:
+        return error_result(f"Unsupported optimization level: {optimization}")
+    if mode_error(mode, language):
+        return error_result(mode_error(mode, language))
+
     if language == 'python':
-        return execute_python_code(code, input_data, timeout)
+        result = execute_python_code(
+            code, input_data, timeout, trace_mode, max_steps, watch, mode
+        )
     elif language == 'c':
-        return execute_c_code(code, timeout)
+        result = execute_c_code(
+            code, timeout, optimization, trace, max_steps, input_data, mode
+        )
     elif language == 'cpp':
-        return execute_cpp_code(code, timeout)
+        result = execute_cpp_code(
+            code, timeout, optimization, trace, max_steps, input_data, mode
+        )
     elif language == 'java':
-        return execute_java_code(code, timeout)
+        result = execute_java_code(code, timeout, input_data)
     else:
-        return {
-            "success": False,
-            "output": "",
-            "error": f"Unsupported language: {language}",
-            "steps": [],
-            "execution_time_ms": 0,
-        }
+        return error_result(f"Unsupported language: {language}")
+    metrics.observe_result(language, result)
+    return result
+
+
+def stream_code(code: str, language: str = 'python', input_data=None, timeout: int = 5,
+                trace_mode: str = "full", max_steps: int = None, watch: dict = None,
+                paged: bool = False, optimization: str = "O0", trace: bool = False,
+                input_cases: list = None, mode: str = "trace"):
+    """
+    Event-stream counterpart of ``execute_code`` (see ``stream_python_code``).
+
+    Python and traced C/C++ produce step events; C/C++ steps are sent once
+    the program has finished. Other runs yield just the result. Batches
+    yield ``case`` events instead of steps, see ``stream_batch``.
+    """
+    if input_cases is not None:
+        yield from stream_batch(code, language, input_cases, timeout, trace_mode,
+                                max_steps, watch, optimization, trace, mode)
+    elif mode_error(mode, language):
+        yield _result_event(error_result(mode_error(mode, language)))
+    elif language.lower() == 'python':
+        for event in stream_python_code(
+            code, input_data, timeout, trace_mode, max_steps, watch, paged, mode
+        ):
+            if event["event"] == "result":
+                metrics.observe_result("python", event["data"])
+            yield event
+    else:
+        result = execute_code(code, language, input_data, timeout, trace_mode,
+                              max_steps, watch, optimization, trace, mode=mode)
+        for step in result.get("steps", ()):
+            yield {"event": "step", "data": step}
+        yield _result_event(result)
@@ -0,0 +1,86 @@
+"""
+Flame graph formats for sampled call stacks.
+
+Runs in ``sample`` mode (see ``tracer.StackSampler`` for Python and
+``native_profiler`` for C/C++) produce a profile of the form::
+
+    {
+        "frames": [{"name": ..., "line": ...}, ...],
+        "stacks": [[frame id, ...], ...],   # outermost frame first
+        "weights": [microseconds, ...],     # time sampled in each stack
+        "samples": ..., "interval_us": ..., "overhead": ...,
+    }
+
+``render()`` turns one into the ``flamegraph`` of a result: the stacks in
+the collapsed format of ``flamegraph.pl`` and as a speedscope file.
+"""
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+def from_counts(counts: dict, interval_us: int) -> dict:
+    """The profile of ``counts``, samples per tuple of frame names."""
+    frames, frame_ids = [], {}
+    stacks, weights = [], []
+    for names, count in counts.items():
+        stack = []
+        for name in names:
+            if name not in frame_ids:
+                frame_ids[name] = len(frames)
+                frames.append({"name": name, "line": None})
+            stack.append(frame_ids[name])
+        stacks.append(stack)
+        weights.append(count * interval_us)
+    return {
+        "frames": frames,
+        "stacks": stacks,
+        "weights": weights,
+        "samples": sum(counts.values()),
+        "interval_us": interval_us,
+        "overhead": None,
+    }
+
+
+def collapsed(profile: dict) -> str:
+    """One ``outer;inner microseconds`` line per stack, heaviest first."""
+    names = [frame["name"].replace(";", ":") for frame in profile["frames"]]
+    rows = sorted(zip(profile["stacks"], profile["weights"]), key=lambda row: -row[1])
+    return "".join(
+        ";".join(names[i] for i in stack) + f" {weight}\n"
+        for stack, weight in rows
+        if weight
+    )
+
+
+def speedscope(profile: dict, name: str) -> dict:
+    """The profile as a speedscope file with one sampled profile."""
+    frames = [
+        {"name": frame["name"], **({"line": frame["line"]} if frame["line"] else {})}
+        for frame in profile["frames"]
+    ]
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "name": name,
+        "exporter": "dsavisual",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "microseconds",
+            "startValue": 0,
+            "endValue": sum(profile["weights"]),
+            "samples": profile["stacks"],
+            "weights": profile["weights"],
+        }],
+    }
+
+
+def render(profile: dict, name: str) -> dict:
+    """The ``flamegraph`` of a result from a run's sampled ``profile``."""
+    return {
+        "samples": profile["samples"],
+        "interval_us": profile["interval_us"],
+        "overhead": profile["overhead"],
+        "collapsed": collapsed(profile),
+        "speedscope": speedscope(profile, name),
+    }
@@ -0,0 +1,449 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.ByteArrayInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.FileDescriptor;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.lang.reflect.Modifier;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.HashMap;
+import java.util.LinkedHashMap;
+import java.util.List;
+import java.util.Locale;
+import java.util.Map;
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.FileObject;
+import javax.tools.ForwardingJavaFileManager;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+/**
+ * Warm JVM that compiles and runs Java programs for java_runner.py.
+ *
+ * Jobs are read from stdin, one at a time: a header line
+ * "<source bytes> <stdin bytes>" followed by the UTF-8 source of Main.java
+ * and the program's stdin. Each is answered on stdout with a header line
+ * "<status> <exit code> <recycle> <truncated> <compile ms> <run ms>
+ * <stdout bytes> <stderr bytes>" followed by the program's stdout and
+ * stderr. The status is "ok" or "compile_error" (stderr then holds the
+ * diagnostics). recycle=1 asks the supervisor to replace this JVM (threads
+ * left running, OutOfMemoryError, System.exit); an exit code of "x" means
+ * the program called System.exit and the JVM's exit status is its code.
+ *
+ * Programs are compiled in memory with the javax.tools compiler and run in
+ * a fresh class loader whose parent is the platform loader, so they see
+ * neither this class nor each other. The only argument is the number of
+ * bytes of stdout and of stderr a program may write before it is stopped.
+ */
+public final class JavaRunner {
+
+    private static final int CACHE_ENTRIES = 64;
+
+    private static final Object answerLock = new Object();
+    private static volatile Job current;
+
+    private final JavaCompiler compiler;
+    private final StandardJavaFileManager standardFiles;
+    private final long outputLimit;
+    private final Map<String, Map<String, byte[]>> compiled =
+        new LinkedHashMap<String, Map<String, byte[]>>(16, 0.75f, true) {
+            @Override
+            protected boolean removeEldestEntry(Map.Entry<String, Map<String, byte[]>> eldest) {
+                return size() > CACHE_ENTRIES;
+            }
+        };
+
+    private JavaRunner(JavaCompiler compiler, long outputLimit) {
+        this.compiler = compiler;
+        this.standardFiles = compiler.getStandardFileManager(null, Locale.ROOT, StandardCharsets.UTF_8);
+        this.outputLimit = outputLimit;
+    }
+
+    public static void main(String[] args) throws IOException {
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            System.err.println("No Java compiler available (a JDK is required).");
+            System.exit(2);
+        }
+        InputStream in = new BufferedInputStream(new FileInputStream(FileDescriptor.in));
+        OutputStream out = new BufferedOutputStream(new FileOutputStream(FileDescriptor.out));
+        // Nothing a program leaves behind may write into the protocol stream.
+        PrintStream discard = new PrintStream(OutputStream.nullOutputStream());
+        System.setOut(discard);
+        System.setErr(discard);
+        Runtime.getRuntime().addShutdownHook(new Thread(() -> {
+            Job job = current;
+            if (job != null) {
+                job.answer(out, null, true);
+            }
+        }));
+
+        JavaRunner runner = new JavaRunner(compiler, Long.parseLong(args[0]));
+        String header;
+        while ((header = readLine(in)) != null) {
+            String[] sizes = header.trim().split(" ");
+            String source = new String(readExactly(in, Integer.parseInt(sizes[0])), StandardCharsets.UTF_8);
+            byte[] stdin = readExactly(in, Integer.parseInt(sizes[1]));
+            Job job = new Job(runner.outputLimit);
+            current = job;
+            runner.run(job, source, stdin);
+            current = null;
+            System.setIn(new ByteArrayInputStream(new byte[0]));
+            System.setOut(discard);
+            System.setErr(discard);
+            job.answer(out, job.exitCode, job.recycle);
+            if (job.recycle) {
+                Runtime.getRuntime().halt(0);
+            }
+        }
+    }
+
+    private void run(Job job, String source, byte[] stdin) {
+        long start = System.nanoTime();
+        Map<String, byte[]> classes;
+        try {
+            classes = compile(source);
+        } catch (CompileError e) {
+            job.status = "compile_error";
+            job.stderr.writeText(e.getMessage());
+            return;
+        } finally {
+            job.compileMs = (System.nanoTime() - start) / 1e6;
+        }
+
+        System.setIn(new ByteArrayInputStream(stdin));
+        System.setOut(new PrintStream(job.stdout, true, StandardCharsets.UTF_8));
+        System.setErr(new PrintStream(job.stderr, true, StandardCharsets.UTF_8));
+        start = System.nanoTime();
+        ThreadGroup group = new ThreadGroup("program");
+        Thread main = new Thread(group, () -> job.exitCode = runMain(job, classes), "main");
+        main.start();
+        joinAll(main, group, job);
+        job.runMs = (System.nanoTime() - start) / 1e6;
+    }
+
+    /** Run Main.main like the java launcher would; returns the exit code. */
+    private static int runMain(Job job, Map<String, byte[]> classes) {
+        Method entry;
+        try {
+            Class<?> mainClass = new MemoryClassLoader(classes).loadClass("Main");
+            entry = mainClass.getMethod("main", String[].class);
+            if (!Modifier.isStatic(entry.getModifiers())) {
+                throw new NoSuchMethodException("main");
+            }
+        } catch (ClassNotFoundException | LinkageError e) {
+            System.err.println("Error: Could not find or load main class Main");
+            return 1;
+        } catch (NoSuchMethodException e) {
+            System.err.println("Error: Main method not found in class Main, please define the main method as:");
+            System.err.println("   public static void main(String[] args)");
+            return 1;
+        }
+        try {
+            entry.invoke(null, (Object) new String[0]);
+            return 0;
+        } catch (InvocationTargetException e) {
+            Throwable cause = e.getCause();
+            if (cause instanceof OutOfMemoryError) {
+                job.recycle = true;
+            }
+            if (!(cause instanceof OutputLimitExceeded)) {
+                try {
+                    System.err.print("Exception in thread \"main\" ");
+                    trimStackTrace(cause).printStackTrace(System.err);
+                } catch (OutputLimitExceeded ignored) {
+                    // stderr is full; the supervisor reports the truncation.
+                }
+            }
+            return 1;
+        } catch (IllegalAccessException e) {
+            System.err.println("Error: Main method not found in class Main, please define the main method as:");
+            System.err.println("   public static void main(String[] args)");
+            return 1;
+        }
+    }
+
+    /** Wait for the program's main thread and every non-daemon thread it started. */
+    private static void joinAll(Thread main, ThreadGroup group, Job job) {
+        boolean interrupted = false;
+        for (Thread thread = main; thread != null; thread = liveThread(group, false)) {
+            try {
+                thread.join();
+            } catch (InterruptedException e) {
+                interrupted = true;
+            }
+        }
+        // Daemon threads would keep running into the next job.
+        if (liveThread(group, true) != null) {
+            job.recycle = true;
+        }
+        if (interrupted) {
+            Thread.currentThread().interrupt();
+        }
+    }
+
+    private static Thread liveThread(ThreadGroup group, boolean daemons) {
+        Thread[] threads = new Thread[group.activeCount() + 16];
+        int count = group.enumerate(threads, true);
+        for (int i = 0; i < count; i++) {
+            if (threads[i].isAlive() && (daemons || !threads[i].isDaemon())) {
+                return threads[i];
+            }
+        }
+        return null;
+    }
+
+    /** Drop the runner's reflection frames from the bottom of a program's stack trace. */
+    private static Throwable trimStackTrace(Throwable error) {
+        StackTraceElement[] frames = error.getStackTrace();
+        int end = frames.length;
+        for (int i = 0; i < frames.length; i++) {
+            String name = frames[i].getClassName();
+            if (name.startsWith("jdk.internal.reflect.") || name.startsWith("java.lang.reflect.")
+                    || name.startsWith("JavaRunner")) {
+                end = i;
+                break;
+            }
+        }
+        error.setStackTrace(Arrays.copyOf(frames, end));
+        return error;
+    }
+
+    private Map<String, byte[]> compile(String source) throws CompileError {
+        Map<String, byte[]> classes = compiled.get(source);
+        if (classes != null) {
+            return classes;
+        }
+        DiagnosticCollector<JavaFileObject> diagnostics = new DiagnosticCollector<>();
+        MemoryFileManager files = new MemoryFileManager(standardFiles);
+        boolean ok = compiler.getTask(
+            null, files, diagnostics, List.of("-proc:none"), null, List.of(new Source(source))
+        ).call();
+        if (!ok) {
+            throw new CompileError(formatDiagnostics(diagnostics.getDiagnostics()));
+        }
+        classes = new HashMap<>();
+        for (Map.Entry<String, ClassOutput> entry : files.classes.entrySet()) {
+            classes.put(entry.getKey(), entry.getValue().bytes.toByteArray());
+        }
+        compiled.put(source, classes);
+        return classes;
+    }
+
+    /** Diagnostics in the format of the javac command line. */
+    private static String formatDiagnostics(List<Diagnostic<? extends JavaFileObject>> diagnostics) {
+        StringBuilder text = new StringBuilder();
+        int errors = 0;
+        for (Diagnostic<? extends JavaFileObject> diagnostic : diagnostics) {
+            String kind;
+            switch (diagnostic.getKind()) {
+                case ERROR:
+                    kind = "error";
+                    errors++;
+                    break;
+                case WARNING:
+                case MANDATORY_WARNING:
+                    kind = "warning";
+                    break;
+                default:
+                    continue;
+            }
+            if (diagnostic.getLineNumber() != Diagnostic.NOPOS) {
+                text.append("Main.java:").append(diagnostic.getLineNumber()).append(": ");
+            }
+            text.append(kind).append(": ").append(diagnostic.getMessage(Locale.ROOT)).append('\n');
+        }
+        text.append(errors).append(errors == 1 ? " error" : " errors").append('\n');
+        return text.toString();
+    }
+
+    private static String readLine(InputStream in) throws IOException {
+        ByteArrayOutputStream line = new ByteArrayOutputStream();
+        int b;
+        while ((b = in.read()) != '\n') {
+            if (b == -1) {
+                return line.size() == 0 ? null : line.toString(StandardCharsets.US_ASCII);
+            }
+            line.write(b);
+        }
+        return line.toString(StandardCharsets.US_ASCII);
+    }
+
+    private static byte[] readExactly(InputStream in, int size) throws IOException {
+        byte[] data = in.readNBytes(size);
+        if (data.length != size) {
+            throw new IOException("Job truncated");
+        }
+        return data;
+    }
+
+    /** State and captured output of the job being run. */
+    private static final class Job {
+        final CappedOutput stdout;
+        final CappedOutput stderr;
+        String status = "ok";
+        volatile Integer exitCode = 0;
+        volatile boolean recycle;
+        double compileMs;
+        double runMs;
+        private boolean answered;
+
+        Job(long outputLimit) {
+            stdout = new CappedOutput(outputLimit);
+            stderr = new CappedOutput(outputLimit);
+        }
+
+        /** Write the answer once; a null exit code means "x" (System.exit). */
+        void answer(OutputStream out, Integer code, boolean recycle) {
+            synchronized (answerLock) {
+                if (answered) {
+                    return;
+                }
+                answered = true;
+                byte[] out1 = stdout.toByteArray();
+                byte[] out2 = stderr.toByteArray();
+                String header = String.format(
+                    Locale.ROOT, "%s %s %d %d %.3f %.3f %d %d\n",
+                    status, code == null ? "x" : code.toString(), recycle ? 1 : 0,
+                    stdout.truncated || stderr.truncated ? 1 : 0,
+                    compileMs, runMs, out1.length, out2.length
+                );
+                try {
+                    out.write(header.getBytes(StandardCharsets.US_ASCII));
+                    out.write(out1);
+                    out.write(out2);
+                    out.flush();
+                } catch (IOException e) {
+                    Runtime.getRuntime().halt(3);
+                }
+            }
+        }
+    }
+
+    /** Thrown into a program that writes past its output limit. */
+    private static final class OutputLimitExceeded extends Error {
+        OutputLimitExceeded() {
+            super("Output limit exceeded", null, false, false);
+        }
+    }
+
+    /** Keeps the first limit bytes written; writing more throws OutputLimitExceeded. */
+    private static final class CappedOutput extends OutputStream {
+        private final ByteArrayOutputStream data = new ByteArrayOutputStream();
+        private final long limit;
+        volatile boolean truncated;
+
+        CappedOutput(long limit) {
+            this.limit = limit;
+        }
+
+        @Override
+        public synchronized void write(int b) {
+            write(new byte[] {(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] b, int off, int len) {
+            if (truncated) {
+                throw new OutputLimitExceeded();
+            }
+            long room = limit - data.size();
+            if (len > room) {
+                data.write(b, off, (int) room);
+                truncated = true;
+                throw new OutputLimitExceeded();
+            }
+            data.write(b, off, len);
+        }
+
+        void writeText(String text) {
+            byte[] bytes = text.getBytes(StandardCharsets.UTF_8);
+            data.write(bytes, 0, (int) Math.min(bytes.length, limit));
+        }
+
+        synchronized byte[] toByteArray() {
+            return data.toByteArray();
+        }
+    }
+
+    private static final class CompileError extends Exception {
+        CompileError(String diagnostics) {
+            super(diagnostics, null, false, false);
+        }
+    }
+
+    private static final class Source extends SimpleJavaFileObject {
+        private final String code;
+
+        Source(String code) {
+            super(URI.create("string:///Main.java"), Kind.SOURCE);
+            this.code = code;
+        }
+
+        @Override
+        public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+            return code;
+        }
+    }
+
+    private static final class ClassOutput extends SimpleJavaFileObject {
+        final ByteArrayOutputStream bytes = new ByteArrayOutputStream();
+
+        ClassOutput(String className) {
+            super(URI.create("bytes:///" + className.replace('.', '/') + ".class"), Kind.CLASS);
+        }
+
+        @Override
+        public OutputStream openOutputStream() {
+            return bytes;
+        }
+    }
+
+    private static final class MemoryFileManager extends ForwardingJavaFileManager<StandardJavaFileManager> {
+        final Map<String, ClassOutput> classes = new HashMap<>();
+
+        MemoryFileManager(StandardJavaFileManager files) {
+            super(files);
+        }
+
+        @Override
+        public JavaFileObject getJavaFileForOutput(
+                Location location, String className, JavaFileObject.Kind kind, FileObject sibling) {
+            ClassOutput output = new ClassOutput(className);
+            classes.put(className, output);
+            return output;
+        }
+    }
+
+    private static final class MemoryClassLoader extends ClassLoader {
+        private final Map<String, byte[]> classes;
+
+        MemoryClassLoader(Map<String, byte[]> classes) {
+            super(ClassLoader.getPlatformClassLoader());
+            this.classes = classes;
+        }
+
+        @Override
+        protected Class<?> findClass(String name) throws ClassNotFoundException {
+            byte[] bytes = classes.get(name);
+            if (bytes == null) {
+                throw new ClassNotFoundException(name);
+            }
+            return defineClass(name, bytes, 0, bytes.length);
+        }
+    }
+}
@@ -0,0 +1,217 @@
+"""
+Warm JVMs for Java executions.
+
+Running ``javac`` and then a fresh ``java`` costs well over a second before
+any user code runs. Instead, pooled ``JavaWorker``s keep a JVM running
+``java/JavaRunner.java`` (JDK 11+), which compiles each program in memory
+with the javax.tools compiler and runs ``Main`` in its own class loader.
+Workers are pooled like the Python ones (see ``worker_pool``) and replaced
+after ``JAVA_POOL_MAX_JOBS`` jobs, a timeout, a crash, or a program that
+leaves threads running, exhausts the heap or calls ``System.exit``.
+"""
+import hashlib
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from . import compile_cache, conf, sandbox
+from .worker_pool import PythonWorkerPool, WorkerCrashed, WorkerTimeout
+
+RUNNER_SOURCE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "java", "JavaRunner.java"
+)
+
+# Fields of an answer's header line, in order.
+_ANSWER_FIELDS = (
+    "status", "returncode", "recycle", "output_truncated",
+    "compile_ms", "run_ms", "stdout_bytes", "stderr_bytes",
+)
+
+_runner_lock = threading.Lock()
+
+
+def runner_classpath():
+    """
+    Directory holding the compiled ``JavaRunner``, building it if needed.
+
+    Kept outside the compile cache so eviction cannot remove classes a
+    running JVM has yet to load.
+    """
+    with open(RUNNER_SOURCE, "rb") as f:
+        source = f.read()
+    digest = hashlib.sha256(source)
+    digest.update(compile_cache.compiler_identity("javac").encode("utf-8"))
+    path = os.path.join(
+        tempfile.gettempdir(), f"dsavisual-java-runner-{digest.hexdigest()[:16]}"
+    )
+    with _runner_lock:
+        if os.path.isdir(path):
+            return path
+        workdir = tempfile.mkdtemp(prefix="dsavisual-java-runner-build-")
+        try:
+            try:
+                result = subprocess.run(
+                    ["javac", "-d", workdir, RUNNER_SOURCE],
+                    capture_output=True, text=True, timeout=120,
+                )
+            except subprocess.TimeoutExpired as exc:
+                raise OSError("Timed out building the Java runner.") from exc
+            if result.returncode != 0:
+                raise OSError(f"Could not build the Java runner:\n{result.stderr}")
+            try:
+                os.rename(workdir, path)
+            except OSError:
+                # Another server process built it first.
+                if not os.path.isdir(path):
+                    raise
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return path
+
+
+class JavaWorker:
+    """A single warm JVM running ``JavaRunner``, serving one job at a time."""
+
+    def __init__(self):
+        self.jobs_served = 0
+        self.recycle = False
+        self.workdir = tempfile.mkdtemp(prefix="dsavisual-java-")
+        try:
+            self.process = subprocess.Popen(
+                [
+                    "java", *sandbox.java_options(),
+                    "-XX:+UseSerialGC", "-XX:-UsePerfData",
+                    "-cp", runner_classpath(), "JavaRunner",
+                    str(conf.get("OUTPUT_MAX_BYTES")),
+                ],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=self.workdir,
+                preexec_fn=sandbox.preexec("java"),
+            )
+        except BaseException:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            raise
+        self._answers = queue.Queue()
+        threading.Thread(target=self._read_answers, daemon=True).start()
+
+    def _read_answers(self):
+        stdout = self.process.stdout
+        while True:
+            header = stdout.readline()
+            if not header:
+                break
+            answer = dict(zip(_ANSWER_FIELDS, header.decode("ascii").split()))
+            out = stdout.read(int(answer["stdout_bytes"]))
+            err = stdout.read(int(answer["stderr_bytes"]))
+            answer["stdout"] = out.decode("utf-8", errors="replace")
+            answer["stderr"] = err.decode("utf-8", errors="replace")
+            self._answers.put(answer)
+        self._answers.put(None)
+
+    @property
+    def alive(self):
+        return not self.recycle and self.process.poll() is None
+
+    def stream(self, job, timeout, timer=None):
+        """
+        Compile and run ``job["code"]``, yielding one ``result`` event.
+
+        The result holds ``status`` ("ok" or "compile_error"), ``returncode``,
+        ``stdout``, ``stderr``, ``output_truncated`` and the ``compile_ms``
+        and ``run_ms`` measured inside the JVM. Compiling and running must
+        finish within ``timeout`` seconds.
+        """
+        self.jobs_served += 1
+        deadline = time.monotonic() + timeout
+        source = job["code"].encode("utf-8")
+        stdin = job.get("stdin", "").encode("utf-8")
+        start = time.perf_counter()
+        try:
+            self.process.stdin.write(f"{len(source)} {len(stdin)}\n".encode("ascii"))
+            self.process.stdin.write(source + stdin)
+            self.process.stdin.flush()
+        except OSError as exc:
+            raise WorkerCrashed(str(exc)) from exc
+        if timer is not None:
+            timer.add("write", time.perf_counter() - start)
+
+        try:
+            answer = self._answers.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            self.stop()
+            raise WorkerTimeout()
+        if answer is None:
+            raise WorkerCrashed("Java runner exited unexpectedly.")
+        self.recycle = answer["recycle"] == "1"
+        if answer["returncode"] == "x":
+            # System.exit(): the JVM's exit status is the program's.
+            try:
+                returncode = self.process.wait(max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                self.stop()
+                raise WorkerTimeout()
+        else:
+            returncode = int(answer["returncode"])
+        yield {"event": "result", "data": {
+            "status": answer["status"],
+            "returncode": returncode,
+            "stdout": answer["stdout"],
+            "stderr": answer["stderr"],
+            "output_truncated": answer["output_truncated"] == "1",
+            "compile_ms": float(answer["compile_ms"]),
+            "run_ms": float(answer["run_ms"]),
+        }}
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide pool of warm JVMs.
+
+    ``None`` when ``JAVA_POOL_SIZE`` is 0 or no JDK is on the ``PATH``;
+    Java then runs through ``javac`` and ``java`` as separate processes.
+    """
+    global _pool
+    if conf.get("JAVA_POOL_SIZE") <= 0:
+        return None
+    if shutil.which("java") is None or shutil.which("javac") is None:
+        return None
+    with _pool_lock:
+        # A pool inherited through fork() has no reader threads; start over.
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = PythonWorkerPool(
+                size=conf.get("JAVA_POOL_SIZE"),
+                max_jobs=conf.get("JAVA_POOL_MAX_JOBS"),
+                worker_factory=JavaWorker,
+            )
+    return _pool
+
+
+def warm_up():
+    """Start the JVMs in the background, so server startup does not wait."""
+    pool = get_pool()
+    if pool is not None:
+        threading.Thread(target=_start, args=(pool,), daemon=True).start()
+
+
+def _start(pool):
+    try:
+        pool.start()
+    except OSError:
+        # Retried when the first Java job needs a worker.
+        pass
@@ -0,0 +1,202 @@
+"""
+In-process job queue for asynchronous code execution.
+
+Submitting returns immediately with a job id; a fixed set of worker threads
+runs queued jobs through ``execute_code`` while respecting a per-language
+concurrency limit, so a burst of slow Java compiles cannot starve Python
+runs. Jobs and results live in this process only, so deployments running
+several server processes need sticky routing for the job endpoints.
+"""
+import logging
+import math
+import threading
+import time
+import uuid
+from collections import deque
+
+from . import conf, metrics
+from .executor import execute_code
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """Admission control rejected a job; retry after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Execution queue is full, retry in {retry_after}s.")
+        self.retry_after = retry_after
+
+
+class Job:
+    """A submitted execution and, once finished, its result."""
+
+    def __init__(self, kwargs, on_done=None):
+        self.id = uuid.uuid4().hex
+        self.kwargs = kwargs
+        self.on_done = on_done
+        self.language = kwargs.get("language", "python")
+        self.status = QUEUED
+        self.version = 0
+        self.result = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self, position=None):
+        data = {"job_id": self.id, "status": self.status}
+        if position is not None:
+            data["queue_position"] = position
+        if self.started_at is not None:
+            data["queue_wait_ms"] = int(
+                (self.started_at - self.submitted_at) * 1000
+            )
+        if self.status == DONE:
+            data["result"] = self.result
+        return data
+
+
+class JobScheduler:
+    """Bounded FIFO of jobs served by worker threads with per-language caps."""
+
+    def __init__(self, workers, max_queued, language_limits, result_ttl):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.language_limits = language_limits
+        self.result_ttl = result_ttl
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._jobs = {}
+        self._running = {}
+        self._avg_duration = 1.0
+        self._threads = []
+
+    def _start_workers(self):
+        for n in range(self.workers - len(self._threads)):
+            thread = threading.Thread(
+                target=self._work, name=f"execution-job-{n}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, on_done=None, **kwargs):
+        """
+        Queue an ``execute_code`` call and return its ``Job``.
+
+        ``on_done``, if given, is called with the result on the worker thread
+        once the job has finished.
+        """
+        with self._cond:
+            self._purge_expired()
+            if len(self._pending) >= self.max_queued:
+                backlog = len(self._pending) / max(self.workers, 1)
+                raise QueueFull(max(1, math.ceil(backlog * self._avg_duration)))
+            job = Job(kwargs, on_done)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._start_workers()
+            self._cond.notify_all()
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def snapshot(self, job):
+        """Job state as a dict, including its place in the queue."""
+        with self._cond:
+            position = None
+            if job.status == QUEUED:
+                position = next(
+                    (n for n, queued in enumerate(self._pending) if queued is job),
+                    None,
+                )
+            return job.to_dict(position)
+
+    def wait_for_change(self, job, version, timeout):
+        """Block until ``job.version`` moves past ``version`` or timeout."""
+        with self._cond:
+            self._cond.wait_for(lambda: job.version != version, timeout)
+            return job.version
+
+    def _next_job(self):
+        for job in self._pending:
+            limit = self.language_limits.get(job.language, self.workers)
+            if self._running.get(job.language, 0) < limit:
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                job = self._cond.wait_for(self._next_job)
+                self._pending.remove(job)
+                self._running[job.language] = self._running.get(job.language, 0) + 1
+                job.status = RUNNING
+                job.started_at = time.monotonic()
+                job.version += 1
+                self._cond.notify_all()
+
+            try:
+                result = execute_code(**job.kwargs)
+            except Exception as e:
+                result = {
+                    "success": False,
+                    "output": "",
+                    "error": f"Execution error: {str(e)}",
+                    "steps": [],
+                    "execution_time_ms": 0,
+                }
+            queue_wait = job.started_at - job.submitted_at
+            metrics.observe_phase("queue_wait", job.language, queue_wait)
+            result["timings"] = {
+                "queue_wait": round(queue_wait * 1000, 3),
+                **result.get("timings", {}),
+            }
+
+            with self._cond:
+                job.result = result
+                job.status = DONE
+                job.finished_at = time.monotonic()
+                job.version += 1
+                self._running[job.language] -= 1
+                duration = job.finished_at - job.started_at
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+                self._cond.notify_all()
+
+            if job.on_done is not None:
+                try:
+                    job.on_done(result)
+                except Exception:
+                    logger.exception("Callback of execution job %s failed", job.id)
+
+    def _purge_expired(self):
+        cutoff = time.monotonic() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.status == DONE and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide job scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler(
+                workers=conf.get("JOB_WORKERS"),
+                max_queued=conf.get("JOB_QUEUE_SIZE"),
+                language_limits=conf.get("JOB_LANGUAGE_LIMITS"),
+                result_ttl=conf.get("JOB_RESULT_TTL"),
+            )
+    return _scheduler
@@ -0,0 +1,187 @@
+"""
+Per-phase execution timings and their aggregates in Prometheus text format.
+
+Executors time the phases of a run with a ``PhaseTimer`` and return them as
+the ``timings`` dict of the result (milliseconds per phase). Every finished
+execution is also folded into process-wide histograms, which ``render()``
+exposes for ``/api/metrics/``:
+
+- ``queue_wait``: time a queued job waited for a worker thread
+- ``write``: writing the job to a worker or the source to disk
+- ``compile``: compiling, or looking the build up in the compile cache
+- ``spawn``: starting the process that runs the program
+- ``run``: running the program, excluding trace recording
+- ``trace_serialize``: snapshotting and encoding trace steps in the sandbox
+- ``parse``: decoding trace events in the server
+- ``response_serialize``: rendering the HTTP response body
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from . import compile_cache
+
+PHASES = (
+    "queue_wait", "write", "compile", "spawn", "run",
+    "trace_serialize", "parse", "response_serialize",
+)
+_PHASE_ORDER = {phase: n for n, phase in enumerate(PHASES)}
+
+# Histogram bucket upper bounds in seconds.
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class PhaseTimer:
+    """Accumulates wall time per phase."""
+
+    def __init__(self):
+        self.seconds = {}
+
+    def add(self, phase, seconds):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def as_dict(self, extra=None):
+        """Timings in milliseconds, in ``PHASES`` order, merged with ``extra``."""
+        ms = {phase: seconds * 1000 for phase, seconds in self.seconds.items()}
+        ms.update(extra or {})
+        return {
+            phase: round(ms[phase], 3)
+            for phase in sorted(ms, key=lambda p: _PHASE_ORDER.get(p, len(PHASES)))
+        }
+
+
+def _format_labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels)
+
+
+class Histogram:
+    """A Prometheus histogram with a fixed set of label names."""
+
+    def __init__(self, name, documentation, label_names, buckets=BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.setdefault(
+                label_values, [0] * len(self.buckets) + [0.0, 0]
+            )
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, data in series:
+            labels = list(zip(self.label_names, label_values))
+            for bound, count in zip(self.buckets, data):
+                bucket = _format_labels(labels + [("le", repr(bound))])
+                lines.append(f"{self.name}_bucket{{{bucket}}} {count}")
+            bucket = _format_labels(labels + [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{{{bucket}}} {data[-1]}")
+            lines.append(f"{self.name}_sum{{{_format_labels(labels)}}} {data[-2]}")
+            lines.append(f"{self.name}_count{{{_format_labels(labels)}}} {data[-1]}")
+        return lines
+
+
+class Counter:
+    """A Prometheus counter with a fixed set of label names."""
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            labels = _format_labels(zip(self.label_names, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+        return lines
+
+
+phase_seconds = Histogram(
+    "dsavisual_execution_phase_seconds",
+    "Time spent per execution phase.",
+    ("phase", "language"),
+)
+executions = Counter(
+    "dsavisual_executions_total",
+    "Finished executions by outcome.",
+    ("language", "outcome"),
+)
+
+
+def observe_phase(phase, language, seconds):
+    phase_seconds.observe(seconds, phase, language)
+
+
+def observe_result(language, result):
+    """Record the ``timings`` and outcome of a finished execution."""
+    for phase, ms in (result.get("timings") or {}).items():
+        phase_seconds.observe(ms / 1000, phase, language)
+    if result.get("success"):
+        outcome = "success"
+    elif result.get("error", "").startswith("Code execution timed out"):
+        outcome = "timeout"
+    elif result.get("limit_exceeded"):
+        outcome = "limit_exceeded"
+    else:
+        outcome = "error"
+    executions.inc(language, outcome)
+
+
+def _compile_cache_lines():
+    stats = compile_cache.get_cache().stats()
+    lines = []
+    for key, kind in (("hits", "counter"), ("misses", "counter"),
+                      ("evictions", "counter"), ("entries", "gauge"),
+                      ("bytes", "gauge")):
+        name = f"dsavisual_compile_cache_{key}"
+        if kind == "counter":
+            name += "_total"
+        lines += [
+            f"# HELP {name} Compile cache {key}.",
+            f"# TYPE {name} {kind}",
+            f"{name} {stats[key]}",
+        ]
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    lines = phase_seconds.render() + executions.render() + _compile_cache_lines()
+    return "\n".join(lines) + "\n"
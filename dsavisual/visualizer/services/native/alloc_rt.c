@@ -0,0 +1,51 @@
+/*
+ * Allocation failure marker for C/C++ programs, preloaded by sandbox.py.
+ *
+ * Under RLIMIT_AS an allocation that does not fit returns NULL, and the
+ * program usually crashes on it later, with the same SIGSEGV as any other
+ * null pointer dereference. These replacements of malloc, calloc and
+ * realloc call glibc's own and write a marker line to stderr the first
+ * time one fails, so that the server can tell the memory limit from a bug
+ * in the program.
+ *
+ * Built with -shared -fPIC and loaded through LD_PRELOAD.
+ */
+#include <errno.h>
+#include <stddef.h>
+#include <unistd.h>
+
+extern void *__libc_malloc(size_t size);
+extern void *__libc_calloc(size_t count, size_t size);
+extern void *__libc_realloc(void *ptr, size_t size);
+
+/* Keep in step with sandbox.ALLOCATION_FAILED. */
+static const char marker[] = "\n__DSAVISUAL_ALLOCATION_FAILED__\n";
+static volatile int reported;
+
+static void *checked(void *ptr, int requested)
+{
+    if (ptr == NULL && requested && !reported) {
+        int saved = errno;
+        reported = 1;
+        ssize_t written = write(2, marker, sizeof marker - 1);
+        (void)written;
+        errno = saved;
+    }
+    return ptr;
+}
+
+void *malloc(size_t size)
+{
+    return checked(__libc_malloc(size), size != 0);
+}
+
+void *calloc(size_t count, size_t size)
+{
+    return checked(__libc_calloc(count, size), count != 0 && size != 0);
+}
+
+void *realloc(void *ptr, size_t size)
+{
+    /* realloc(ptr, 0) frees ptr and may return NULL. */
+    return checked(__libc_realloc(ptr, size), size != 0);
+}
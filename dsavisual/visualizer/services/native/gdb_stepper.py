@@ -0,0 +1,206 @@
+"""
+Line stepper run inside gdb (``gdb -batch -x gdb_stepper.py ./main``).
+
+Steps through the lines of the submitted source, appending one
+``{"line", "locals"}`` step per line to ``DSAVISUAL_TRACE_FILE`` as NDJSON.
+Library code is stepped over. Once ``DSAVISUAL_TRACE_MAX`` steps are
+recorded or ``DSAVISUAL_TRACE_SECONDS`` have passed, the program runs on
+untraced. The last line written is ``{"returncode": ..., "truncated": ...}``.
+
+The program reads stdin from ``DSAVISUAL_TRACE_STDIN``, and its stdout and
+stderr go to the files named by ``DSAVISUAL_TRACE_STDOUT`` and
+``DSAVISUAL_TRACE_STDERR``.
+"""
+import json
+import os
+import signal
+import time
+
+import gdb
+
+SOURCE = os.environ["DSAVISUAL_TRACE_SOURCE"]
+MAX_STEPS = int(os.environ["DSAVISUAL_TRACE_MAX"])
+MAX_ITEMS = int(os.environ["DSAVISUAL_TRACE_MAX_ITEMS"])
+DEADLINE = time.monotonic() + float(os.environ["DSAVISUAL_TRACE_SECONDS"])
+
+# Longest text kept for a value shown by its gdb rendering.
+MAX_CHARS = 200
+# Nesting of containers and structs encoded before falling back to text.
+MAX_DEPTH = 3
+
+_status = {"exit_code": None, "signal": None}
+
+
+def _on_exit(event):
+    if hasattr(event, "exit_code"):
+        _status["exit_code"] = event.exit_code
+
+
+def _on_stop(event):
+    if isinstance(event, gdb.SignalEvent):
+        _status["signal"] = event.stop_signal
+
+
+def _text(value):
+    return str(value)[:MAX_CHARS]
+
+
+def _encode_printed(value, printer, depth):
+    """Encode ``value`` through its pretty printer (std::vector, std::map...)."""
+    hint = printer.display_hint() if hasattr(printer, "display_hint") else None
+    if not hasattr(printer, "children"):
+        text = _text(value)
+        if hint == "string" and len(text) > 1 and text[0] == text[-1] == '"':
+            return text[1:-1]
+        return text
+    limit = 2 * MAX_ITEMS if hint == "map" else MAX_ITEMS
+    items = []
+    for n, (_, child) in enumerate(printer.children()):
+        if n >= limit:
+            break
+        if isinstance(child, gdb.Value):
+            child = encode(child, depth + 1)
+        elif not isinstance(child, (bool, int, float, str)):
+            child = _text(child)
+        items.append(child)
+    if hint == "map":
+        return {str(key): item for key, item in zip(items[::2], items[1::2])}
+    return items
+
+
+def encode(value, depth=0):
+    """A JSON-able rendering of ``value``, like the Python tracer's."""
+    try:
+        if depth > MAX_DEPTH:
+            return _text(value)
+        printer = gdb.default_visualizer(value)
+        if printer is not None:
+            return _encode_printed(value, printer, depth)
+        type_ = value.type.strip_typedefs()
+        code = type_.code
+        if code == gdb.TYPE_CODE_BOOL:
+            return bool(value)
+        if code == gdb.TYPE_CODE_INT:
+            if type_.sizeof == 1 and type_.name and "char" in type_.name:
+                char = int(value) & 0xFF
+                return chr(char) if 32 <= char < 127 else char
+            return int(value)
+        if code == gdb.TYPE_CODE_FLT:
+            return float(value)
+        if code == gdb.TYPE_CODE_ARRAY:
+            low, high = type_.range()
+            high = min(high, low + MAX_ITEMS - 1)
+            return [encode(value[i], depth + 1) for i in range(low, high + 1)]
+        if code == gdb.TYPE_CODE_STRUCT:
+            return {
+                field.name: encode(value[field.name], depth + 1)
+                for field in type_.fields()
+                if field.name and not field.is_base_class
+                and not getattr(field, "artificial", False)
+                and hasattr(field, "bitpos")
+            }
+        return _text(value)
+    except (gdb.error, RuntimeError, ValueError, OverflowError):
+        return "<unavailable>"
+
+
+def frame_locals(frame, line):
+    """Arguments and the locals declared before ``line`` in ``frame``."""
+    values = {}
+    try:
+        block = frame.block()
+    except RuntimeError:
+        return values
+    while block is not None:
+        for symbol in block:
+            if not (symbol.is_argument or symbol.is_variable):
+                continue
+            # A local is not initialized before its declaration has run.
+            if symbol.name in values or (
+                not symbol.is_argument and symbol.line >= line
+            ):
+                continue
+            try:
+                values[symbol.name] = encode(symbol.value(frame))
+            except (gdb.error, RuntimeError):
+                continue
+        if block.function is not None:
+            break
+        block = block.superblock
+    return values
+
+
+def _running():
+    return gdb.selected_inferior().pid != 0
+
+
+def _in_source(frame):
+    symtab = frame.find_sal().symtab
+    return symtab is not None and os.path.basename(symtab.filename) == SOURCE
+
+
+def trace(out):
+    """Record steps until the program ends or a cap is reached."""
+    count = 0
+    while _running():
+        try:
+            frame = gdb.selected_frame()
+        except gdb.error:
+            break
+        if _in_source(frame):
+            if count >= MAX_STEPS:
+                return "max_steps"
+            if time.monotonic() > DEADLINE:
+                return "max_time"
+            line = frame.find_sal().line
+            out.write(json.dumps({"line": line, "locals": frame_locals(frame, line)}))
+            out.write("\n")
+            count += 1
+        try:
+            gdb.execute("step", to_string=True)
+        except gdb.error:
+            break
+    return None
+
+
+def finish():
+    """Let the program run to its end untraced."""
+    gdb.execute("delete", to_string=True)
+    while _running():
+        try:
+            gdb.execute("continue", to_string=True)
+        except gdb.error:
+            break
+
+
+def main():
+    gdb.events.exited.connect(_on_exit)
+    gdb.events.stop.connect(_on_stop)
+    for command in (
+        "set pagination off",
+        "set confirm off",
+        "set width 0",
+        f"set print elements {MAX_ITEMS}",
+        "skip -gfi /usr/*",
+        "break main",
+    ):
+        gdb.execute(command, to_string=True)
+    gdb.execute(
+        "run < {} > {} 2> {}".format(
+            os.environ["DSAVISUAL_TRACE_STDIN"],
+            os.environ["DSAVISUAL_TRACE_STDOUT"],
+            os.environ["DSAVISUAL_TRACE_STDERR"],
+        ),
+        to_string=True,
+    )
+    with open(os.environ["DSAVISUAL_TRACE_FILE"], "w") as out:
+        truncated = trace(out)
+        finish()
+        returncode = _status["exit_code"]
+        if returncode is None and _status["signal"]:
+            returncode = -signal.Signals[_status["signal"]].value
+        out.write(json.dumps({"returncode": returncode, "truncated": truncated}))
+        out.write("\n")
+
+
+main()
@@ -0,0 +1,67 @@
+/*
+ * Basic block log for C/C++ programs traced by native_tracer.py.
+ *
+ * Programs are built with -fsanitize-coverage=trace-pc, which makes gcc
+ * call __sanitizer_cov_trace_pc() at the start of every basic block, and
+ * with -finstrument-functions, which calls __cyg_profile_func_exit() as
+ * each of the program's functions returns. Both append an address to
+ * DSAVISUAL_TRACE_FILE: where the block goes on after the hook, or where
+ * the caller resumes. The file is mapped into memory so that the log
+ * survives a crashing program. The first word counts the addresses
+ * logged; only the first DSAVISUAL_TRACE_MAX are kept.
+ *
+ * Built on its own, without those flags, and linked in.
+ */
+#include <fcntl.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+static volatile uint64_t *trace;
+static uint64_t capacity;
+
+__attribute__((constructor)) static void trace_open(void)
+{
+    const char *path = getenv("DSAVISUAL_TRACE_FILE");
+    const char *max = getenv("DSAVISUAL_TRACE_MAX");
+    if (path == NULL || max == NULL)
+        return;
+    capacity = strtoull(max, NULL, 10);
+    size_t size = (capacity + 1) * sizeof(uint64_t);
+    int fd = open(path, O_RDWR | O_CREAT | O_TRUNC, 0600);
+    if (fd < 0)
+        return;
+    if (ftruncate(fd, size) == 0) {
+        void *map = mmap(NULL, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        if (map != MAP_FAILED)
+            trace = map;
+    }
+    close(fd);
+}
+
+static inline void trace_log(uintptr_t address)
+{
+    if (trace == NULL)
+        return;
+    uint64_t n = ++trace[0];
+    if (n <= capacity)
+        trace[n] = address;
+}
+
+void __sanitizer_cov_trace_pc(void)
+{
+    trace_log((uintptr_t)__builtin_return_address(0));
+}
+
+void __cyg_profile_func_enter(void *function, void *call_site)
+{
+    (void)function;
+    (void)call_site;
+}
+
+void __cyg_profile_func_exit(void *function, void *call_site)
+{
+    (void)function;
+    trace_log((uintptr_t)call_site);
+}
@@ -0,0 +1,111 @@
+"""
+Call-stack sampling of C and C++ programs with ``perf``.
+
+``PerfSampler`` is used like a ``native_tracer`` backend: the program is
+built at the requested optimization level with frame pointers, run under
+``perf record`` sampling its user-space stacks every
+``SAMPLE_INTERVAL_US``, and the samples are folded into a ``flamegraph``
+profile. It needs ``perf`` on the ``PATH`` and a
+``kernel.perf_event_paranoid`` of 2 or lower, which lets users sample their
+own processes. perf samples in the kernel, so the program itself runs at
+full speed.
+"""
+import os
+import re
+import shutil
+import subprocess
+
+from . import conf, flamegraph
+
+# A callchain line of ``perf script``: address, symbol and offset, object.
+_FRAME = re.compile(r"^\s+[0-9a-f]+\s+(.+?)(?:\+0x[0-9a-f]+)?(?:\s+\(.*\))?$")
+
+
+def available() -> bool:
+    return shutil.which("perf") is not None
+
+
+def fold(script: str, interval_us: int) -> dict:
+    """
+    The ``flamegraph`` profile of the output of ``perf script``.
+
+    perf lists each sample's frames innermost first, down to the C
+    runtime's; those below ``main`` are dropped.
+    """
+    counts = {}
+    for sample in script.split("\n\n"):
+        stack = []
+        for line in sample.splitlines():
+            frame = _FRAME.match(line)
+            if frame is not None:
+                stack.append(frame.group(1))
+        stack.reverse()
+        if "main" in stack:
+            stack = stack[stack.index("main"):]
+        if stack:
+            stack = tuple(stack)
+            counts[stack] = counts.get(stack, 0) + 1
+    return flamegraph.from_counts(counts, interval_us)
+
+
+class PerfSampler:
+    """Runs the program under ``perf record`` and folds its call stacks."""
+
+    name = "perf"
+    # Profiles are of the build as requested, not an unoptimized one.
+    optimized = True
+
+    @staticmethod
+    def compile_flags(language):
+        return ["-g", "-fno-omit-frame-pointer"]
+
+    @staticmethod
+    def identity():
+        return "perf"
+
+    @staticmethod
+    def link_inputs(workdir, timeout):
+        return []
+
+    @staticmethod
+    def after_build(workdir, source):
+        pass
+
+    def __init__(self, artifact_dir, source, run_dir, max_steps, timeout):
+        self.run_dir = run_dir
+        self.timeout = timeout
+        self.interval_us = conf.get("SAMPLE_INTERVAL_US")
+        self.steps = []
+        self.truncated = None
+        self.profile = flamegraph.from_counts({}, self.interval_us)
+
+    def _data(self):
+        return os.path.join(self.run_dir, "perf.data")
+
+    def command(self, command):
+        frequency = max(1, round(1_000_000 / self.interval_us))
+        return [
+            "perf", "record", "-q", "-e", "cpu-clock:u", "-F", str(frequency),
+            "--call-graph", "fp", "-o", self._data(), "--", *command,
+        ]
+
+    def feed(self, stdin):
+        return stdin
+
+    def env(self):
+        return None
+
+    def finish(self, returncode, stdout, stderr, output_truncated):
+        """Returns the program's outcome unchanged; sets ``profile``."""
+        try:
+            script = subprocess.run(
+                ["perf", "script", "-i", self._data(), "-F", "ip,sym"],
+                capture_output=True,
+                text=True,
+                timeout=self.timeout,
+                check=True,
+            ).stdout
+        except (OSError, subprocess.SubprocessError):
+            script = ""
+        self.profile = fold(script, self.interval_us)
+        return returncode, stdout, stderr, output_truncated
@@ -0,0 +1,353 @@
+"""
+Line tracing for C and C++ programs.
+
+Traced programs return Python-style ``{"line": ..., "locals": {...}}``
+steps, from one of two backends:
+
+- ``GdbBackend`` runs the program under gdb, which single-steps through
+  the lines of the submitted source and snapshots arguments and locals
+  (see ``native/gdb_stepper.py``). Stepping is slow, so it stops after the
+  step cap or half the timeout and the program finishes untraced.
+- ``InstrumentBackend`` builds the program with gcc's
+  ``-fsanitize-coverage=trace-pc`` and ``-finstrument-functions`` and links
+  in ``native/trace_rt.c``, which logs every basic block run and every
+  return to a caller. These are mapped to source lines with a table read
+  from ``objdump`` at build time. It runs close to full speed, but records
+  no locals.
+
+``NATIVE_TRACE_BACKEND`` picks one; "auto" uses gdb where it is installed.
+Traced builds are always unoptimized.
+"""
+import array
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+
+from . import conf
+
+NATIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "native")
+RUNTIME_SOURCE = os.path.join(NATIVE_DIR, "trace_rt.c")
+GDB_STEPPER = os.path.join(NATIVE_DIR, "gdb_stepper.py")
+
+# Share of the timeout gdb may spend stepping before the program runs free.
+GDB_STEPPING_SHARE = 0.5
+
+# Addresses logged per step the instrumented trace may return; most lines
+# take one to three, the rest allows for blocks in library templates (and
+# a floor for the ones run before the first steps, e.g. in constructors).
+LOG_ENTRIES_PER_STEP = 16
+MIN_LOG_ENTRIES = 65536
+
+_INSTRUCTION = re.compile(r"^\s+([0-9a-f]+):\s")
+_CALL = re.compile(r"\s(?:call|callq|bl)\s+[0-9a-f]+ <([^>+@]+)>$")
+_FUNCTION = re.compile(r"^[0-9a-f]+ <([^>]+)>:$")
+_LOCATION = re.compile(r"^(.+):(\d+)(?: \(discriminator \d+\))?$")
+
+
+def _files_digest(*paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def get_backend():
+    """The tracing backend class to use, per ``NATIVE_TRACE_BACKEND``."""
+    name = conf.get("NATIVE_TRACE_BACKEND")
+    if name not in ("auto", "gdb", "instrument"):
+        raise ValueError(f"Unknown native trace backend: {name}")
+    if name != "instrument" and shutil.which("gdb") is not None:
+        return GdbBackend
+    return InstrumentBackend
+
+
+def _read_capped(path, limit):
+    """Text of the file at ``path`` up to ``limit`` bytes, and whether it was cut."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(limit + 1 if limit else -1)
+    except FileNotFoundError:
+        return "", False
+    truncated = bool(limit) and len(data) > limit
+    if truncated:
+        data = data[:limit]
+    return data.decode("utf-8", errors="replace"), truncated
+
+
+class GdbBackend:
+    """Steps through the program in gdb, recording lines and locals."""
+
+    name = "gdb"
+    optimized = False
+
+    @staticmethod
+    def compile_flags(language):
+        return ["-O0", "-g"]
+
+    @staticmethod
+    def identity():
+        return _files_digest(GDB_STEPPER)
+
+    @staticmethod
+    def link_inputs(workdir, timeout):
+        return []
+
+    @staticmethod
+    def after_build(workdir, source):
+        pass
+
+    def __init__(self, artifact_dir, source, run_dir, max_steps, timeout):
+        self.source = source
+        self.run_dir = run_dir
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.steps = []
+        self.truncated = None
+
+    def _path(self, name):
+        return os.path.join(self.run_dir, name)
+
+    def command(self, command):
+        return ["gdb", "-nx", "-q", "-batch", "-x", GDB_STEPPER, *command]
+
+    def feed(self, stdin):
+        """The program reads ``stdin`` from a file; gdb itself gets none."""
+        with open(self._path("stdin"), "wb") as f:
+            f.write(stdin)
+        return b""
+
+    def env(self):
+        return {
+            "DSAVISUAL_TRACE_FILE": self._path("trace.ndjson"),
+            "DSAVISUAL_TRACE_STDIN": self._path("stdin"),
+            "DSAVISUAL_TRACE_SOURCE": self.source,
+            "DSAVISUAL_TRACE_MAX": str(self.max_steps),
+            "DSAVISUAL_TRACE_MAX_ITEMS": str(conf.get("TRACE_MAX_ITEMS")),
+            "DSAVISUAL_TRACE_SECONDS": str(self.timeout * GDB_STEPPING_SHARE),
+            "DSAVISUAL_TRACE_STDOUT": self._path("stdout"),
+            "DSAVISUAL_TRACE_STDERR": self._path("stderr"),
+        }
+
+    def finish(self, returncode, stdout, stderr, output_truncated):
+        """
+        The program's ``(returncode, stdout, stderr, output_truncated)``,
+        given gdb's; sets ``steps`` and ``truncated``.
+        """
+        status = None
+        try:
+            with open(self._path("trace.ndjson")) as f:
+                for line in f:
+                    event = json.loads(line)
+                    if "line" in event:
+                        self.steps.append(event)
+                    else:
+                        status = event
+        except (FileNotFoundError, ValueError):
+            pass
+        if status is None or status["returncode"] is None:
+            # gdb itself failed, or the stepper was stopped by a limit.
+            return returncode, stdout, stderr, output_truncated
+        self.truncated = status["truncated"]
+        limit = conf.get("OUTPUT_MAX_BYTES")
+        stdout, stdout_cut = _read_capped(self._path("stdout"), limit)
+        stderr, stderr_cut = _read_capped(self._path("stderr"), limit)
+        return status["returncode"], stdout, stderr, stdout_cut or stderr_cut
+
+
+class InstrumentBackend:
+    """Logs the blocks and returns the program runs and maps them to lines."""
+
+    name = "instrument"
+    optimized = False
+
+    @staticmethod
+    def compile_flags(language):
+        # Line tables only, in DWARF 4 as older binutils misread gcc's
+        # DWARF 5 file numbers. Library headers get no function hooks.
+        return [
+            "-O0", "-g1", "-gdwarf-4", "-no-pie",
+            "-fsanitize-coverage=trace-pc",
+            "-finstrument-functions",
+            "-finstrument-functions-exclude-file-list=/usr/",
+        ]
+
+    @staticmethod
+    def identity():
+        # The line tables are built here too.
+        return _files_digest(RUNTIME_SOURCE, __file__)
+
+    @staticmethod
+    def link_inputs(workdir, timeout):
+        """Build the logging runtime in ``workdir`` for linking."""
+        result = subprocess.run(
+            ["gcc", "-c", "-O2", RUNTIME_SOURCE, "-o", "trace_rt.o"],
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+            cwd=workdir,
+        )
+        if result.returncode != 0:
+            raise OSError(f"Could not build the trace runtime:\n{result.stderr}")
+        return ["trace_rt.o"]
+
+    @staticmethod
+    def after_build(workdir, source):
+        """Store the line table of ``block_lines`` in ``lines.json``."""
+        with open(os.path.join(workdir, "lines.json"), "w") as f:
+            json.dump(block_lines(os.path.join(workdir, "main"), source), f)
+
+    def __init__(self, artifact_dir, source, run_dir, max_steps, timeout):
+        self.artifact_dir = artifact_dir
+        self.run_dir = run_dir
+        self.max_steps = max_steps
+        self.capacity = max(max_steps * LOG_ENTRIES_PER_STEP, MIN_LOG_ENTRIES)
+        file_bytes = conf.get("LIMIT_FILE_BYTES")
+        if file_bytes:
+            # The log must not trip RLIMIT_FSIZE.
+            self.capacity = min(self.capacity, file_bytes // 8 - 1)
+        self.steps = []
+        self.truncated = None
+
+    def command(self, command):
+        return command
+
+    def feed(self, stdin):
+        return stdin
+
+    def env(self):
+        return {
+            "DSAVISUAL_TRACE_FILE": os.path.join(self.run_dir, "trace.bin"),
+            "DSAVISUAL_TRACE_MAX": str(self.capacity),
+        }
+
+    def finish(self, returncode, stdout, stderr, output_truncated):
+        """Sets ``steps`` and ``truncated``; the run's results are unchanged."""
+        log = array.array("Q")
+        try:
+            with open(os.path.join(self.run_dir, "trace.bin"), "rb") as f:
+                log.frombytes(f.read())
+        except FileNotFoundError:
+            # The program died before the runtime started.
+            return returncode, stdout, stderr, output_truncated
+        if not log:
+            return returncode, stdout, stderr, output_truncated
+        with open(os.path.join(self.artifact_dir, "lines.json")) as f:
+            table = {int(address): lines for address, lines in json.load(f)}
+
+        logged = log[0]
+        steps = self.steps
+        last_address = last_line = None
+        for address in log[1:1 + min(logged, self.capacity)]:
+            lines = table.get(address)
+            if not lines:
+                continue
+            # Running a block again, or an earlier one, on the same line is
+            # a new iteration of a loop on that line: a new step.
+            repeat = last_address is not None and address <= last_address
+            for n, line in enumerate(lines):
+                if line == last_line and not (n == 0 and repeat):
+                    continue
+                if len(steps) >= self.max_steps:
+                    self.truncated = "max_steps"
+                    return returncode, stdout, stderr, output_truncated
+                steps.append({"line": line, "locals": {}})
+                last_line = line
+            last_address = address
+        if logged > self.capacity:
+            self.truncated = "max_steps"
+        return returncode, stdout, stderr, output_truncated
+
+
+def block_lines(program, source):
+    """
+    ``[[address, [line, ...]], ...]`` for the instrumented ``program``.
+
+    The addresses are those the runtime logs: where a block goes on after
+    its call to the trace hook, and where a caller resumes after calling
+    one of the program's functions. Each runs the listed lines of
+    ``source``, in order, until the next block or call of a function in
+    ``source``; a caller resuming mid-line does not repeat that line, and
+    function prologues and epilogues have none.
+    """
+    dump = subprocess.run(
+        ["objdump", "-d", "-l", "--no-show-raw-insn", program],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # (address, line in source or None, whether a line table row starts
+    # there, called function or None) per instruction, and the functions
+    # with code from ``source``.
+    instructions, own = [], set()
+    function, line, row = None, None, False
+    for text in dump.splitlines():
+        instruction = _INSTRUCTION.match(text)
+        if instruction is not None:
+            call = _CALL.search(text)
+            instructions.append((
+                int(instruction.group(1), 16), line, row, call and call.group(1),
+            ))
+            if line is not None:
+                own.add(function)
+            row = False
+            continue
+        location = _LOCATION.match(text)
+        if location is not None:
+            in_source = os.path.basename(location.group(1)) == source
+            line = int(location.group(2)) if in_source else None
+            row = True
+            continue
+        header = _FUNCTION.match(text)
+        if header is not None:
+            function, line, row = header.group(1), None, False
+            instructions.append((None, None, False, None))
+    own.discard(None)
+
+    # Only lines with a row of their own count: code without one, like a
+    # return block shared by several return statements, just continues
+    # the row before it.
+    entries = []
+    current = None
+    skip = None  # The line a caller resumes on, not repeated.
+    first = None  # A row starting at the hook call itself.
+    start_next = False
+    returned = False
+    entered = False
+    for address, line, row, called in instructions:
+        if address is None:
+            current, start_next, returned = None, False, False
+            continue
+        if entered:
+            # The body goes on on the function's first line, unless a row
+            # starts here.
+            row, entered = True, False
+        if start_next:
+            # The block after a function's exit hook is its epilogue.
+            current = None if returned else []
+            if current is not None:
+                entries.append([address, current])
+                if first is not None:
+                    current.append(first)
+            start_next = returned = False
+        if called == "__sanitizer_cov_trace_pc":
+            current, skip, start_next = None, None, True
+            first = line if row else None
+        elif called == "__cyg_profile_func_enter":
+            # Lines so far were the prologue.
+            if current is not None:
+                current.clear()
+                entered = True
+        elif called == "__cyg_profile_func_exit":
+            current, returned = None, True
+        elif called in own:
+            current, skip, start_next, first = None, line, True, None
+        elif current is not None and row and line is not None and line != skip and (
+            not current or current[-1] != line
+        ):
+            current.append(line)
+            skip = None
+    return [entry for entry in entries if entry[1]]
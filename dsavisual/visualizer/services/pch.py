@@ -0,0 +1,144 @@
+"""
+Precompiled headers for C/C++ programs.
+
+Nearly every submission starts with the same standard includes
+(``<bits/stdc++.h>``, or ``<iostream>``, ``<vector>``...), and parsing them
+is most of its compile time. ``header_for()`` looks up a precompiled header
+for a program's leading include set, to be passed as ``-include``; the
+compiler then loads the ``.gch`` next to it instead of parsing the headers.
+A set without one gets it built in the background once it has been seen
+``PCH_MIN_USES`` times, so no request waits for a multi-second PCH build.
+
+PCHs are only valid for the exact compiler and flags they were built with,
+which are part of the key. They live in their own ``CompileCache``
+(``PCH_CACHE_DIR``), as a single PCH can be larger than all the compiled
+programs together.
+"""
+import os
+import re
+import subprocess
+import tempfile
+import threading
+
+from . import compile_cache, conf
+
+_INCLUDE = re.compile(r"#\s*include\s*<([^<>\s]+)>\s*(//.*)?$")
+
+# Language -> the -x type of its headers.
+HEADER_TYPES = {"c": "c-header", "cpp": "c++-header"}
+
+# Include sets seen so far and how often, so that one-off sets never get
+# a PCH. Cleared when it grows past this many entries.
+_MAX_TRACKED = 10000
+
+_lock = threading.Lock()
+_uses = {}
+_building = set()
+_failed = set()
+
+
+def leading_includes(code):
+    """
+    The ``#include <...>`` lines at the top of ``code``, in order.
+
+    Blank lines and comments may come between them; anything else (code,
+    macros, quoted includes) ends the set, since the PCH is included first.
+    """
+    includes = []
+    in_comment = False
+    for line in code.splitlines():
+        stripped = line.strip()
+        if in_comment:
+            in_comment = "*/" not in stripped
+            continue
+        if not stripped or stripped.startswith("//"):
+            continue
+        if stripped.startswith("/*"):
+            in_comment = "*/" not in stripped
+            continue
+        match = _INCLUDE.match(stripped)
+        if match is None:
+            break
+        includes.append(match.group(1))
+    return tuple(dict.fromkeys(includes))
+
+
+def header_for(language, compiler, flags, code):
+    """
+    Path of a precompiled header for ``code``'s leading includes, or ``None``.
+
+    ``None`` when there is no usable PCH yet; one may then be started in
+    the background for later compiles.
+    """
+    includes = leading_includes(code)
+    if language not in HEADER_TYPES or not includes:
+        return None
+    cache = get_cache()
+    key = cache.make_key(
+        language, compile_cache.compiler_identity(compiler), *flags, "\0", *includes
+    )
+    path = cache.get(key)
+    if path is not None:
+        return os.path.join(path, "pch.h")
+    with _lock:
+        if key in _building or key in _failed:
+            return None
+        if len(_uses) >= _MAX_TRACKED:
+            _uses.clear()
+            _failed.clear()
+        _uses[key] = _uses.get(key, 0) + 1
+        if _uses[key] < conf.get("PCH_MIN_USES"):
+            return None
+        _building.add(key)
+    threading.Thread(
+        target=_build, args=(cache, key, language, compiler, flags, includes),
+        daemon=True,
+    ).start()
+    return None
+
+
+def _build(cache, key, language, compiler, flags, includes):
+    def build(workdir):
+        with open(os.path.join(workdir, "pch.h"), "w") as f:
+            f.writelines(f"#include <{name}>\n" for name in includes)
+        result = subprocess.run(
+            [compiler, "-x", HEADER_TYPES[language], *flags, "pch.h", "-o", "pch.h.gch"],
+            capture_output=True,
+            text=True,
+            timeout=conf.get("PCH_BUILD_TIMEOUT"),
+            cwd=workdir,
+            env=compile_cache.compiler_env(workdir),
+        )
+        if result.returncode != 0:
+            raise compile_cache.CompilationFailed(result.stderr)
+
+    try:
+        cache.get_or_build(key, build)
+    except (compile_cache.CompilationFailed, OSError, subprocess.SubprocessError):
+        # E.g. a header that does not exist; the program's own compile
+        # reports that.
+        with _lock:
+            _failed.add(key)
+    finally:
+        with _lock:
+            _building.discard(key)
+            _uses.pop(key, None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide precompiled header cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = compile_cache.CompileCache(
+                root=conf.get("PCH_CACHE_DIR") or os.path.join(
+                    tempfile.gettempdir(), "dsavisual-pch-cache"
+                ),
+                max_bytes=conf.get("PCH_CACHE_MAX_BYTES"),
+                work_root=compile_cache.work_root(),
+            )
+    return _cache
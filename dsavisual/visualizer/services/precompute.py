@@ -0,0 +1,137 @@
+"""
+Precomputed traces for the final code snippets of seeded concepts.
+
+A concept's ``is_final_code`` snippets are run once on the concept's
+``VisualizationConfig.default_input`` and the result is stored gzip
+compressed in ``PrecomputedTrace``, so the editorial page can fetch the
+trace instead of re-running the code. Traces are recomputed by the
+``precompute_traces`` command and, through ``visualizer.signals``, on the
+job queue whenever a snippet or default input changes.
+"""
+import gzip
+import hashlib
+import json
+import logging
+
+from django.db import close_old_connections
+
+from concepts.models import CodeSnippet
+
+from ..models import PrecomputedTrace
+from . import jobs
+from .executor import COMPILED_LANGUAGES, EXECUTOR_VERSION, execute_code, is_transient
+
+logger = logging.getLogger(__name__)
+
+
+def is_supported(snippet):
+    return snippet.language == "python" or snippet.language in COMPILED_LANGUAGES
+
+
+def default_input(snippet):
+    """The default input of the snippet's concept, or ``None`` if it has none."""
+    config = getattr(snippet.section.concept, "visualization", None)
+    return config.default_input if config is not None else None
+
+
+def source_hash(snippet, input_data):
+    """Hash of everything a snippet's trace depends on."""
+    material = [EXECUTOR_VERSION, snippet.language, snippet.code, input_data]
+    encoded = json.dumps(material, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _execution_kwargs(snippet, input_data):
+    return {
+        "code": snippet.code,
+        "language": snippet.language,
+        "input_data": input_data,
+    }
+
+
+def save_trace(snippet, digest, result):
+    """
+    Store ``result`` as the snippet's trace.
+
+    Returns False, storing nothing, for timeouts and executor failures.
+    """
+    if is_transient(result):
+        return False
+    PrecomputedTrace.objects.update_or_create(
+        snippet=snippet,
+        defaults={
+            "source_hash": digest,
+            "data": gzip.compress(json.dumps(result).encode("utf-8")),
+        },
+    )
+    return True
+
+
+def precompute(snippet, force=False):
+    """
+    Compute the trace of ``snippet`` now unless it is up to date.
+
+    Returns ``"skipped"``, ``"fresh"``, ``"computed"`` or ``"failed"``.
+    """
+    if not is_supported(snippet):
+        return "skipped"
+    input_data = default_input(snippet)
+    digest = source_hash(snippet, input_data)
+    stored = PrecomputedTrace.objects.filter(snippet=snippet).first()
+    if stored is not None and stored.source_hash == digest and not force:
+        return "fresh"
+    result = execute_code(**_execution_kwargs(snippet, input_data))
+    return "computed" if save_trace(snippet, digest, result) else "failed"
+
+
+def invalidate(snippet):
+    """Drop the stored trace of ``snippet`` and recompute it in the background."""
+    PrecomputedTrace.objects.filter(snippet=snippet).delete()
+    if not snippet.is_final_code or not is_supported(snippet):
+        return
+    input_data = default_input(snippet)
+    digest = source_hash(snippet, input_data)
+
+    def on_done(result):
+        try:
+            # The snippet or input may have changed again while queued.
+            current = CodeSnippet.objects.filter(pk=snippet.pk).first()
+            if current is not None and (
+                source_hash(current, default_input(current)) == digest
+            ):
+                save_trace(current, digest, result)
+        finally:
+            close_old_connections()
+
+    try:
+        jobs.get_scheduler().submit(
+            on_done=on_done, **_execution_kwargs(snippet, input_data)
+        )
+    except jobs.QueueFull:
+        logger.warning(
+            "Execution queue full; run precompute_traces to rebuild the "
+            "trace of snippet %s", snippet.pk,
+        )
+
+
+def stored_trace(concept_slug, language):
+    """
+    The up-to-date ``PrecomputedTrace`` of a concept's final snippet in
+    ``language``, or ``None``.
+    """
+    trace = (
+        PrecomputedTrace.objects
+        .select_related("snippet__section__concept__visualization")
+        .filter(
+            snippet__section__concept__slug=concept_slug,
+            snippet__language=language,
+            snippet__is_final_code=True,
+        )
+        .order_by("snippet__display_order")
+        .first()
+    )
+    if trace is None:
+        return None
+    if trace.source_hash != source_hash(trace.snippet, default_input(trace.snippet)):
+        return None
+    return trace
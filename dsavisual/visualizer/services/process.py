@@ -0,0 +1,234 @@
+"""
+Subprocess plumbing for sandboxed programs.
+
+Output is read incrementally into ``OutputBuffer``s that keep at most a
+fixed number of bytes per stream: a program printing past the cap is
+killed instead of filling the server's memory.
+"""
+import os
+import queue
+import subprocess
+import threading
+import time
+
+# Extra descriptors cannot be handed to child processes on Windows; there the
+# tracer falls back to prefixed event lines on stdout.
+CHANNEL_SUPPORTED = os.name != "nt"
+
+# Bytes requested per read from a child's output pipes.
+CHUNK_SIZE = 64 * 1024
+
+
+class OutputBuffer:
+    """
+    Collects up to ``limit`` bytes (``None``: unbounded) of one output stream.
+
+    Data past the limit is dropped, ``truncated`` is set and ``on_overflow``
+    (typically killing the child) is called once.
+    """
+
+    def __init__(self, limit=None, on_overflow=None):
+        self.limit = limit
+        self.on_overflow = on_overflow
+        self.truncated = False
+        self._chunks = []
+        self._size = 0
+
+    def add(self, data):
+        """Keep ``data``, or what fits of it; returns False once full."""
+        if self.truncated:
+            return False
+        if self.limit is not None and self._size + len(data) > self.limit:
+            data = data[:self.limit - self._size]
+            self.truncated = True
+        self._chunks.append(data)
+        self._size += len(data)
+        if self.truncated and self.on_overflow is not None:
+            self.on_overflow()
+        return not self.truncated
+
+    def text(self):
+        return b"".join(self._chunks).decode("utf-8", errors="replace")
+
+
+def read_into(stream, buffer):
+    """Read ``stream`` chunk by chunk into ``buffer`` until EOF or it is full."""
+    with stream:
+        while True:
+            data = stream.read1(CHUNK_SIZE)
+            if not data or not buffer.add(data):
+                return
+
+
+def _kill(child):
+    try:
+        child.kill()
+    except OSError:
+        pass
+
+
+def write_input(stream, data):
+    """Write ``data`` to a child's stdin and close it; the child may not read it all."""
+    try:
+        with stream:
+            stream.write(data)
+    except (BrokenPipeError, ValueError):
+        pass
+
+
+def communicate(child, timeout, limit=None, input=None):
+    """
+    Wait for ``child`` like ``Popen.communicate()``, with bounded output.
+
+    ``child`` must have binary stdout and stderr pipes. Each is read on a
+    background thread into an ``OutputBuffer`` of ``limit`` bytes, and
+    passing the limit kills the child. ``input`` is written to its stdin
+    pipe, if it has one, on another thread. Returns ``(stdout, stderr,
+    truncated)`` as text; raises ``subprocess.TimeoutExpired`` after
+    killing the child once ``timeout`` seconds pass.
+    """
+    deadline = time.monotonic() + timeout
+    buffers = [OutputBuffer(limit, lambda: _kill(child)) for _ in range(2)]
+    if child.stdin is not None:
+        threading.Thread(
+            target=write_input, args=(child.stdin, input or b""), daemon=True
+        ).start()
+    threads = []
+    for stream, buffer in zip((child.stdout, child.stderr), buffers):
+        thread = threading.Thread(target=read_into, args=(stream, buffer), daemon=True)
+        thread.start()
+        threads.append(thread)
+    try:
+        child.wait(timeout)
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+            if thread.is_alive():
+                # A grandchild still holds the pipe open.
+                raise subprocess.TimeoutExpired(child.args, timeout)
+    except subprocess.TimeoutExpired:
+        _kill(child)
+        child.wait()
+        raise
+    stdout, stderr = buffers
+    return stdout.text(), stderr.text(), stdout.truncated or stderr.truncated
+
+
+class TracedProcess:
+    """
+    A child process writing trace events to its own pipe.
+
+    The event channel, stdout and stderr are all drained on background
+    threads, so neither side can block on a full pipe and ``events()`` can
+    enforce a deadline while the program is still running. Past
+    ``output_limit`` bytes of stdout or stderr the child is killed and
+    ``output_truncated`` is set. ``env`` is the child's environment
+    (default: the server's).
+    """
+
+    def __init__(self, command, stdin_data, event_prefix, cwd=None,
+                 preexec_fn=None, output_limit=None, env=None):
+        # Phase durations in seconds, for ``metrics.PhaseTimer``.
+        self.spawn_seconds = 0.0
+        self.write_seconds = 0.0
+        self._events = queue.Queue()
+        self._stdout = OutputBuffer(output_limit, self.kill)
+        self._stderr = OutputBuffer(output_limit, self.kill)
+        self._event_prefix = event_prefix.encode("utf-8")
+        self._event_marker = self._event_prefix + b"{"
+
+        pass_fds = ()
+        if CHANNEL_SUPPORTED:
+            read_fd, write_fd = os.pipe()
+            command = [*command, "--channel-fd", str(write_fd)]
+            pass_fds = (write_fd,)
+        start = time.perf_counter()
+        try:
+            self.process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                pass_fds=pass_fds,
+                cwd=cwd,
+                preexec_fn=preexec_fn,
+                env=env,
+            )
+        finally:
+            if CHANNEL_SUPPORTED:
+                os.close(write_fd)
+        self.spawn_seconds = time.perf_counter() - start
+
+        self._threads = [
+            self._start(self._drain, self.process.stdout, self._stdout,
+                        not CHANNEL_SUPPORTED),
+            self._start(self._drain, self.process.stderr, self._stderr, False),
+            self._start(self._feed, stdin_data),
+        ]
+        if CHANNEL_SUPPORTED:
+            self._threads.append(
+                self._start(self._read_channel, os.fdopen(read_fd, "rb"))
+            )
+
+    @staticmethod
+    def _start(target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    def _feed(self, data):
+        start = time.perf_counter()
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.write_seconds = time.perf_counter() - start
+
+    def _read_channel(self, channel):
+        with channel:
+            for line in channel:
+                self._events.put(line.decode("utf-8"))
+        self._events.put(None)
+
+    def _drain(self, stream, buffer, route_events):
+        if not route_events:
+            read_into(stream, buffer)
+            return
+        for line in stream:
+            if line.startswith(self._event_marker):
+                self._events.put(line[len(self._event_prefix):].decode("utf-8"))
+            elif not buffer.add(line):
+                break
+        self._events.put(None)
+
+    @property
+    def output_truncated(self):
+        return self._stdout.truncated or self._stderr.truncated
+
+    def events(self, deadline):
+        """
+        Yield raw event lines until the channel closes.
+
+        Raises ``subprocess.TimeoutExpired`` once ``deadline`` (a
+        ``time.monotonic()`` value) passes.
+        """
+        while True:
+            try:
+                line = self._events.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise subprocess.TimeoutExpired(self.process.args, 0)
+            if line is None:
+                return
+            yield line
+
+    def finish(self, deadline):
+        """Wait for exit; returns ``(returncode, stdout, stderr)`` as text."""
+        returncode = self.process.wait(max(0, deadline - time.monotonic()))
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        return returncode, self._stdout.text(), self._stderr.text()
+
+    def kill(self):
+        if self.process.poll() is None:
+            _kill(self.process)
+            self.process.wait()
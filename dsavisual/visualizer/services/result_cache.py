@@ -0,0 +1,302 @@
+"""
+Cache of execution results for deterministic programs.
+
+Most executions are the unchanged default code of a seeded snippet run on
+its default input, so results are stored under a hash of the normalized
+code, language, input and every other execution option, plus
+``EXECUTOR_VERSION``. Programs that look non-deterministic (randomness,
+clocks, ...) are never cached, nor are runs in ``TIMING_MODES``, whose
+times differ from run to run, and callers can opt out per request. Python
+runs with a fixed hash seed (see ``sandbox.python_env``), so the order of
+sets of strings does not count as non-deterministic.
+
+The storage backend is pluggable: ``"locmem"`` (per process), ``"file"``
+(shared directory), ``"django"`` (a Django cache alias), or the dotted path
+of a class taking the same keyword arguments as ``LocMemBackend``.
+"""
+import ast
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.utils.module_loading import import_string
+
+from . import conf
+from .executor import EXECUTOR_VERSION, is_transient
+
+HIT = "HIT"
+MISS = "MISS"
+BYPASS = "BYPASS"
+
+# Python programs importing any of these modules, or using any of these
+# builtins (``hash()`` of most objects is derived from their address, like
+# ``id()``) or functions (``os.getpid``...), are treated as
+# non-deterministic and not cached.
+NONDETERMINISTIC_MODULES = {"random", "time", "datetime", "uuid", "secrets"}
+NONDETERMINISTIC_BUILTINS = {"id", "hash"}
+NONDETERMINISTIC_FUNCTIONS = {"urandom", "getpid"}
+
+# Execution modes whose results are timings, never cached.
+TIMING_MODES = {"profile", "sample"}
+
+# Sources in other languages matching these are treated the same way.
+NONDETERMINISTIC_PATTERNS = {
+    "c": re.compile(r"\b(?:s?rand|random|time|clock|getpid)\s*\("),
+    "cpp": re.compile(
+        r"\b(?:s?rand|random|time|clock|getpid)\s*\(|<random>|<chrono>"
+    ),
+    "java": re.compile(
+        r"\b(?:Random|ThreadLocalRandom|UUID|Instant|LocalDateTime|LocalDate)\b"
+        r"|Math\.random|currentTimeMillis|nanoTime"
+    ),
+}
+
+
+def normalize_code(code):
+    """Canonical form of ``code`` for hashing: LF newlines, no outer blank lines."""
+    return code.replace("\r\n", "\n").replace("\r", "\n").strip("\n")
+
+
+def _imports_by_name(node):
+    if not (isinstance(node, ast.Call) and node.args):
+        return False
+    func = node.func
+    name = func.id if isinstance(func, ast.Name) else getattr(func, "attr", None)
+    first = node.args[0]
+    return name in ("__import__", "import_module") and (
+        isinstance(first, ast.Constant) and isinstance(first.value, str)
+    )
+
+
+def _python_is_deterministic(code):
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return True  # fails the same way every time
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules = [node.module or ""]
+        elif _imports_by_name(node):
+            # __import__("random"), importlib.import_module("time")...
+            modules = [node.args[0].value]
+        elif isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load) and node.id in (
+                NONDETERMINISTIC_BUILTINS | NONDETERMINISTIC_FUNCTIONS
+            ):
+                return False
+            continue
+        elif isinstance(node, ast.Attribute):
+            if node.attr in NONDETERMINISTIC_FUNCTIONS:
+                return False
+            continue
+        else:
+            continue
+        if any(m.partition(".")[0] in NONDETERMINISTIC_MODULES for m in modules):
+            return False
+    return True
+
+
+def is_deterministic(code, language):
+    if language == "python":
+        return _python_is_deterministic(code)
+    pattern = NONDETERMINISTIC_PATTERNS.get(language)
+    return pattern is None or not pattern.search(code)
+
+
+def make_key(kwargs):
+    """Hash of an ``execute_code`` call, or ``None`` if it must not be cached."""
+    language = kwargs.get("language", "python")
+    if kwargs.get("mode") in TIMING_MODES:
+        return None
+    if not is_deterministic(kwargs["code"], language):
+        return None
+    material = dict(kwargs, code=normalize_code(kwargs["code"]))
+    material["executor_version"] = EXECUTOR_VERSION
+    material["trace_limits"] = [
+        conf.get(name)
+        for name in ("TRACE_MAX_STEPS", "TRACE_MAX_BYTES", "TRACE_MAX_ITEMS")
+    ]
+    encoded = json.dumps(material, sort_keys=True, default=str)
+    return "exec:" + hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class LocMemBackend:
+    """In-process LRU bounded by entry count and total serialized size."""
+
+    def __init__(self, ttl, max_entries, max_bytes, location=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at, payload)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._delete(key)
+                return None
+            self._entries.move_to_end(key)
+            payload = entry[1]
+        return json.loads(payload)
+
+    def set(self, key, result):
+        payload = json.dumps(result)
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._delete(key)
+            self._entries[key] = (time.monotonic() + self.ttl, payload)
+            self._bytes += len(payload)
+            while (
+                len(self._entries) > self.max_entries
+                or self._bytes > self.max_bytes
+            ):
+                self._delete(next(iter(self._entries)))
+
+    def _delete(self, key):
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+
+class FileBackend:
+    """One JSON file per entry; recency is tracked through file mtimes."""
+
+    def __init__(self, ttl, max_entries, max_bytes, location=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.root = location or os.path.join(
+            tempfile.gettempdir(), "dsavisual-result-cache"
+        )
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, key.replace(":", "_") + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            # mtime is reset on every read, so "age" is time since last use.
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.unlink(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def set(self, key, result):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        os.replace(tmp_path, self._path(key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (
+            len(entries) > self.max_entries or total > self.max_bytes
+        ):
+            _, size, path = entries.pop(0)
+            total -= size
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+class DjangoCacheBackend:
+    """Stores results in a Django cache alias; bounds are that cache's."""
+
+    def __init__(self, ttl, max_entries, max_bytes, location=None):
+        from django.core.cache import caches
+
+        self.ttl = ttl
+        self.cache = caches[location or "default"]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, result):
+        self.cache.set(key, result, self.ttl)
+
+
+BACKENDS = {
+    "locmem": LocMemBackend,
+    "file": FileBackend,
+    "django": DjangoCacheBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the configured backend, or ``None`` when caching is off."""
+    global _backend
+    name = conf.get("RESULT_CACHE_BACKEND")
+    if not name:
+        return None
+    with _backend_lock:
+        if _backend is None:
+            backend_class = BACKENDS.get(name) or import_string(name)
+            _backend = backend_class(
+                ttl=conf.get("RESULT_CACHE_TTL"),
+                max_entries=conf.get("RESULT_CACHE_MAX_ENTRIES"),
+                max_bytes=conf.get("RESULT_CACHE_MAX_BYTES"),
+                location=conf.get("RESULT_CACHE_LOCATION"),
+            )
+    return _backend
+
+
+def lookup(kwargs, use_cache=True):
+    """
+    Look an ``execute_code`` call up in the cache.
+
+    Returns ``(key, result)``. ``key`` is ``None`` when the call bypasses
+    the cache; ``result`` is ``None`` on a miss.
+    """
+    backend = get_backend()
+    if backend is None or not use_cache:
+        return None, None
+    key = make_key(kwargs)
+    if key is None:
+        return None, None
+    return key, backend.get(key)
+
+
+def store(key, result):
+    """Remember ``result`` under ``key`` unless it reflects a transient failure."""
+    if key is None or is_transient(result):
+        return
+    get_backend().set(key, result)
+
+
+def execute_cached(execute, kwargs, use_cache=True):
+    """Run ``execute(**kwargs)`` through the cache; returns ``(result, status)``."""
+    key, result = lookup(kwargs, use_cache)
+    if result is not None:
+        return result, HIT
+    result = execute(**kwargs)
+    store(key, result)
+    return result, MISS if key else BYPASS
@@ -0,0 +1,229 @@
+"""
+Resource limits for sandboxed programs.
+
+``preexec(language, cpu_seconds)`` returns a ``preexec_fn`` that applies,
+in the child between fork and exec:
+
+- ``RLIMIT_CPU``: ``cpu_seconds`` (soft: the kernel sends SIGXCPU) and one
+  second more (hard: SIGKILL)
+- ``RLIMIT_AS``: ``LIMIT_MEMORY_BYTES``, except for Java, whose JVM reserves
+  far more address space than it uses; Java is run with ``-Xmx`` instead
+- ``RLIMIT_NPROC``: ``LIMIT_PROCESSES``
+- ``RLIMIT_FSIZE``: ``LIMIT_FILE_BYTES``
+- ``RLIMIT_CORE``: 0
+
+Limits can only be lowered: a value above the server's own hard limit is
+clamped to it. On platforms without ``resource`` nothing is applied.
+Python programs also run under ``python_env()``, and C/C++ programs with
+``native_env()``, which preloads ``native/alloc_rt.c`` to mark failed
+allocations in their stderr. ``limit_exceeded()`` tells from how a compiled
+program ended which limit, if any, stopped it, and ``signal_error()``
+describes a program killed by a signal.
+"""
+import functools
+import hashlib
+import math
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+
+from . import conf
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Values of a result's "limit_exceeded" and their descriptions.
+LIMITS = {
+    "cpu_time": "CPU time",
+    "memory": "memory",
+    "processes": "process count",
+    "file_size": "file size",
+    "output": "output size",
+    "steps": "step budget",
+}
+
+
+def limit_error(limit, detail=""):
+    """The ``error`` text of a result stopped by ``limit``."""
+    error = f"Limit exceeded: {LIMITS[limit]}"
+    return f"{error}\n{detail}" if detail else error
+
+
+def cpu_seconds(timeout):
+    """
+    CPU seconds a program with a wall-clock ``timeout`` may use.
+
+    ``LIMIT_CPU_SECONDS``, or by default 80% of the timeout, so that a
+    CPU-bound runaway is stopped by its rlimit before the timeout kills it.
+    """
+    configured = conf.get("LIMIT_CPU_SECONDS")
+    if configured:
+        return min(configured, math.ceil(timeout))
+    return max(1, int(timeout * 0.8))
+
+
+def _clamp(which, soft, hard):
+    _, current = resource.getrlimit(which)
+    if current != resource.RLIM_INFINITY:
+        soft, hard = min(soft, current), min(hard, current)
+    return which, (soft, hard)
+
+
+def rlimits(language, cpu=None):
+    """``[(resource, (soft, hard)), ...]`` for a program in ``language``."""
+    limits = [_clamp(resource.RLIMIT_CORE, 0, 0)]
+    if cpu:
+        limits.append(_clamp(resource.RLIMIT_CPU, cpu, cpu + 1))
+    memory = conf.get("LIMIT_MEMORY_BYTES")
+    if memory and language != "java":
+        limits.append(_clamp(resource.RLIMIT_AS, memory, memory))
+    processes = conf.get("LIMIT_PROCESSES")
+    if processes:
+        limits.append(_clamp(resource.RLIMIT_NPROC, processes, processes))
+    file_bytes = conf.get("LIMIT_FILE_BYTES")
+    if file_bytes:
+        limits.append(_clamp(resource.RLIMIT_FSIZE, file_bytes, file_bytes))
+    return limits
+
+
+def preexec(language, cpu=None):
+    """
+    A ``preexec_fn`` applying the limits for ``language``, or ``None``.
+
+    The limits are computed up front; the function itself only makes
+    ``setrlimit`` calls, as little as possible runs between fork and exec.
+    """
+    if resource is None:
+        return None
+    limits = rlimits(language, cpu)
+
+    def apply():
+        for which, value in limits:
+            resource.setrlimit(which, value)
+
+    return apply
+
+
+def python_env():
+    """
+    The environment of sandboxed Python interpreters.
+
+    A fixed hash seed makes ``hash()`` of strings, and so the order of sets
+    of them, the same on every run, like the rest of a program's output.
+    """
+    return {**os.environ, "PYTHONHASHSEED": "0"}
+
+
+ALLOC_RUNTIME_SOURCE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "native", "alloc_rt.c"
+)
+# Written to stderr by the preloaded runtime when an allocation fails.
+ALLOCATION_FAILED = "\n__DSAVISUAL_ALLOCATION_FAILED__\n"
+
+_alloc_runtime_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _alloc_runtime_path():
+    if shutil.which("gcc") is None:
+        return None
+    with open(ALLOC_RUNTIME_SOURCE, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"dsavisual-alloc-rt-{digest}.so")
+
+
+def _alloc_runtime():
+    """
+    Path of the built allocation marker library, building it if needed, or
+    ``None`` where it cannot be built.
+    """
+    path = _alloc_runtime_path()
+    if path is None:
+        return None
+    with _alloc_runtime_lock:
+        if os.path.exists(path):
+            return path
+        fd, tmp_path = tempfile.mkstemp(suffix=".so")
+        os.close(fd)
+        try:
+            result = subprocess.run(
+                ["gcc", "-shared", "-fPIC", "-O2", ALLOC_RUNTIME_SOURCE, "-o", tmp_path],
+                capture_output=True, timeout=60,
+            )
+            if result.returncode != 0:
+                return None
+            os.replace(tmp_path, path)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+    return path
+
+
+def native_env(language):
+    """
+    Variables to add to the environment of a compiled program in ``language``.
+
+    C/C++ programs preload the allocation marker (glibc only), so a crash
+    after a failed allocation is told apart from other crashes.
+    """
+    if language not in ("c", "cpp") or not conf.get("LIMIT_MEMORY_BYTES"):
+        return {}
+    runtime = _alloc_runtime()
+    return {"LD_PRELOAD": runtime} if runtime else {}
+
+
+def split_allocation_marker(stderr):
+    """
+    ``(stderr, allocation_failed)``: a program's stderr without the marker
+    of ``native_env()``, and whether the marker was in it.
+    """
+    marker = ALLOCATION_FAILED.strip()
+    if marker not in stderr:
+        return stderr, False
+    return stderr.replace(ALLOCATION_FAILED, "\n").replace(marker, ""), True
+
+
+def java_options():
+    """JVM options standing in for ``RLIMIT_AS``."""
+    memory = conf.get("LIMIT_MEMORY_BYTES")
+    return [f"-Xmx{max(memory // (1024 * 1024), 16)}m"] if memory else []
+
+
+def limit_exceeded(returncode, stderr, allocation_failed=False):
+    """
+    The limit that ended a compiled program, or ``None``.
+
+    A program counts as stopped by the memory limit only on evidence of
+    it: an out-of-memory error in ``stderr``, or an allocation that failed
+    (see ``split_allocation_marker``) before the program failed. Any other
+    crash, such as a null pointer dereference, is the program's own.
+    """
+    if hasattr(signal, "SIGXCPU") and returncode == -signal.SIGXCPU:
+        return "cpu_time"
+    if hasattr(signal, "SIGXFSZ") and returncode == -signal.SIGXFSZ:
+        return "file_size"
+    if "unable to create native thread" in stderr:
+        return "processes"
+    if "std::bad_alloc" in stderr or "java.lang.OutOfMemoryError" in stderr:
+        return "memory"
+    if allocation_failed and returncode != 0:
+        return "memory"
+    return None
+
+
+def signal_error(returncode):
+    """Says which signal killed a program (a negative ``returncode``), or ``""``."""
+    if returncode is None or returncode >= 0:
+        return ""
+    try:
+        name = signal.Signals(-returncode).name
+    except ValueError:
+        name = str(-returncode)
+    return f"The program was killed by signal {name}."
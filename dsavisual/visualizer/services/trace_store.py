@@ -0,0 +1,297 @@
+"""
+Server-side storage of long traces, served a page at a time.
+
+``execute_paged`` runs a program like ``execute_code`` but writes its steps
+to disk as they arrive instead of returning them, and returns the result
+with a ``trace`` summary (id and step count) in place of ``steps``. Each
+trace is a directory under ``TRACE_STORE_DIR``:
+
+- ``steps.ndjson``: one JSON step per line
+- ``steps.idx``: the byte offset of every step (native uint64 array), so
+  any range of steps is one seek and one read
+- ``checkpoints.ndjson`` / ``checkpoints.idx``: before every
+  ``TRACE_SEGMENT_STEPS``-th step, the state needed to render the steps
+  from there on without the earlier ones (see ``TraceState``)
+- ``meta.json``: the result summary, written last, so a trace without it
+  is incomplete
+
+Traces are deleted ``TRACE_STORE_TTL`` seconds after they are written, or
+earlier, oldest first, while all of them together take more than
+``TRACE_STORE_MAX_BYTES``.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from array import array
+
+from . import conf
+from .executor import stream_code
+
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class TraceState:
+    """
+    What a client needs, besides the steps themselves, to render a step.
+
+    ``frames`` maps the ids of live frames to their locals (delta traces
+    only; full-mode steps carry all their locals) and ``heap`` is the node
+    table merged from every earlier step.
+    """
+
+    def __init__(self, frames=None, heap=None):
+        self.frames = frames or {}
+        self.heap = heap or {}
+
+    def apply(self, step):
+        """Advance the state past ``step``."""
+        for frame_id in step.get("exited", ()):
+            self.frames.pop(str(frame_id), None)
+        self.heap.update(step.get("heap", ()))
+        if "frame" not in step:
+            return
+        frame = self.frames.setdefault(str(step["frame"]), {})
+        frame.update(step.get("changed", ()))
+        for name, patch in step.get("patched", {}).items():
+            for index, value in patch.items():
+                frame[name][int(index)] = value
+        for name in step.get("removed", ()):
+            frame.pop(name, None)
+
+    def as_dict(self):
+        return {"frames": self.frames, "heap": self.heap}
+
+
+class TraceWriter:
+    """Appends the steps of one trace to its directory."""
+
+    def __init__(self, path, segment_steps):
+        self.id = os.path.basename(path)
+        self.path = path
+        self.segment_steps = segment_steps
+        self.count = 0
+        self.state = TraceState()
+        os.makedirs(path)
+        self._steps = open(os.path.join(path, "steps.ndjson"), "wb")
+        self._checkpoints = open(os.path.join(path, "checkpoints.ndjson"), "wb")
+        self._step_index = array("Q")
+        self._checkpoint_index = array("Q")
+
+    def add(self, step):
+        if self.count % self.segment_steps == 0:
+            self._checkpoint_index.append(self._checkpoints.tell())
+            self._checkpoints.write(json.dumps(self.state.as_dict()).encode() + b"\n")
+        self._step_index.append(self._steps.tell())
+        self._steps.write(json.dumps(step).encode() + b"\n")
+        self.state.apply(step)
+        self.count += 1
+
+    def finish(self, summary):
+        """Write the indexes and ``summary``, making the trace readable."""
+        self._steps.close()
+        self._checkpoints.close()
+        for name, index in (("steps.idx", self._step_index),
+                            ("checkpoints.idx", self._checkpoint_index)):
+            with open(os.path.join(self.path, name), "wb") as f:
+                index.tofile(f)
+        meta = {
+            **summary,
+            "id": self.id,
+            "steps": self.count,
+            "segment_steps": self.segment_steps,
+        }
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+        return meta
+
+    def abort(self):
+        self._steps.close()
+        self._checkpoints.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class StoredTrace:
+    """Random access to the steps of a finished trace."""
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+
+    @property
+    def total(self):
+        return self.meta["steps"]
+
+    def _lines(self, name, start, stop, total):
+        """Lines ``[start, stop)`` of ``name``.ndjson via its offset index."""
+        if start >= stop:
+            return []
+        width = array("Q").itemsize
+        with open(os.path.join(self.path, name + ".idx"), "rb") as f:
+            f.seek(start * width)
+            first = array("Q", f.read(width))[0]
+            if stop < total:
+                f.seek(stop * width)
+                end = array("Q", f.read(width))[0]
+            else:
+                end = None
+        with open(os.path.join(self.path, name + ".ndjson"), "rb") as f:
+            f.seek(first)
+            data = f.read() if end is None else f.read(end - first)
+        return data.splitlines()
+
+    def steps(self, start, stop):
+        """Steps ``[start, stop)``."""
+        return [json.loads(line) for line in self._lines("steps", start, stop, self.total)]
+
+    def state_at(self, index):
+        """The ``TraceState`` just before step ``index``."""
+        segment_steps = self.meta["segment_steps"]
+        checkpoints = -(-self.total // segment_steps)
+        segment = min(index // segment_steps, checkpoints - 1)
+        if segment < 0:
+            return TraceState()
+        state = TraceState(**json.loads(
+            self._lines("checkpoints", segment, segment + 1, checkpoints)[0]
+        ))
+        for step in self.steps(segment * segment_steps, index):
+            state.apply(step)
+        return state
+
+
+def _dir_size(path):
+    total = 0
+    try:
+        for entry in os.scandir(path):
+            total += entry.stat().st_size
+    except OSError:
+        pass  # deleted meanwhile
+    return total
+
+
+class TraceStore:
+    """
+    Trace directories under ``root``, expiring ``ttl`` seconds after writing
+    and evicted oldest first past ``max_bytes`` in total.
+    """
+
+    def __init__(self, root, ttl, segment_steps, max_bytes=None):
+        self.root = root
+        self.ttl = ttl
+        self.segment_steps = segment_steps
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def create(self):
+        return TraceWriter(os.path.join(self.root, uuid.uuid4().hex), self.segment_steps)
+
+    def get(self, trace_id):
+        """The finished, unexpired trace ``trace_id``, or ``None``."""
+        if not _TRACE_ID.match(trace_id):
+            return None
+        path = os.path.join(self.root, trace_id)
+        meta_path = os.path.join(path, "meta.json")
+        try:
+            if time.time() - os.path.getmtime(meta_path) > self.ttl:
+                shutil.rmtree(path, ignore_errors=True)
+                return None
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return StoredTrace(path, meta)
+
+    def sweep(self, keep=None):
+        """
+        Delete expired traces and unfinished ones older than the TTL, then
+        the oldest finished ones but ``keep`` (a trace id) while all of them
+        together take more than ``max_bytes``.
+        """
+        cutoff = time.time() - self.ttl
+        total, finished = 0, []
+        for entry in os.scandir(self.root):
+            if not _TRACE_ID.match(entry.name):
+                continue
+            try:
+                written = os.path.getmtime(os.path.join(entry.path, "meta.json"))
+                done = True
+            except OSError:
+                try:
+                    written = entry.stat().st_mtime
+                except OSError:
+                    continue
+                done = False
+            if written < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            size = _dir_size(entry.path)
+            total += size
+            if done and entry.name != keep:
+                # Traces still being written are never evicted.
+                finished.append((written, size, entry.path))
+        finished.sort()
+        while finished and self.max_bytes is not None and total > self.max_bytes:
+            _, size, path = finished.pop(0)
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide trace store, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TraceStore(
+                conf.get("TRACE_STORE_DIR") or os.path.join(
+                    tempfile.gettempdir(), "dsavisual-traces"
+                ),
+                ttl=conf.get("TRACE_STORE_TTL"),
+                segment_steps=conf.get("TRACE_SEGMENT_STEPS"),
+                max_bytes=conf.get("TRACE_STORE_MAX_BYTES"),
+            )
+        return _store
+
+
+def execute_paged(code: str, language: str = "python", input_data=None,
+                  trace_mode: str = "full", max_steps: int = None,
+                  watch: dict = None, optimization: str = "O0",
+                  trace: bool = False) -> dict:
+    """
+    Run code like ``execute_code`` and store its trace.
+
+    The result has no ``steps``; its ``trace`` holds the id under which
+    ``get_store().get()`` finds them and the number of steps.
+    """
+    store = get_store()
+    store.sweep()
+    writer = store.create()
+    result = {}
+    try:
+        for event in stream_code(
+            code, language, input_data, conf.get("TRACE_PAGED_TIMEOUT"),
+            trace_mode, max_steps, watch, paged=True, optimization=optimization,
+            trace=trace,
+        ):
+            if event["event"] == "step":
+                writer.add(event["data"])
+            else:
+                result = event["data"]
+        for step in result.pop("steps", None) or ():
+            writer.add(step)
+        writer.finish(result)
+    except BaseException:
+        writer.abort()
+        raise
+    store.sweep(keep=writer.id)
+    result["trace"] = {"id": writer.id, "steps": writer.count}
+    return result
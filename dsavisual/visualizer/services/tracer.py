@@ -0,0 +1,1610 @@
+"""
+Line tracer that runs inside the sandbox interpreter.
+
+This file is executed as a standalone script by ``executor.py`` and must only
+depend on the standard library. It runs in one of two modes:
+
+- one-shot (default): read a single JSON job from stdin and run it with the
+  user's output going to the real stdout/stderr.
+- ``--worker``: stay alive as a warm pool worker, reading one JSON job per
+  line from stdin and running each in a child forked for it, with the
+  user's output captured per job.
+
+Either way the trace is streamed as NDJSON events while the program runs:
+one ``{"event": "step", "data": {...}}`` line per recorded step, then a
+final ``{"event": "result", "data": {...}}`` line. A batch job (with
+``cases`` instead of ``input_data``) sends one ``{"event": "case", ...}``
+line per input instead of steps, see ``run_batch()``, and a timing job
+(with ``timing``) runs untraced and sends one ``{"event": "timing", ...}``
+line, see ``run_timed()``. Events go to a dedicated
+descriptor (``--channel-fd N``, the worker's stdout) so nothing user code
+prints can be mistaken for them. Without ``--channel-fd`` (platforms that
+cannot pass extra descriptors) they go to stdout prefixed with ``__TRACE__``.
+
+Jobs with ``"mode": "count"`` record no steps, only the array operations
+the program makes, see ``OperationCounter``, and jobs with ``"mode":
+"profile"`` only the hits and time of each line, see ``LineProfiler``.
+Jobs with ``"mode": "sample"`` sample the program's call stack instead, see
+``StackSampler``.
+
+A program that runs past its budgets (lines run, CPU time, memory, file
+size) is stopped with a ``limit_exceeded`` result instead of being left to
+hit the wall-clock timeout.
+"""
+import ast
+import builtins
+import contextlib
+import errno
+import gc
+import importlib
+import io
+import json
+import math
+import operator
+import os
+import signal
+import sys
+import time
+import types
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+USER_FILENAME = "<user_code>"
+EVENT_PREFIX = "__TRACE__"
+
+# Modules imported once by warm workers so user imports of them are free.
+PRELOAD_MODULES = [
+    "bisect", "collections", "functools", "heapq",
+    "itertools", "math", "random", "string",
+]
+
+
+_PRIMITIVES = (str, int, float, bool, type(None))
+# Objects that are shown by their repr rather than as nodes.
+_OPAQUE = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType,
+    types.MethodType, types.GeneratorType, io.IOBase,
+)
+_NOT_NODES = _PRIMITIVES + (list, tuple, dict) + _OPAQUE
+
+
+class LimitExceeded(BaseException):
+    """
+    The program ran past one of its budgets; ``limit`` says which.
+
+    A ``BaseException`` so that user code catching ``Exception`` cannot
+    swallow it.
+    """
+
+    DESCRIPTIONS = {
+        "cpu_time": "CPU time",
+        "memory": "memory",
+        "file_size": "file size",
+        "output": "output size",
+        "steps": "step budget",
+    }
+
+    def __init__(self, limit, detail=""):
+        message = f"Limit exceeded: {self.DESCRIPTIONS[limit]}"
+        super().__init__(f"{message} ({detail})" if detail else message)
+        self.limit = limit
+
+
+# Whether user code is running, and whether SIGXCPU arrived while it was
+# not (see ``_cpu_exceeded()``).
+_cpu = {"in_user_code": False, "exceeded": False}
+
+
+def _cpu_exceeded(signum, frame):
+    """
+    Stop the user's program, which is out of CPU time.
+
+    Raising in the tracer's own bookkeeping would escape its error handling
+    (and end a worker), so a signal arriving outside user code is only
+    noted; ``_user_code()`` raises it when the program next runs.
+    """
+    if _cpu["in_user_code"]:
+        raise LimitExceeded("cpu_time")
+    _cpu["exceeded"] = True
+
+
+@contextlib.contextmanager
+def _user_code():
+    """Mark the user's program as running, for ``_cpu_exceeded()``."""
+    if _cpu["exceeded"]:
+        raise LimitExceeded("cpu_time")
+    _cpu["in_user_code"] = True
+    try:
+        yield
+    finally:
+        _cpu["in_user_code"] = False
+
+
+def _limit_cpu(seconds):
+    """
+    Let this process use ``seconds`` more CPU time before SIGXCPU arrives.
+
+    ``None`` lifts the soft limit again. Used by workers, which serve many
+    jobs under one ``RLIMIT_CPU``.
+    """
+    _cpu["exceeded"] = False
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = hard
+    if seconds is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        # Rounded up: the limit is in whole seconds, and rounding down would
+        # take the part of a second already used out of the budget.
+        soft = math.ceil(usage.ru_utime + usage.ru_stime + seconds)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+class SnapshotEncoder:
+    """
+    Encodes local values into JSON, with user objects in a shared node table.
+
+    Primitives, lists, tuples and dicts are encoded inline (containers up to
+    depth 3 and ``max_items`` items each). Any other object with attributes
+    (``__dict__`` or ``__slots__``), such as a linked-list or tree node,
+    becomes ``{"ref": id}`` with an id that is stable for the whole trace,
+    and the node itself, ``{"type": class name, "fields": {...}}``, goes into
+    the node table. Fields referencing other objects are refs too, so shared
+    structure and cycles cost one node each. Past ``max_nodes`` distinct
+    objects, new ones fall back to their repr, as do objects without
+    attributes.
+
+    ``nodes()`` returns the nodes that are new or changed since the last
+    call. Rather than walking the whole object graph every step, the
+    encoder wraps ``__setattr__`` and ``__delattr__`` of the user's classes
+    it encodes to note which instances were modified (until ``close()``
+    puts the originals back), and only re-encodes those, new nodes, and
+    nodes whose fields hold containers (which can change without an
+    attribute being set). Instances of other classes, such as the standard
+    library's, are re-encoded every time. Encoded objects are kept alive so
+    their ids cannot be reused.
+    """
+
+    def __init__(self, max_items=None, max_nodes=None):
+        self.max_items = max_items
+        self.max_nodes = max_nodes
+        self._ids = {}        # id(obj) -> (node id, obj)
+        self._sent = {}       # node id -> encoding last sent
+        self._queue = []      # objects to encode in the next nodes() call
+        self._dirty = set()   # id(obj) of instances modified since nodes()
+        self._volatile = {}   # id(obj) -> obj, re-encoded on every call
+        self._tracked = {}    # class -> whether modifications are noticed
+        self._patched = []    # (class, name, own attribute replaced or None)
+
+    def close(self):
+        """Stop noting modifications, e.g. once recording has stopped."""
+        self._dirty = None
+        while self._patched:
+            cls, name, original = self._patched.pop()
+            if original is None:
+                delattr(cls, name)
+            else:
+                setattr(cls, name, original)
+
+    @staticmethod
+    def _is_user_class(cls):
+        # The tracer's own classes are in __main__ too when it runs as a
+        # script.
+        return cls.__module__ == "__main__" and globals().get(cls.__name__) is not cls
+
+    def _is_node(self, value):
+        return not isinstance(value, _NOT_NODES) and (
+            hasattr(value, "__dict__") or hasattr(type(value), "__slots__")
+        )
+
+    def _track(self, cls):
+        """Have ``cls`` report attribute writes; False if it cannot."""
+        tracked = self._tracked.get(cls)
+        if tracked is not None:
+            return tracked
+        if self._dirty is None:
+            return False
+        if not self._is_user_class(cls):
+            self._tracked[cls] = False
+            return False
+        encoder = self
+        try:
+            for name in ("__setattr__", "__delattr__"):
+                original = getattr(cls, name)
+                if getattr(original, "_notes_writes", False):
+                    continue
+
+                def hook(obj, *args, _original=original):
+                    # Marked again afterwards in case a traced __setattr__
+                    # recorded a step (and reset the marks) part way.
+                    if encoder._dirty is not None:
+                        encoder._dirty.add(id(obj))
+                    try:
+                        _original(obj, *args)
+                    finally:
+                        if encoder._dirty is not None:
+                            encoder._dirty.add(id(obj))
+
+                hook._notes_writes = True
+                own = cls.__dict__.get(name)
+                setattr(cls, name, hook)
+                self._patched.append((cls, name, own))
+            tracked = True
+        except (TypeError, AttributeError):
+            tracked = False  # built-in or extension type
+        self._tracked[cls] = tracked
+        return tracked
+
+    def _ref(self, value):
+        """``{"ref": id}`` for ``value``, or None past ``max_nodes``."""
+        entry = self._ids.get(id(value))
+        if entry is None:
+            if self.max_nodes is not None and len(self._ids) >= self.max_nodes:
+                return None
+            entry = self._ids[id(value)] = (len(self._ids), value)
+            self._queue.append(value)
+        return {"ref": entry[0]}
+
+    def encode(self, value, depth=0):
+        if isinstance(value, _PRIMITIVES):
+            return value
+        if depth > 3:
+            return repr(value)
+        if isinstance(value, (list, tuple)):
+            items = [self.encode(item, depth + 1) for item in value[:self.max_items]]
+            if self.max_items is not None and len(value) > self.max_items:
+                items.append(f"... {len(value) - self.max_items} more")
+            return items
+        if isinstance(value, dict):
+            entries = {}
+            for n, (k, v) in enumerate(value.items()):
+                if self.max_items is not None and n >= self.max_items:
+                    entries["..."] = f"{len(value) - self.max_items} more"
+                    break
+                entries[str(k)] = self.encode(v, depth + 1)
+            return entries
+        if self._is_node(value):
+            ref = self._ref(value)
+            if ref is not None:
+                return ref
+        return repr(value)
+
+    def _fields(self, obj):
+        fields = dict(getattr(obj, "__dict__", None) or {})
+        for cls in type(obj).__mro__:
+            slots = cls.__dict__.get("__slots__", ())
+            for name in (slots,) if isinstance(slots, str) else slots:
+                if name not in ("__dict__", "__weakref__") and hasattr(obj, name):
+                    fields[name] = getattr(obj, name)
+        return {
+            str(k): v for k, v in fields.items()
+            if not (isinstance(k, str) and k.startswith("__"))
+        }
+
+    def nodes(self):
+        """Nodes that are new or changed since the last call, keyed by id."""
+        queue = self._queue
+        if self._dirty:
+            queue.extend(self._ids[i][1] for i in self._dirty if i in self._ids)
+            self._dirty.clear()
+        queue.extend(self._volatile.values())
+        changed, done = {}, set()
+        while queue:
+            obj = queue.pop()
+            node_id = self._ids[id(obj)][0]
+            if node_id in done:
+                continue
+            done.add(node_id)
+            try:
+                fields = self._fields(obj)
+            except Exception:
+                fields = {}
+            node = {
+                "type": type(obj).__name__,
+                "fields": {k: self.encode(v, 1) for k, v in fields.items()},
+            }
+            if self._track(type(obj)) and all(
+                isinstance(v, _PRIMITIVES) or self._is_node(v)
+                for v in fields.values()
+            ):
+                self._volatile.pop(id(obj), None)
+            else:
+                self._volatile[id(obj)] = obj
+            if self._sent.get(node_id) != node:
+                self._sent[node_id] = changed[str(node_id)] = node
+        return changed
+
+    def unchanged(self, value, encoded):
+        """Whether ``encoded`` is still an up-to-date encoding of ``value``.
+
+        Compares the live object against its previous encoding directly, so
+        an unchanged container costs one C-level comparison instead of a
+        copy, and an object is unchanged while it is the same node (its
+        fields are tracked by ``nodes()``). Returning False only costs
+        re-sending the variable.
+        """
+        try:
+            if isinstance(value, _PRIMITIVES):
+                return type(value) is type(encoded) and value == encoded
+            if isinstance(value, (list, dict)):
+                return value == encoded
+            if isinstance(value, tuple):
+                return list(value) == encoded
+            if self._is_node(value):
+                entry = self._ids.get(id(value))
+                return entry is not None and encoded == {"ref": entry[0]}
+            return repr(value) == encoded
+        except Exception:
+            return False
+
+
+class CappedOutput:
+    """
+    Stands in for ``sys.stdout``/``sys.stderr``, passing at most ``limit``
+    bytes (UTF-8) on to ``target``.
+
+    A write past the limit passes on what fits, then raises
+    ``LimitExceeded("output")``, as does every later write.
+    """
+
+    def __init__(self, target, limit):
+        self.target = target
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+
+    def write(self, text):
+        if self.truncated:
+            raise LimitExceeded("output")
+        data = text.encode("utf-8", errors="replace")
+        if self.size + len(data) > self.limit:
+            self.target.write(
+                data[:self.limit - self.size].decode("utf-8", errors="ignore")
+            )
+            self.size = self.limit
+            self.truncated = True
+            raise LimitExceeded("output")
+        self.size += len(data)
+        return self.target.write(text)
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        self.target.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.target, name)
+
+
+class Channel:
+    """Writes trace events as NDJSON lines, flushing at least every 50 ms."""
+
+    FLUSH_INTERVAL = 0.05
+
+    def __init__(self, stream, prefix=""):
+        self.stream = stream
+        self.prefix = prefix
+        self._last_flush = time.monotonic()
+
+    def step(self, part):
+        self.stream.write(f'{self.prefix}{{"event": "step", "data": {part}}}\n')
+        now = time.monotonic()
+        if now - self._last_flush >= self.FLUSH_INTERVAL:
+            self.stream.flush()
+            self._last_flush = now
+
+    def case(self, payload, steps):
+        """Send a finished batch case, with its ``steps`` as JSON texts."""
+        data = json.dumps(payload)[:-1] + ', "steps": [' + ", ".join(steps) + "]}"
+        self.stream.write(f'{self.prefix}{{"event": "case", "data": {data}}}\n')
+        self.stream.flush()
+
+    def timing(self, times_ns):
+        """Send the run times of a timing job."""
+        self.stream.write(
+            self.prefix + json.dumps({"event": "timing", "data": {"times_ns": times_ns}})
+            + "\n"
+        )
+        self.stream.flush()
+
+    def result(self, payload):
+        self.stream.write(
+            self.prefix + json.dumps({"event": "result", "data": payload}) + "\n"
+        )
+        self.stream.flush()
+
+
+class StepList:
+    """Holds the steps of one batch case until it is sent whole."""
+
+    def __init__(self):
+        self.steps = []
+
+    def step(self, part):
+        self.steps.append(part)
+
+
+class StepRecorder:
+    """
+    Records a step for every line run in user code.
+
+    A tracing backend (``SettraceBackend`` or ``MonitoringBackend``) calls
+    ``record()`` for each line and ``frame_done()`` when a frame exits.
+
+    In ``full`` mode each step is ``{line, locals}`` with every visible local.
+    In ``delta`` mode each step is ``{line, frame[, changed, patched,
+    removed, exited]}`` holding only what changed since that frame's
+    previous step: ``changed`` maps names to new values (the first step of a
+    frame lists all locals), ``patched`` maps a list's name to ``{index:
+    value}`` when only some elements changed, ``removed`` lists deleted
+    names and ``exited`` the ids of frames that returned since the previous
+    step.
+    Unchanged containers are never copied or re-sent. In either mode, user
+    objects are encoded as ``{"ref": id}`` and a step's ``heap`` maps ids to
+    the nodes (see ``SnapshotEncoder``) that are new or changed since they
+    were last sent, so a client rebuilds the object graph by merging the
+    ``heap`` of every step up to the one shown. Steps are serialized as
+    they are recorded, and recording stops (the program keeps running
+    untraced) once ``max_steps`` or ``max_bytes`` is reached. ``max_lines``
+    is a budget on the watched lines run, recorded or not: past it
+    ``count_line()`` raises ``LimitExceeded``, so with a budget the
+    backends keep counting after recording stops. Each serialized
+    step is handed to ``emit`` as soon as it is recorded; the time spent
+    snapshotting, encoding and emitting steps is kept in ``serialize_ns``.
+
+    A ``watch`` spec narrows what is recorded: ``variables`` (names to
+    snapshot), ``functions`` (names of the functions to trace, ``<module>``
+    for top-level code), ``lines`` (inclusive ``[first, last]`` ranges) and
+    ``sample_every`` (record every Nth matching line). Frames of code that
+    cannot match get no local trace function at all.
+    """
+
+    def __init__(self, emit, mode="full", max_steps=None, max_bytes=None,
+                 max_items=None, max_nodes=None, watch=None, max_lines=None):
+        self.emit = emit
+        self.mode = mode
+        self.max_steps = max_steps
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.lines_run = 0
+        self.max_items = max_items
+        self.encoder = SnapshotEncoder(max_items, max_nodes)
+        self.count = 0
+        self.size = 0
+        self.serialize_ns = 0
+        self.truncated = None
+        self._frames = {}
+        self._next_frame_id = 0
+        self._exited = []
+
+        watch = watch or {}
+        self.variables = (
+            list(dict.fromkeys(watch["variables"])) if watch.get("variables") else None
+        )
+        self.functions = set(watch["functions"]) if watch.get("functions") else None
+        self.lines = [tuple(r) for r in watch.get("lines") or ()] or None
+        self.sample_every = watch.get("sample_every") or 1
+        self._matched = 0
+        self._watched_code = {}
+
+    def watches(self, code):
+        """Whether lines of ``code`` can produce steps (cached per code object)."""
+        watched = self._watched_code.get(code)
+        if watched is None:
+            watched = self._watched_code[code] = self._could_match(code)
+        return watched
+
+    def _could_match(self, code):
+        if code.co_filename != USER_FILENAME:
+            return False
+        if self.functions is not None and code.co_name not in self.functions:
+            return False
+        if self.variables is not None and set(self.variables).isdisjoint(
+            code.co_varnames + code.co_cellvars + code.co_freevars + code.co_names
+        ):
+            return False
+        if self.lines is not None:
+            return any(
+                self.line_watched(line) for _, _, line in code.co_lines()
+                if line is not None
+            )
+        return True
+
+    def line_watched(self, line):
+        return any(first <= line <= last for first, last in self.lines)
+
+    def _visible_locals(self, frame):
+        """``(name, value)`` pairs of the locals to snapshot in ``frame``."""
+        f_locals = frame.f_locals
+        if self.variables is None:
+            return [(k, v) for k, v in f_locals.items() if not k.startswith('_')]
+        return [(k, f_locals[k]) for k in self.variables if k in f_locals]
+
+    def _full_step(self, frame):
+        return {
+            "line": frame.f_lineno,
+            "locals": {
+                k: self.encoder.encode(v) for k, v in self._visible_locals(frame)
+            },
+        }
+
+    def _list_patch(self, value, encoded):
+        """Per-index updates turning ``encoded`` into ``value``, if cheaper."""
+        if not isinstance(value, list) or not isinstance(encoded, list):
+            return None
+        if len(value) != len(encoded) or (
+            self.max_items is not None and len(value) > self.max_items
+        ):
+            return None
+        patch = {}
+        for i, item in enumerate(value):
+            if not self.encoder.unchanged(item, encoded[i]):
+                patch[str(i)] = self.encoder.encode(item, 1)
+                if 2 * len(patch) > len(value):
+                    return None
+        return patch
+
+    def _delta_step(self, frame):
+        if frame not in self._frames:
+            self._frames[frame] = (self._next_frame_id, {})
+            self._next_frame_id += 1
+        frame_id, previous = self._frames[frame]
+
+        changed, patched = {}, {}
+        current = frame.f_locals
+        for k, v in self._visible_locals(frame):
+            if k in previous:
+                if self.encoder.unchanged(v, previous[k]):
+                    continue
+                patch = self._list_patch(v, previous[k])
+                if patch is not None:
+                    for i, item in patch.items():
+                        previous[k][int(i)] = item
+                    if patch:
+                        patched[k] = patch
+                    continue
+            previous[k] = changed[k] = self.encoder.encode(v)
+
+        step = {"line": frame.f_lineno, "frame": frame_id}
+        if changed:
+            step["changed"] = changed
+        if patched:
+            step["patched"] = patched
+        removed = [k for k in previous if k not in current]
+        if removed:
+            for k in removed:
+                del previous[k]
+            step["removed"] = removed
+        if self._exited:
+            step["exited"], self._exited = self._exited, []
+        return step
+
+    def count_line(self):
+        """Count a watched line run; raises ``LimitExceeded`` past ``max_lines``."""
+        self.lines_run += 1
+        if self.max_lines is not None and self.lines_run > self.max_lines:
+            raise LimitExceeded("steps", f"more than {self.max_lines} lines run")
+
+    def frame_done(self, frame):
+        """Forget ``frame`` once it returns (or yields)."""
+        entry = self._frames.pop(frame, None)
+        if entry is not None:
+            self._exited.append(entry[0])
+
+    def record(self, frame):
+        """
+        Record a step for the line ``frame`` is about to run.
+
+        Applies sampling and the step caps; returns False once recording has
+        stopped for good (``truncated`` says why).
+        """
+        self._matched += 1
+        if (self._matched - 1) % self.sample_every:
+            return True
+        if self.max_steps is not None and self.count >= self.max_steps:
+            self.truncated = "max_steps"
+            self.encoder.close()
+            return False
+        start = time.perf_counter_ns()
+        if self.mode == "delta":
+            step = self._delta_step(frame)
+        else:
+            step = self._full_step(frame)
+        heap = self.encoder.nodes()
+        if heap:
+            step["heap"] = heap
+        part = json.dumps(step)
+        if self.max_bytes is not None and self.size + len(part) > self.max_bytes:
+            self.truncated = "max_bytes"
+            self.encoder.close()
+            return False
+        self.emit(part)
+        self.count += 1
+        self.size += len(part) + 1
+        self.serialize_ns += time.perf_counter_ns() - start
+        return True
+
+
+class SettraceBackend:
+    """Drives a ``StepRecorder`` from ``sys.settrace`` callbacks."""
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def start(self, code):
+        sys.settrace(self.tracer)
+
+    def stop(self):
+        sys.settrace(None)
+
+    def _stop_tracing(self, frame, tracer=None):
+        """Swap the trace function of every traced frame for ``tracer``."""
+        sys.settrace(tracer)
+        while frame is not None:
+            if tracer is None or frame.f_trace is not None:
+                frame.f_trace = tracer
+            frame = frame.f_back
+
+    def tracer(self, frame, event, arg):
+        recorder = self.recorder
+        if recorder.truncated:
+            # A frame suspended (e.g. a generator) when recording stopped.
+            return None if recorder.max_lines is None else self.counter(frame, event, arg)
+        if event == 'call':
+            return self.tracer if recorder.watches(frame.f_code) else None
+        if event == 'return':
+            recorder.frame_done(frame)
+        elif event == 'line':
+            if recorder.lines is not None and not recorder.line_watched(frame.f_lineno):
+                return self.tracer
+            recorder.count_line()
+            if not recorder.record(frame):
+                # Keep counting lines against the budget, if there is one.
+                counter = None if recorder.max_lines is None else self.counter
+                self._stop_tracing(frame, counter)
+                return counter
+        return self.tracer
+
+    def counter(self, frame, event, arg):
+        """Trace function once recording has stopped: only counts lines."""
+        recorder = self.recorder
+        if event == 'line':
+            if recorder.lines is None or recorder.line_watched(frame.f_lineno):
+                recorder.count_line()
+        elif event == 'call':
+            return self.counter if recorder.watches(frame.f_code) else None
+        return self.counter
+
+
+def _code_objects(code):
+    """``code`` and every code object nested in its constants."""
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            yield from _code_objects(const)
+
+
+class MonitoringBackend:
+    """
+    Drives a ``StepRecorder`` from ``sys.monitoring`` (PEP 669) events.
+
+    Python 3.12+ only. LINE events are switched on for the user's code
+    objects that the watch spec can match and nowhere else, so library code
+    runs at full speed; lines outside the watched ranges, and every line
+    once recording stops (unless a line budget is still being counted), are
+    disabled at their location.
+    """
+
+    TOOL_ID = 0  # sys.monitoring.DEBUGGER_ID
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self._codes = []
+
+    def start(self, code):
+        monitoring = sys.monitoring
+        events = monitoring.events
+        monitoring.use_tool_id(self.TOOL_ID, "dsavisual-tracer")
+        try:
+            monitoring.register_callback(self.TOOL_ID, events.LINE, self._line)
+            local_events = events.LINE
+            if self.recorder.mode == "delta":
+                # Delta mode keeps per-frame state that must be dropped on exit.
+                for event in (events.PY_RETURN, events.PY_YIELD, events.PY_UNWIND):
+                    monitoring.register_callback(self.TOOL_ID, event, self._frame_exit)
+                local_events |= events.PY_RETURN | events.PY_YIELD
+                monitoring.set_events(self.TOOL_ID, events.PY_UNWIND)
+            for candidate in _code_objects(code):
+                if self.recorder.watches(candidate):
+                    monitoring.set_local_events(self.TOOL_ID, candidate, local_events)
+                    self._codes.append(candidate)
+        except BaseException:
+            self.stop()
+            raise
+
+    def stop(self):
+        monitoring = sys.monitoring
+        for code in self._codes:
+            monitoring.set_local_events(self.TOOL_ID, code, 0)
+        monitoring.set_events(self.TOOL_ID, 0)
+        for event in (monitoring.events.LINE, monitoring.events.PY_RETURN,
+                      monitoring.events.PY_YIELD, monitoring.events.PY_UNWIND):
+            monitoring.register_callback(self.TOOL_ID, event, None)
+        monitoring.free_tool_id(self.TOOL_ID)
+        self._codes = []
+
+    def _line(self, code, line):
+        recorder = self.recorder
+        if recorder.lines is not None and not recorder.line_watched(line):
+            return sys.monitoring.DISABLE
+        if recorder.truncated:
+            if recorder.max_lines is None:
+                return sys.monitoring.DISABLE
+            recorder.count_line()
+            return None
+        recorder.count_line()
+        if not recorder.record(sys._getframe(1)) and recorder.max_lines is None:
+            for traced in self._codes:
+                sys.monitoring.set_local_events(self.TOOL_ID, traced, 0)
+            return sys.monitoring.DISABLE
+        return None
+
+    def _frame_exit(self, code, offset, arg=None):
+        if code.co_filename == USER_FILENAME:
+            self.recorder.frame_done(sys._getframe(1))
+
+
+BACKENDS = {"settrace": SettraceBackend, "monitoring": MonitoringBackend}
+
+
+def default_backend():
+    """``monitoring`` where the interpreter has it (3.12+), else ``settrace``."""
+    return "monitoring" if hasattr(sys, "monitoring") else "settrace"
+
+
+# Comparisons the count mode counts, by their index in the rewritten code.
+_COMPARISONS = (
+    (ast.Eq, operator.eq), (ast.NotEq, operator.ne), (ast.Lt, operator.lt),
+    (ast.LtE, operator.le), (ast.Gt, operator.gt), (ast.GtE, operator.ge),
+)
+# Augmented assignments of list items, likewise.
+_AUGMENTED = (
+    (ast.Add, operator.iadd), (ast.Sub, operator.isub), (ast.Mult, operator.imul),
+    (ast.Div, operator.itruediv), (ast.FloorDiv, operator.ifloordiv),
+    (ast.Mod, operator.imod), (ast.Pow, operator.ipow),
+    (ast.LShift, operator.ilshift), (ast.RShift, operator.irshift),
+    (ast.BitOr, operator.ior), (ast.BitXor, operator.ixor),
+    (ast.BitAnd, operator.iand),
+)
+_COMPARISON_INDEX = {node: n for n, (node, _) in enumerate(_COMPARISONS)}
+_AUGMENTED_INDEX = {node: n for n, (node, _) in enumerate(_AUGMENTED)}
+
+
+def _is_item(node):
+    """Whether ``node`` is a subscript the count mode rewrites (not a slice)."""
+    return isinstance(node, ast.Subscript) and not isinstance(node.slice, ast.Slice) and not (
+        isinstance(node.slice, ast.Tuple)
+        and any(isinstance(e, ast.Slice) for e in node.slice.elts)
+    )
+
+
+def _same(a, b):
+    return ast.dump(a) == ast.dump(b)
+
+
+class _CountingRewriter(ast.NodeTransformer):
+    """Routes item reads, writes, comparisons and swaps to ``OperationCounter``."""
+
+    @staticmethod
+    def _call(node, name, *args):
+        call = ast.Call(ast.Name(name, ast.Load()), list(args), [])
+        return ast.copy_location(call, node)
+
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        if isinstance(node.ctx, ast.Load) and _is_item(node):
+            return self._call(node, "_dsv_get", node.value, node.slice)
+        return node
+
+    def _swap(self, node):
+        """``_dsv_swap(a, i, j)`` for ``a[i], a[j] = a[j], a[i]``, else ``None``."""
+        if len(node.targets) != 1:
+            return None
+        target, value = node.targets[0], node.value
+        if not (isinstance(target, ast.Tuple) and isinstance(value, ast.Tuple)
+                and len(target.elts) == len(value.elts) == 2
+                and all(map(_is_item, target.elts + value.elts))):
+            return None
+        (a, b), (c, d) = target.elts, value.elts
+        if not (_same(a.value, b.value) and _same(a.value, c.value)
+                and _same(a.value, d.value) and _same(a.slice, d.slice)
+                and _same(b.slice, c.slice)):
+            return None
+        swap = self._call(
+            node, "_dsv_swap",
+            self.visit(a.value), self.visit(a.slice), self.visit(b.slice),
+        )
+        return ast.copy_location(ast.Expr(swap), node)
+
+    def visit_Assign(self, node):
+        swap = self._swap(node)
+        if swap is not None:
+            return swap
+        if len(node.targets) == 1 and _is_item(node.targets[0]):
+            target = node.targets[0]
+            # Python evaluates the value before the target.
+            call = self._call(
+                node, "_dsv_set",
+                self.visit(node.value), self.visit(target.value), self.visit(target.slice),
+            )
+            return ast.copy_location(ast.Expr(call), node)
+        return self.generic_visit(node)
+
+    def visit_AugAssign(self, node):
+        if _is_item(node.target) and type(node.op) in _AUGMENTED_INDEX:
+            call = self._call(
+                node, "_dsv_update",
+                self.visit(node.target.value), self.visit(node.target.slice),
+                ast.Constant(_AUGMENTED_INDEX[type(node.op)]), self.visit(node.value),
+            )
+            return ast.copy_location(ast.Expr(call), node)
+        return self.generic_visit(node)
+
+    def visit_Compare(self, node):
+        if len(node.ops) != 1 or type(node.ops[0]) not in _COMPARISON_INDEX:
+            return self.generic_visit(node)
+        left, right = node.left, node.comparators[0]
+        if not (_is_item(left) or _is_item(right)):
+            return self.generic_visit(node)
+
+        def operand(value):
+            # The position the operand was read from, taken right after it.
+            position = self._call(value, "_dsv_position") if _is_item(value) else (
+                ast.Constant(None)
+            )
+            return [self.visit(value), position]
+
+        return self._call(
+            node, "_dsv_compare", ast.Constant(_COMPARISON_INDEX[type(node.ops[0])]),
+            *operand(left), *operand(right),
+        )
+
+
+class OperationCounter:
+    """
+    Counts the array operations of a program run in ``count`` mode.
+
+    ``compile()`` rewrites the program so that item reads and writes,
+    comparisons of items and swaps of two items call the helpers that
+    ``helpers()`` returns for its globals, instead of snapshotting every
+    line. Only list items at integer positions count: a comparison when
+    an operand is one, a swap for ``a[i], a[j] = a[j], a[i]``, which also
+    counts as two reads and two writes.
+
+    The first ``max_events`` comparisons, swaps and writes are logged as
+    columns: ``op`` ("c", "s" or "w" per event), ``i`` and ``j``. These are
+    the positions compared (``None`` for an operand that is not an item),
+    the two swapped, or the position written and the value written if it
+    is a number.
+    """
+
+    def __init__(self, max_events=None):
+        self.max_events = max_events
+        self.counts = [0, 0, 0, 0]  # reads, writes, comparisons, swaps
+        self.ops, self.first, self.second = [], [], []
+        self.dropped = 0
+
+    @staticmethod
+    def compile(source):
+        tree = _CountingRewriter().visit(ast.parse(source, USER_FILENAME))
+        return compile(ast.fix_missing_locations(tree), USER_FILENAME, 'exec')
+
+    def helpers(self):
+        counts, ops, first, second = self.counts, self.ops, self.first, self.second
+        max_events = self.max_events
+        position = [None]
+        compare_ops = [fn for _, fn in _COMPARISONS]
+        update_ops = [fn for _, fn in _AUGMENTED]
+
+        def log(op, i, j):
+            if max_events is None or len(ops) < max_events:
+                ops.append(op)
+                first.append(i)
+                second.append(j)
+            else:
+                self.dropped += 1
+
+        def index(items, i):
+            """``i`` as a position in ``items``, or ``None`` if it does not count."""
+            if isinstance(items, list) and type(i) is int:
+                return i + len(items) if i < 0 else i
+            return None
+
+        def get(items, i):
+            position[0] = index(items, i)
+            if position[0] is not None:
+                counts[0] += 1
+            return items[i]
+
+        def last_position():
+            i, position[0] = position[0], None
+            return i
+
+        def write(items, i, value):
+            items[i] = value
+            i = index(items, i)
+            if i is not None:
+                counts[1] += 1
+                log("w", i, value if type(value) in (int, float) else None)
+
+        def set_(value, items, i):
+            write(items, i, value)
+
+        def update(items, i, op, value):
+            value = update_ops[op](get(items, i), value)
+            position[0] = None
+            write(items, i, value)
+
+        def swap(items, i, j):
+            items[i], items[j] = items[j], items[i]
+            i, j = index(items, i), index(items, j)
+            if i is not None and j is not None:
+                counts[0] += 2
+                counts[1] += 2
+                counts[3] += 1
+                log("s", i, j)
+
+        def compare(op, left, i, right, j):
+            if i is not None or j is not None:
+                counts[2] += 1
+                log("c", i, j)
+            return compare_ops[op](left, right)
+
+        return {
+            "_dsv_get": get,
+            "_dsv_position": last_position,
+            "_dsv_set": set_,
+            "_dsv_update": update,
+            "_dsv_swap": swap,
+            "_dsv_compare": compare,
+        }
+
+    def summary(self):
+        reads, writes, comparisons, swaps = self.counts
+        return {
+            "counts": {
+                "comparisons": comparisons, "swaps": swaps,
+                "reads": reads, "writes": writes,
+            },
+            "events": {"op": "".join(self.ops), "i": self.first, "j": self.second},
+            "events_dropped": self.dropped,
+        }
+
+
+def _counts_as_line(stmt):
+    """Whether ``stmt`` runs as a line (docstrings, futures, declarations do not)."""
+    if isinstance(stmt, ast.ImportFrom):
+        return stmt.module != "__future__"
+    if isinstance(stmt, (ast.Global, ast.Nonlocal)):
+        return False
+    return not (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant)
+                and isinstance(stmt.value.value, str))
+
+
+def _parse_statements(source, line):
+    """The statements of ``source``, located at ``line`` of the user's code."""
+    statements = ast.parse(source).body
+    for statement in statements:
+        for node in ast.walk(statement):
+            if "lineno" in node._attributes:
+                node.lineno = node.end_lineno = line
+                node.col_offset = node.end_col_offset = 0
+    return statements
+
+
+# Statements run where a line of the user's code starts, when it is timed.
+# The clock is read once, so each line's time includes this bookkeeping.
+_LINE_START = """
+_dsv_now = _dsv_clock()
+_dsv_totals[_dsv_line] += _dsv_now - _dsv_last
+_dsv_hits[{line}] += 1
+_dsv_line = {line}
+_dsv_last = _dsv_now
+"""
+_FRAME_START = "_dsv_line = 0\n_dsv_last = _dsv_clock()"
+_FRAME_END = "_dsv_totals[_dsv_line] += _dsv_clock() - _dsv_last"
+
+_SCOPES = (ast.Module, ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+class _LineRewriter(ast.NodeTransformer):
+    """
+    Puts hit counting, and in modules and functions timing, before each line.
+
+    Each frame keeps the line it is on in ``_dsv_line`` and when that line
+    started in ``_dsv_last``; the next line, or leaving the frame, adds the
+    time since to ``_dsv_totals``. Class bodies, whose locals become class
+    attributes, only count hits. ``while`` loops without ``else`` become
+    ``while True`` loops that mark their header before testing it, so the
+    test's time goes to the header line rather than the last line of the
+    body.
+    """
+
+    def __init__(self):
+        self._timed = []
+
+    def _line_start(self, line):
+        if self._timed[-1]:
+            return _parse_statements(_LINE_START.format(line=line), line)
+        return _parse_statements(f"_dsv_hits[{line}] += 1", line)
+
+    def _count(self, body, line=None):
+        counted = []
+        for stmt in body:
+            if (stmt.lineno != line and _counts_as_line(stmt)
+                    and not getattr(stmt, "_dsv_marked", False)):
+                counted.extend(self._line_start(stmt.lineno))
+                line = stmt.lineno
+            counted.append(stmt)
+        return counted
+
+    def _loop(self, node):
+        header = self._line_start(node.lineno)
+        if isinstance(node, ast.While) and not node.orelse:
+            test = ast.UnaryOp(ast.Not(), node.test)
+            header.append(ast.If(test, [ast.Break()], []))
+            node.test = ast.Constant(True)
+            node._dsv_marked = True
+        node.body[:0] = header
+
+    def _time_frame(self, node):
+        body = node.body
+        leading = 0
+        while leading < len(body) and not _counts_as_line(body[leading]):
+            leading += 1
+        line = getattr(node, "lineno", 1)
+        node.body = body[:leading] + _parse_statements(_FRAME_START, line) + [
+            ast.Try(body[leading:] or [ast.Pass()], [], [],
+                    _parse_statements(_FRAME_END, line)),
+        ]
+
+    def generic_visit(self, node):
+        scope = isinstance(node, _SCOPES)
+        if scope:
+            self._timed.append(not isinstance(node, ast.ClassDef))
+        super().generic_visit(node)
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, list) and value and isinstance(value[0], ast.stmt):
+                # A body on its compound statement's line is part of that line.
+                line = getattr(node, "lineno", None) if field == "body" and not scope else None
+                setattr(node, field, self._count(value, line))
+        if isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            self._loop(node)
+        elif isinstance(node, ast.ExceptHandler):
+            node.body[:0] = self._line_start(node.lineno)
+        if scope:
+            if self._timed.pop():
+                self._time_frame(node)
+        return node
+
+
+class LineProfiler:
+    """
+    Counts the hits and time of each line of a program run in ``profile`` mode.
+
+    ``compile()`` rewrites the program to count and time its own lines
+    (see ``_LineRewriter``) with a few bytecodes per line instead of a
+    trace function call, and without looking at locals. A line's time runs
+    until the next line in the same frame starts, so it includes the
+    functions it calls, as in other line profilers, and a recursive call
+    counts towards every frame it runs under.
+    """
+
+    def __init__(self, source):
+        # Index 0 collects the time before a frame's first line.
+        size = source.count("\n") + 2
+        self.hits = [0] * size
+        self.totals = [0] * size
+
+    @staticmethod
+    def compile(source):
+        tree = _LineRewriter().visit(ast.parse(source, USER_FILENAME))
+        return compile(ast.fix_missing_locations(tree), USER_FILENAME, 'exec')
+
+    def helpers(self):
+        return {
+            "_dsv_hits": self.hits,
+            "_dsv_totals": self.totals,
+            "_dsv_clock": time.perf_counter_ns,
+        }
+
+    def summary(self):
+        """Hits and time of each line run, by line number."""
+        return {
+            "lines": {
+                line: {"hits": hits, "total_ns": total}
+                for line, (hits, total) in enumerate(zip(self.hits, self.totals))
+                if line and hits
+            },
+        }
+
+
+class StackSampler:
+    """
+    Samples the call stack of a program run in ``sample`` mode.
+
+    Takes the place of a step backend. Every ``interval_us`` of wall time a
+    timer signal records the functions of the user's code on the stack,
+    weighted by the time since the previous sample. Only the innermost
+    ``max_depth`` frames are walked, under a "[truncated]" frame, so a
+    sample of deep recursion costs no more than one of a shallow stack.
+    Whenever sampling has taken more than ``max_overhead`` of the run time
+    so far, the interval doubles. Python runs the handler between
+    bytecodes, so a long builtin call is charged to the function that made
+    it. Platforms without ``signal.setitimer`` get no samples.
+    """
+
+    TRUNCATED = "[truncated]"
+
+    def __init__(self, interval_us=1000, max_depth=256, max_overhead=0.05):
+        self.interval_us = interval_us
+        self.max_depth = max_depth
+        self.max_overhead = max_overhead
+        self.frames = []
+        self._frame_ids = {}
+        # Time sampled per stack, a tuple of frame ids outermost first.
+        self.stacks = {}
+        self.samples = 0
+        self.spent_ns = 0
+        self.elapsed_ns = 0
+        self._start_ns = self._last_ns = 0
+        self._handler = None
+
+    def start(self, code):
+        self._start_ns = self._last_ns = time.perf_counter_ns()
+        if hasattr(signal, "setitimer"):
+            self._handler = signal.signal(signal.SIGALRM, self._sample) or signal.SIG_DFL
+            self._arm()
+
+    def stop(self):
+        if self._handler is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._handler)
+            self._handler = None
+        self.elapsed_ns = time.perf_counter_ns() - self._start_ns
+
+    def _arm(self):
+        interval = self.interval_us / 1e6
+        signal.setitimer(signal.ITIMER_REAL, interval, interval)
+
+    def _frame_id(self, key, name, line=None):
+        frame_id = self._frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self._frame_ids[key] = len(self.frames)
+            self.frames.append({"name": name, "line": line})
+        return frame_id
+
+    def _sample(self, signum, frame):
+        now = time.perf_counter_ns()
+        stack = []
+        for _ in range(self.max_depth):
+            if frame is None:
+                break
+            code = frame.f_code
+            if code.co_filename == USER_FILENAME:
+                name = getattr(code, "co_qualname", code.co_name)
+                stack.append(self._frame_id(code, name, code.co_firstlineno))
+            frame = frame.f_back
+        else:
+            if frame is not None:
+                stack.append(self._frame_id(self.TRUNCATED, self.TRUNCATED))
+        if stack:
+            stack = tuple(reversed(stack))
+            self.stacks[stack] = self.stacks.get(stack, 0) + now - self._last_ns
+            self.samples += 1
+        self._last_ns = now
+        end = time.perf_counter_ns()
+        self.spent_ns += end - now
+        if self.spent_ns > self.max_overhead * (end - self._start_ns):
+            self.interval_us *= 2
+            self._arm()
+
+    def summary(self):
+        """The frames, stacks and their time in microseconds (see ``flamegraph``)."""
+        return {
+            "frames": self.frames,
+            "stacks": [list(stack) for stack in self.stacks],
+            "weights": [ns // 1000 for ns in self.stacks.values()],
+            "samples": self.samples,
+            "interval_us": self.interval_us,
+            "overhead": round(self.spent_ns / max(self.elapsed_ns, 1), 4),
+        }
+
+
+def run_job(job, channel, code=None):
+    """
+    Compile and run ``job["code"]`` under the tracer.
+
+    Steps are sent to ``channel`` as they are recorded; the returned result
+    payload is not sent, so callers can add to it first. With
+    ``job["limits"]["output_bytes"]``, a program printing more than that to
+    stdout or stderr is stopped and the payload has ``output_truncated``.
+    ``code`` is the already compiled code, if any (see ``compile_job()``).
+
+    A job with ``"mode": "count"`` records no steps; its payload has the
+    ``operations`` of an ``OperationCounter`` instead. So does one with
+    ``"mode": "profile"``, whose payload has the ``profile`` of a
+    ``LineProfiler``, and one with ``"mode": "sample"``, whose payload has
+    the ``stack_samples`` of a ``StackSampler``.
+    """
+    options = job.get("trace") or {}
+    recorder = StepRecorder(
+        channel.step,
+        mode=options.get("mode", "full"),
+        max_steps=options.get("max_steps"),
+        max_bytes=options.get("max_bytes"),
+        max_items=options.get("max_items"),
+        max_nodes=options.get("max_nodes"),
+        watch=options.get("watch"),
+        max_lines=options.get("max_lines"),
+    )
+    backend_name = options.get("backend") or "auto"
+    if backend_name == "auto" or backend_name not in BACKENDS or (
+        backend_name == "monitoring" and not hasattr(sys, "monitoring")
+    ):
+        backend_name = default_backend()
+    backend = BACKENDS[backend_name](recorder)
+    user_globals = {
+        "__name__": "__main__",
+        "__builtins__": builtins,
+        "_input_data": job.get("input_data") or [],
+    }
+    counter = profiler = sampler = None
+    mode = job.get("mode")
+    if mode == "count":
+        counter = OperationCounter(options.get("max_events"))
+        user_globals.update(counter.helpers())
+        backend = None
+    elif mode == "profile":
+        profiler = LineProfiler(job["code"])
+        user_globals.update(profiler.helpers())
+        backend = None
+    elif mode == "sample":
+        backend = sampler = StackSampler(**options.get("sampling", {}))
+
+    limit = None
+    output_bytes = (job.get("limits") or {}).get("output_bytes")
+    streams = sys.stdout, sys.stderr
+    if output_bytes is not None:
+        sys.stdout = CappedOutput(sys.stdout, output_bytes)
+        sys.stderr = CappedOutput(sys.stderr, output_bytes)
+    capped = sys.stdout, sys.stderr
+    start = time.perf_counter_ns()
+    try:
+        if code is None:
+            code = compile_job(job)
+        if backend is not None:
+            backend.start(code)
+        try:
+            with _user_code():
+                exec(code, user_globals)
+        finally:
+            if backend is not None:
+                backend.stop()
+            recorder.encoder.close()
+        success, error = True, ""
+    except SystemExit as e:
+        success, error = e.code in (None, 0), ""
+    except LimitExceeded as e:
+        success, error, limit = False, str(e), e.limit
+    except MemoryError:
+        limit = "memory"
+        success, error = False, str(LimitExceeded(limit))
+    except Exception as e:
+        success, error = False, str(e)
+        if isinstance(e, OSError) and e.errno == errno.EFBIG:
+            limit = "file_size"
+            error = f"{LimitExceeded(limit)} ({error})"
+    finally:
+        sys.stdout, sys.stderr = streams
+    elapsed_ns = time.perf_counter_ns() - start
+
+    payload = {
+        "success": success,
+        "execution_time_ms": elapsed_ns // 1_000_000,
+        "timings": {
+            "run": (elapsed_ns - recorder.serialize_ns) / 1e6,
+            "trace_serialize": recorder.serialize_ns / 1e6,
+        },
+    }
+    if error:
+        payload["error"] = error
+    if limit:
+        payload["limit_exceeded"] = limit
+    if any(getattr(stream, "truncated", False) for stream in capped):
+        payload["output_truncated"] = True
+    if recorder.truncated:
+        payload["truncated"] = {
+            "reason": recorder.truncated,
+            "steps": recorder.count,
+        }
+    if counter is not None:
+        payload["operations"] = counter.summary()
+    elif profiler is not None:
+        payload["profile"] = profiler.summary()
+    elif sampler is not None:
+        payload["stack_samples"] = sampler.summary()
+    return payload
+
+
+def compile_job(job):
+    """The code object of ``job["code"]``, rewritten for its mode if need be."""
+    if job.get("mode") == "count":
+        return OperationCounter.compile(job["code"])
+    if job.get("mode") == "profile":
+        return LineProfiler.compile(job["code"])
+    return compile(job["code"], USER_FILENAME, 'exec')
+
+
+def run_batch(job, channel):
+    """
+    Run ``job["code"]`` once per input in ``job["cases"]``.
+
+    The code is compiled once. Each case runs in fresh globals with its own
+    step recorder, captured output and CPU budget, so an exception or limit
+    in one case does not affect the next. Every case's payload, with its
+    ``index``, output and steps, goes to ``channel`` as a ``case`` event as
+    soon as it finishes. Returns the payload of the whole batch.
+    """
+    try:
+        code = compile_job(job)
+    except Exception as e:
+        return {"success": False, "error": str(e), "execution_time_ms": 0}
+    cpu_seconds = (job.get("limits") or {}).get("cpu_seconds")
+    recursion_limit = sys.getrecursionlimit()
+    streams = sys.stdout, sys.stderr
+    timings = {"run": 0.0, "trace_serialize": 0.0}
+    passed = 0
+    start = time.perf_counter_ns()
+    for index, input_data in enumerate(job["cases"]):
+        steps = StepList()
+        stdout, stderr = io.StringIO(), io.StringIO()
+        sys.stdout, sys.stderr = stdout, stderr
+        try:
+            _limit_cpu(cpu_seconds)
+            payload = run_job({**job, "input_data": input_data}, steps, code)
+        finally:
+            sys.stdout, sys.stderr = streams
+            sys.setrecursionlimit(recursion_limit)
+        payload.update(index=index, output=stdout.getvalue(), stderr=stderr.getvalue())
+        channel.case(payload, steps.steps)
+        passed += payload["success"]
+        for phase in timings:
+            timings[phase] += payload["timings"][phase]
+    elapsed_ns = time.perf_counter_ns() - start
+    return {
+        "success": passed == len(job["cases"]),
+        "execution_time_ms": elapsed_ns // 1_000_000,
+        "timings": timings,
+    }
+
+
+def run_timed(job, channel):
+    """
+    Run ``job["code"]`` untraced, to time it on ``job["input_data"]``.
+
+    The code is compiled once and run ``job["timing"]["warmup"]`` times and
+    then ``job["timing"]["repetitions"]`` times more, each run in fresh
+    globals on a fresh copy of the input, with a garbage collection before
+    it and what it prints discarded. The times of the repetitions go to
+    ``channel`` as a ``timing`` event. Stops at the first run that fails.
+    """
+    timing = job["timing"]
+    try:
+        code = compile(job["code"], USER_FILENAME, 'exec')
+    except Exception as e:
+        return {"success": False, "error": str(e), "execution_time_ms": 0}
+    encoded = json.dumps(job.get("input_data") or [])
+    streams = sys.stdout, sys.stderr
+    times, error, limit = [], "", None
+    with open(os.devnull, "w") as discard:
+        for run in range(timing["warmup"] + timing["repetitions"]):
+            user_globals = None
+            gc.collect()
+            start = time.perf_counter_ns()
+            try:
+                # Decoded in here so that running out of memory or CPU time
+                # on a large input ends the run like the program would.
+                user_globals = {
+                    "__name__": "__main__",
+                    "__builtins__": builtins,
+                    "_input_data": json.loads(encoded),
+                }
+                sys.stdout = sys.stderr = discard
+                start = time.perf_counter_ns()
+                with _user_code():
+                    exec(code, user_globals)
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    error = f"exit status {e.code}"
+            except LimitExceeded as e:
+                error, limit = str(e), e.limit
+            except MemoryError:
+                limit = "memory"
+                error = str(LimitExceeded(limit))
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            finally:
+                sys.stdout, sys.stderr = streams
+            elapsed_ns = time.perf_counter_ns() - start
+            if error:
+                break
+            if run >= timing["warmup"]:
+                times.append(elapsed_ns)
+    payload = {"success": not error, "execution_time_ms": sum(times) // 1_000_000}
+    if error:
+        payload["error"] = error
+    else:
+        channel.timing(times)
+    if limit:
+        payload["limit_exceeded"] = limit
+    return payload
+
+
+def _run(job, channel):
+    if "timing" in job:
+        return run_timed(job, channel)
+    return (run_batch if "cases" in job else run_job)(job, channel)
+
+
+def _run_captured(job, channel):
+    """Run a job with the user's stdio redirected into in-memory buffers."""
+    stdout, stderr = io.StringIO(), io.StringIO()
+    saved = sys.stdin, sys.stdout, sys.stderr
+    recursion_limit = sys.getrecursionlimit()
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(), stdout, stderr
+    try:
+        _limit_cpu((job.get("limits") or {}).get("cpu_seconds"))
+        payload = _run(job, channel)
+    finally:
+        _limit_cpu(None)
+        sys.stdin, sys.stdout, sys.stderr = saved
+        sys.setrecursionlimit(recursion_limit)
+    payload["output"] = stdout.getvalue()
+    payload["stderr"] = stderr.getvalue()
+    return payload
+
+
+def _catch_cpu_limit():
+    """Turn SIGXCPU (``RLIMIT_CPU`` soft limit reached) into ``LimitExceeded``."""
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _cpu_exceeded)
+
+
+def _relay(events_fd, channel):
+    """
+    Copy event lines from ``events_fd`` to ``channel`` up to the result event.
+
+    Returns whether there was one; anything sent after it is dropped.
+    """
+    pending = bytearray()
+    while True:
+        chunk = os.read(events_fd, 65536)
+        if not chunk:
+            return False
+        start = len(pending)
+        pending += chunk
+        end = pending.rfind(b"\n", start)
+        if end < 0:
+            continue
+        lines, pending = pending[:end + 1], pending[end + 1:]
+        for line in lines.splitlines(keepends=True):
+            channel.stream.write(line.decode("utf-8", errors="replace"))
+            if line.startswith(b'{"event": "result"'):
+                channel.stream.flush()
+                return True
+        channel.stream.flush()
+
+
+def _exit_error(status):
+    """The error of a job whose child ended with ``status`` and no result."""
+    if os.WIFSIGNALED(status):
+        return f"The program was killed by signal {os.WTERMSIG(status)}."
+    return f"The program exited with status {os.waitstatus_to_exitcode(status)}."
+
+
+def _run_forked(job, jobs, channel):
+    """
+    Run ``job`` in a child forked from this worker, relaying its events.
+
+    Whatever the job changes (builtins, ``sys.modules``, classes, signal
+    handlers, limits) goes away with the child, which inherits the
+    worker's imports copy-on-write. The child cannot reach the job stream
+    or the worker's channel: it sends its events through a pipe of its
+    own, read only up to its result event.
+    """
+    channel.stream.flush()
+    events_fd, child_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(events_fd)
+            jobs.close()
+            channel.stream.close()
+            own = Channel(os.fdopen(child_fd, "w", encoding="utf-8"))
+            own.result(_run_captured(job, own))
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(child_fd)
+    try:
+        finished = _relay(events_fd, channel)
+    finally:
+        os.close(events_fd)
+    if finished:
+        # It may have sent a result early and kept running.
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    _, status = os.waitpid(pid, 0)
+    if not finished:
+        channel.result({
+            "success": False,
+            "error": _exit_error(status),
+            "execution_time_ms": 0,
+            "output": "",
+            "stderr": "",
+        })
+
+
+def worker_main():
+    """Serve jobs from stdin until it is closed by the parent process."""
+    # Keep private copies of the pipes for the protocol and point the real
+    # stdio descriptors at /dev/null, so nothing user code does can read
+    # the job stream or write into the event stream.
+    jobs = os.fdopen(os.dup(0), "r", encoding="utf-8")
+    channel = Channel(os.fdopen(os.dup(1), "w", encoding="utf-8"))
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    _catch_cpu_limit()
+
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+
+    while True:
+        line = jobs.readline()
+        if not line:
+            break
+        if hasattr(os, "fork"):
+            _run_forked(json.loads(line), jobs, channel)
+        else:
+            channel.result(_run_captured(json.loads(line), channel))
+
+
+def main(args):
+    _catch_cpu_limit()
+    job = json.loads(sys.stdin.read())
+    if "--channel-fd" in args:
+        fd = int(args[args.index("--channel-fd") + 1])
+        channel = Channel(os.fdopen(fd, "w", encoding="utf-8"))
+    else:
+        channel = Channel(sys.stdout, prefix=EVENT_PREFIX)
+    payload = _run(job, channel)
+    sys.stdout.flush()
+    channel.result(payload)
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv[1:]:
+        worker_main()
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,223 @@
+"""
+Pool of warm Python tracer workers.
+
+Starting a fresh interpreter for every execution dominates the latency of
+short programs, so workers are started ahead of time, fed jobs over a pipe
+and replaced after a fixed number of jobs, a timeout or a crash. Each job
+runs in a child the worker forks for it, so jobs share the worker's
+imports but nothing they change (see ``tracer._run_forked``).
+"""
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from . import conf, sandbox
+
+TRACER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tracer.py")
+
+
+class WorkerTimeout(Exception):
+    """The job did not finish in time and its worker was killed."""
+
+
+class WorkerCrashed(Exception):
+    """The worker exited before answering the job."""
+
+
+class PythonWorker:
+    """
+    A single warm interpreter running ``tracer.py --worker``.
+
+    It is started under the sandbox limits except ``RLIMIT_CPU``, which the
+    worker sets per job from the job's ``limits``, in a session of its own
+    so that stopping it also stops the job it has forked.
+    """
+
+    def __init__(self):
+        self.jobs_served = 0
+        self.process = subprocess.Popen(
+            [sys.executable, TRACER_PATH, "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            preexec_fn=sandbox.preexec("python"),
+            env=sandbox.python_env(),
+            start_new_session=True,
+        )
+        self._results = queue.Queue()
+        threading.Thread(target=self._read_results, daemon=True).start()
+
+    def _read_results(self):
+        for line in self.process.stdout:
+            self._results.put(line)
+        self._results.put(None)
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def stream(self, job, timeout, timer=None):
+        """
+        Send ``job`` to the worker and yield its trace events as they arrive.
+
+        The last event yielded is the ``result`` event. The whole job must
+        finish within ``timeout`` seconds. ``timer`` (a
+        ``metrics.PhaseTimer``) collects the write and parse phases.
+        """
+        self.jobs_served += 1
+        deadline = time.monotonic() + timeout
+        start = time.perf_counter()
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except OSError as exc:
+            raise WorkerCrashed(str(exc)) from exc
+        if timer is not None:
+            timer.add("write", time.perf_counter() - start)
+
+        while True:
+            try:
+                line = self._results.get(
+                    timeout=max(0, deadline - time.monotonic())
+                )
+            except queue.Empty:
+                self.stop()
+                raise WorkerTimeout()
+            if line is None:
+                raise WorkerCrashed("Worker process exited unexpectedly.")
+            start = time.perf_counter()
+            event = json.loads(line)
+            if timer is not None:
+                timer.add("parse", time.perf_counter() - start)
+            yield event
+            if event["event"] == "result":
+                return
+
+    def stop(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+
+
+class PythonWorkerPool:
+    """
+    A fixed-size set of workers handed out to one job at a time.
+
+    Workers are ``PythonWorker``s unless another ``worker_factory`` with
+    the same interface is given (see ``java_runner.JavaWorker``).
+    """
+
+    def __init__(self, size, max_jobs, worker_factory=PythonWorker):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.worker_factory = worker_factory
+        self.pid = os.getpid()
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._live = 0
+
+    def _spawn(self):
+        try:
+            return self.worker_factory()
+        except OSError:
+            with self._lock:
+                self._live -= 1
+            raise
+
+    def start(self):
+        """Start workers until the pool is full."""
+        with self._lock:
+            missing = self.size - self._live
+            self._live += missing
+        for started in range(missing):
+            try:
+                worker = self._spawn()
+            except OSError:
+                # _spawn() released its own slot; release the ones left.
+                with self._lock:
+                    self._live -= missing - started - 1
+                raise
+            self._idle.put(worker)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_spawn = self._live < self.size
+            if can_spawn:
+                self._live += 1
+        if can_spawn:
+            return self._spawn()
+        return self._idle.get()
+
+    def _checkin(self, worker):
+        if worker.alive and worker.jobs_served < self.max_jobs:
+            self._idle.put(worker)
+            return
+        worker.stop()
+        try:
+            self._idle.put(self._spawn())
+        except OSError:
+            pass
+
+    def stream(self, job, timeout, timer=None):
+        """
+        Run ``job`` on an idle worker, yielding its trace events.
+
+        Waiting for a worker (or starting one) counts as the spawn phase.
+        """
+        start = time.perf_counter()
+        worker = self._checkout()
+        if not worker.alive:
+            worker.stop()
+            worker = self._spawn()
+        if timer is not None:
+            timer.add("spawn", time.perf_counter() - start)
+        finished = False
+        try:
+            yield from worker.stream(job, timeout, timer)
+            finished = True
+        finally:
+            if not finished:
+                # The consumer gave up mid-job; the worker is still busy.
+                worker.stop()
+            self._checkin(worker)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool, or ``None`` when pooling is disabled."""
+    global _pool
+    if conf.get("PYTHON_POOL_SIZE") <= 0:
+        return None
+    with _pool_lock:
+        # A pool inherited through fork() has no reader threads; start over.
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = PythonWorkerPool(
+                size=conf.get("PYTHON_POOL_SIZE"),
+                max_jobs=conf.get("PYTHON_POOL_MAX_JOBS"),
+            )
+    return _pool
+
+
+def warm_up():
+    """Start all pool workers ahead of the first request."""
+    pool = get_pool()
+    if pool is not None:
+        pool.start()
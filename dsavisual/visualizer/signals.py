@@ -0,0 +1,32 @@
+"""
+Keep precomputed traces in step with the snippets and inputs they came from.
+"""
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from concepts.models import CodeSnippet
+from .models import VisualizationConfig
+from .services import conf, precompute
+
+
+@receiver(post_save, sender=CodeSnippet)
+def snippet_saved(sender, instance, raw=False, **kwargs):
+    if raw or not conf.get("PRECOMPUTE_ON_SAVE"):
+        return
+    transaction.on_commit(lambda: precompute.invalidate(instance))
+
+
+@receiver(post_save, sender=VisualizationConfig)
+def config_saved(sender, instance, raw=False, **kwargs):
+    if raw or not conf.get("PRECOMPUTE_ON_SAVE"):
+        return
+    snippets = CodeSnippet.objects.filter(
+        section__concept=instance.concept_id, is_final_code=True
+    ).select_related("section__concept__visualization")
+
+    def invalidate_all():
+        for snippet in snippets:
+            precompute.invalidate(snippet)
+
+    transaction.on_commit(invalidate_all)
@@ -1,3 +1,1574 @@
-from django.test import TestCase
+import asyncio
+import collections
+import gzip
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import CommandError, call_command
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+
+from concepts.models import CodeSnippet, Concept, ConceptSection
+from core.models import Category, Topic
+
+from . import apps, renderers, serializers
+from .benchmarks import corpus, runner
+from .models import PrecomputedTrace, VisualizationConfig
+from .services import (
+    async_executor, compile_cache, complexity, executor, flamegraph, java_runner, jobs,
+    metrics, native_profiler, native_tracer, pch, precompute, result_cache, sandbox,
+    trace_store, tracer, worker_pool,
+)
+
+
+def run_on(pool, code, input_data=None, timeout=10, **kwargs):
+    """Run ``code`` on ``pool`` and return its result event's data."""
+    job = executor.python_job(code, input_data, **kwargs)
+    events = list(pool.stream(job, timeout))
+    return events[-1]["data"]
+
+
+class WorkerPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.pool = worker_pool.PythonWorkerPool(size=1, max_jobs=10)
+        self.addCleanup(self._stop_pool)
+
+    def _stop_pool(self):
+        while not self.pool._idle.empty():
+            self.pool._idle.get().stop()
+
+    def test_worker_is_reused(self):
+        run_on(self.pool, "print(1)")
+        worker = self.pool._idle.get()
+        self.pool._idle.put(worker)
+        result = run_on(self.pool, "print(2)")
+        self.assertEqual(result["output"], "2\n")
+        self.assertIs(self.pool._idle.get(), worker)
+        self.assertEqual(worker.jobs_served, 2)
+        self.pool._idle.put(worker)
+
+    def test_builtins_changes_do_not_reach_the_next_job(self):
+        run_on(self.pool, "import builtins\nbuiltins.sorted = lambda x, **k: 'pwned'")
+        result = run_on(self.pool, "print(sorted([2, 1]))")
+        self.assertEqual(result["output"], "[1, 2]\n")
+
+    def test_module_changes_do_not_reach_the_next_job(self):
+        run_on(self.pool, "import sys, math\nsys.modules['math'] = None\nmath.pi = 3")
+        result = run_on(self.pool, "import math\nprint(math.pi)")
+        self.assertEqual(result["output"], "3.141592653589793\n")
+
+    def test_job_cannot_reach_the_worker_pipes(self):
+        code = (
+            "import os\n"
+            "fds = os.listdir('/proc/self/fd')\n"
+            "links = [os.readlink('/proc/self/fd/' + fd) for fd in fds\n"
+            "         if os.path.exists('/proc/self/fd/' + fd)]\n"
+            "print(sum(link.startswith('pipe:') for link in links))"
+        )
+        # Only the job's own event pipe.
+        self.assertEqual(run_on(self.pool, code)["output"], "1\n")
+
+    def test_events_after_the_result_are_dropped(self):
+        code = (
+            "import gc\n"
+            "channel = next(o for o in gc.get_objects()\n"
+            "               if type(o).__name__ == 'Channel')\n"
+            "channel.result({'success': True, 'output': 'forged'})\n"
+            "channel.stream.write('{\"event\": \"result\", \"data\": {\"output\": \"leak\"}}\\n')\n"
+            "channel.stream.flush()\n"
+        )
+        run_on(self.pool, code)
+        self.assertEqual(run_on(self.pool, "print('next')")["output"], "next\n")
+
+    def test_cpu_limit_stops_the_job_not_the_worker(self):
+        code = "x = [1]\nwhile True:\n    x.append(x.pop())"
+        result = run_on(self.pool, code, cpu_seconds=1)
+        self.assertEqual(result["limit_exceeded"], "cpu_time")
+        self.assertEqual(run_on(self.pool, "print('ok')")["output"], "ok\n")
+
+    def test_hash_seed_is_fixed(self):
+        code = "import sys\nprint(sys.flags.hash_randomization, hash('abc'))"
+        self.assertEqual(
+            run_on(self.pool, code)["output"],
+            executor.execute_python_code(code)["output"] + "\n",
+        )
+        self.assertTrue(run_on(self.pool, code)["output"].startswith("0 "))
+
+    def test_crashed_job_reports_an_error(self):
+        result = run_on(self.pool, "import os\nos._exit(3)")
+        self.assertFalse(result["success"])
+        self.assertIn("status 3", result["error"])
+        self.assertEqual(run_on(self.pool, "print('ok')")["output"], "ok\n")
+
+
+class WarmUpTests(SimpleTestCase):
+    def serving(self, *argv, **environ):
+        with mock.patch("sys.argv", list(argv)), mock.patch.dict("os.environ", environ):
+            return apps._is_serving()
+
+    def test_servers_warm_up(self):
+        self.assertTrue(self.serving("/usr/bin/gunicorn", "dsavisual.wsgi"))
+        self.assertTrue(self.serving("/venv/bin/uvicorn", "dsavisual.asgi:application"))
+        self.assertTrue(self.serving("/lib/python3/site-packages/gunicorn/__main__.py"))
+        self.assertTrue(self.serving("manage.py", "runserver", "--noreload"))
+        self.assertTrue(self.serving("manage.py", "runserver", RUN_MAIN="true"))
+
+    def test_other_processes_do_not(self):
+        self.assertFalse(self.serving("manage.py", "runserver", RUN_MAIN=""))
+        self.assertFalse(self.serving("manage.py", "migrate"))
+        self.assertFalse(self.serving("/venv/bin/pytest", "-q"))
+        self.assertFalse(self.serving("/venv/bin/celery", "-A", "dsavisual", "worker"))
+        self.assertFalse(self.serving("-c"))
+        self.assertFalse(self.serving(""))
+
+    def test_always_warms_up_anywhere(self):
+        self.assertTrue(apps._warms_up("always", False))
+        self.assertTrue(apps._warms_up(True, True))
+        self.assertFalse(apps._warms_up(True, False))
+        self.assertFalse(apps._warms_up(False, True))
+
+
+class CpuLimitTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(tracer._cpu.update, in_user_code=False, exceeded=False)
+
+    def test_signal_in_user_code_stops_it(self):
+        with self.assertRaises(tracer.LimitExceeded):
+            with tracer._user_code():
+                tracer._cpu_exceeded(None, None)
+
+    def test_signal_outside_user_code_waits_for_it(self):
+        tracer._cpu_exceeded(None, None)
+        with self.assertRaises(tracer.LimitExceeded):
+            with tracer._user_code():
+                self.fail("user code ran past its CPU limit")
+
+    def test_budget_counts_from_the_time_used(self):
+        usage = mock.Mock(ru_utime=2.6, ru_stime=0.3)
+        with mock.patch.object(tracer.resource, "getrusage", return_value=usage), \
+                mock.patch.object(tracer.resource, "getrlimit",
+                                  return_value=(-1, tracer.resource.RLIM_INFINITY)), \
+                mock.patch.object(tracer.resource, "setrlimit") as setrlimit:
+            tracer._limit_cpu(2)
+        setrlimit.assert_called_once_with(
+            tracer.resource.RLIMIT_CPU, (5, tracer.resource.RLIM_INFINITY))
+
+
+@unittest.skipUnless(shutil.which("gcc"), "gcc not installed")
+class MemoryLimitTests(SimpleTestCase):
+    def test_crash_on_failed_malloc_is_the_memory_limit(self):
+        code = (
+            "#include <stdlib.h>\n"
+            "int main(void) {\n"
+            "    long *big = malloc(1L << 34);\n"
+            "    big[0] = 1;\n"
+            "    return 0;\n"
+            "}\n"
+        )
+        for execute in (executor.execute_c_code, lambda code: asyncio.run(
+            async_executor.execute_code_async(code, language="c")
+        )):
+            result = execute(code)
+            self.assertEqual(result["limit_exceeded"], "memory")
+            self.assertIn("SIGSEGV", result["error"])
+            self.assertNotIn("DSAVISUAL", result["error"])
+
+    def test_null_dereference_is_not_the_memory_limit(self):
+        code = (
+            "#include <stdio.h>\n"
+            "int main(void) {\n"
+            "    int *p = 0;\n"
+            "    printf(\"%d\", *p);\n"
+            "    return 0;\n"
+            "}\n"
+        )
+        result = executor.execute_c_code(code)
+        self.assertNotIn("limit_exceeded", result)
+        self.assertEqual(result["error"], "The program was killed by signal SIGSEGV.")
+
+    def test_bad_alloc_is_the_memory_limit(self):
+        code = (
+            "#include <vector>\n"
+            "int main() {\n"
+            "    std::vector<long> v;\n"
+            "    for (;;) v.push_back(1);\n"
+            "}\n"
+        )
+        result = executor.execute_cpp_code(code)
+        self.assertEqual(result["limit_exceeded"], "memory")
+
+    def test_handled_allocation_failure_is_not_a_limit(self):
+        code = (
+            "#include <stdio.h>\n"
+            "#include <stdlib.h>\n"
+            "int main(void) {\n"
+            "    puts(malloc(1L << 34) ? \"big\" : \"none\");\n"
+            "    return 0;\n"
+            "}\n"
+        )
+        result = executor.execute_c_code(code)
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual((result["output"], result["error"]), ("none", ""))
+
+    def test_signal_is_reported(self):
+        result = executor.compiled_result(-signal.SIGABRT, "", "")
+        self.assertNotIn("limit_exceeded", result)
+        self.assertEqual(result["error"], "The program was killed by signal SIGABRT.")
+
+    def test_signals_alone_are_not_the_memory_limit(self):
+        for signum in (signal.SIGSEGV, signal.SIGKILL):
+            self.assertIsNone(sandbox.limit_exceeded(-signum, ""))
+        stderr, failed = sandbox.split_allocation_marker(
+            "partial" + sandbox.ALLOCATION_FAILED + "after\n"
+        )
+        self.assertEqual((stderr, failed), ("partial\nafter\n", True))
+        self.assertEqual(sandbox.limit_exceeded(-signal.SIGSEGV, stderr, failed), "memory")
+
+
+def user_class(source, name):
+    """A class defined the way the tracer runs user code."""
+    namespace = {"__name__": "__main__"}
+    exec(compile(source, tracer.USER_FILENAME, "exec"), namespace)
+    return namespace[name]
+
+
+class SnapshotEncoderTests(SimpleTestCase):
+    def setUp(self):
+        self.encoder = tracer.SnapshotEncoder()
+        self.addCleanup(self.encoder.close)
+        self.Node = user_class(
+            "class Node:\n"
+            "    def __init__(self, value, next=None):\n"
+            "        self.value, self.next = value, next\n",
+            "Node",
+        )
+
+    def test_nodes_keep_their_ids_and_are_sent_when_changed(self):
+        tail = self.Node(2)
+        head = self.Node(1, tail)
+        self.assertEqual(self.encoder.encode(head), {"ref": 0})
+        self.assertEqual(self.encoder.nodes(), {
+            "0": {"type": "Node", "fields": {"value": 1, "next": {"ref": 1}}},
+            "1": {"type": "Node", "fields": {"value": 2, "next": None}},
+        })
+        self.assertEqual(self.encoder.encode(head), {"ref": 0})
+        self.assertEqual(self.encoder.nodes(), {})
+        tail.value = 3
+        self.assertEqual(self.encoder.nodes(), {
+            "1": {"type": "Node", "fields": {"value": 3, "next": None}},
+        })
+
+    def test_only_user_classes_are_patched(self):
+        self.encoder.encode([self.Node(1), random.Random(0)])
+        self.encoder.nodes()
+        self.assertIn("__setattr__", self.Node.__dict__)
+        self.assertNotIn("__setattr__", random.Random.__dict__)
+
+    def test_close_restores_the_class(self):
+        Named = user_class(
+            "class Named:\n"
+            "    def __setattr__(self, name, value):\n"
+            "        object.__setattr__(self, name, str(value))\n",
+            "Named",
+        )
+        own = Named.__dict__["__setattr__"]
+        self.encoder.encode([self.Node(1), Named()])
+        self.encoder.nodes()
+        self.encoder.close()
+        self.assertNotIn("__setattr__", self.Node.__dict__)
+        self.assertNotIn("__delattr__", self.Node.__dict__)
+        self.assertIs(Named.__dict__["__setattr__"], own)
+
+
+def failing_runner(failure, after):
+    """A ``complexity`` runner timing n as n microseconds, then raising."""
+    def runner(code):
+        def measure(input_data, warmup, repetitions, timeout):
+            if input_data["n"] > after:
+                raise failure
+            return [input_data["n"] / 1e6] * repetitions
+        return measure
+    return runner
+
+
+class ComplexityTests(SimpleTestCase):
+    def test_fit_picks_the_growth_of_the_times(self):
+        sizes = [16, 32, 64, 128, 256, 512]
+        fits = complexity.fit(sizes, [1e-4 + 1e-7 * n * n for n in sizes])
+        self.assertEqual(fits[0]["complexity"], "O(n^2)")
+        fits = complexity.fit(sizes, [1e-4 + 1e-6 * n for n in sizes])
+        self.assertEqual(fits[0]["complexity"], "O(n)")
+
+    def test_quadratic_program_stops_at_the_budget(self):
+        code = (
+            "a = _input_data['array']\n"
+            "pairs = 0\n"
+            "for x in a:\n"
+            "    for y in a:\n"
+            "        pairs += x < y\n"
+        )
+        result = complexity.analyze(code, max_size=1 << 16, time_budget=3, repetitions=3)
+        self.assertEqual(result["stopped"], "time_budget")
+        self.assertTrue(result["success"], result["error"])
+        self.assertIn(result["complexity"], ("O(n^2)", "O(n^3)"))
+
+    def test_crash_on_a_larger_size_is_the_budget(self):
+        crash = worker_pool.WorkerCrashed("Worker process exited unexpectedly.")
+        with mock.patch.object(complexity, "_python_runner", failing_runner(crash, 256)):
+            result = complexity.analyze("pass")
+        self.assertEqual(result["stopped"], "time_budget")
+        self.assertTrue(result["success"])
+        self.assertEqual(result["measurements"][-1]["n"], 256)
+
+    def test_limit_on_a_larger_size_is_the_budget(self):
+        failure = complexity.ProgramFailed({"error": "", "limit_exceeded": "memory"})
+        with mock.patch.object(complexity, "_python_runner", failing_runner(failure, 256)):
+            self.assertEqual(complexity.analyze("pass")["stopped"], "time_budget")
+
+    def test_crash_on_a_larger_size_is_an_error(self):
+        failure = complexity.ProgramFailed(
+            {"error": "The program was killed by signal SIGSEGV."}
+        )
+        with mock.patch.object(complexity, "_python_runner", failing_runner(failure, 256)):
+            result = complexity.analyze("pass")
+        self.assertEqual(result["stopped"], "error")
+        self.assertFalse(result["success"])
+
+    def test_failure_is_never_a_success(self):
+        failure = complexity.ProgramFailed({"error": "IndexError"})
+        with mock.patch.object(complexity, "_python_runner", failing_runner(failure, 256)):
+            result = complexity.analyze("pass")
+        self.assertEqual(result["stopped"], "error")
+        self.assertEqual(result["error"], "n=512: IndexError")
+        self.assertFalse(result["success"])
+        self.assertTrue(result["fits"])
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(
+            result_cache, "_backend", result_cache.LocMemBackend(60, 10, 1 << 20)
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.runs = []
+
+    def execute(self, **kwargs):
+        self.runs.append(kwargs)
+        return {"success": True, "output": str(len(self.runs))}
+
+    def cached(self, code, **kwargs):
+        return result_cache.execute_cached(self.execute, {"code": code, **kwargs})
+
+    def test_hit_after_miss(self):
+        self.assertEqual(self.cached("print(1)"), ({"success": True, "output": "1"}, "MISS"))
+        self.assertEqual(self.cached("print(1)\n"), ({"success": True, "output": "1"}, "HIT"))
+        self.assertEqual(self.cached("print(1)", input_data=[2])[1], "MISS")
+        self.assertEqual(len(self.runs), 2)
+
+    def test_nondeterministic_code_bypasses(self):
+        self.assertEqual(self.cached("import sys, random\nprint(random.random())")[1], "BYPASS")
+        self.assertEqual(self.cached("import sys, random\nprint(random.random())")[1], "BYPASS")
+        self.assertEqual(len(self.runs), 2)
+
+    def test_python_imports(self):
+        for code in (
+            "import sys, random",
+            "import os, time as clock",
+            "from datetime import date",
+            "import os.path, uuid",
+            "rng = __import__('random')",
+            "import importlib\nimportlib.import_module('secrets')",
+            "import os\nprint(os.getpid())",
+        ):
+            self.assertFalse(result_cache.is_deterministic(code, "python"), code)
+        for code in (
+            "import sys, heapq",
+            "from collections import deque",
+            "print('random', 'time')",
+            "import timeit_free_module_name",
+        ):
+            self.assertTrue(result_cache.is_deterministic(code, "python"), code)
+
+    def test_python_addresses(self):
+        self.assertFalse(result_cache.is_deterministic("print(hash(object()))", "python"))
+        self.assertFalse(result_cache.is_deterministic("print(id([]))", "python"))
+        self.assertFalse(result_cache.is_deterministic("xs.sort(key=id)", "python"))
+        self.assertTrue(result_cache.is_deterministic("node.id = 3\nprint(node.id)", "python"))
+        # String sets iterate in the same order with the fixed hash seed.
+        self.assertTrue(result_cache.is_deterministic("print(set('hello'))", "python"))
+
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+
+class AsyncExecutorTests(SimpleTestCase):
+    def test_cancelled_runs_close_their_pipes(self):
+        async def main():
+            await async_executor.execute_code_async("print(1)")
+            before = open_fds()
+            for delay in (0, 0.001, 0.005, 0.01, 0.02, 0.05):
+                try:
+                    await asyncio.wait_for(
+                        async_executor.execute_code_async("print(1)"), delay
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            result = await async_executor.execute_code_async("print(2)")
+            # Let closed transports finish closing.
+            await asyncio.sleep(0.1)
+            return before, open_fds(), result
+
+        before, after, result = asyncio.run(main())
+        self.assertEqual(result["output"], "2")
+        self.assertEqual(after, before)
+
+    def test_same_steps_as_the_blocking_path(self):
+        code = "xs = [3, 1, 2]\nxs.sort()\nprint(xs)"
+        result = asyncio.run(async_executor.execute_code_async(code, input_data=[]))
+        self.assertEqual(result["output"], "[1, 2, 3]")
+        self.assertEqual(result["steps"], executor.execute_code(code, input_data=[])["steps"])
+
+    async def test_endpoint(self):
+        response = await self.async_client.post(
+            "/api/execute/async/",
+            {"code": "print('async endpoint')", "language": "python"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["output"], "async endpoint")
+        self.assertIn(response["X-Cache"], ("MISS", "HIT"))
+        response = await self.async_client.post(
+            "/api/execute/async/", {"code": "print(1)", "language": "cobol"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_cases_come_back_in_order(self):
+        code = "print(_input_data[0] * 2)"
+        result = asyncio.run(async_executor.execute_code_async(
+            code, input_cases=[[3], [1], [2]]
+        ))
+        self.assertTrue(result["success"])
+        self.assertEqual([case["index"] for case in result["cases"]], [0, 1, 2])
+        self.assertEqual([case["output"] for case in result["cases"]], ["6", "2", "4"])
+        def untimed(cases):
+            return [
+                {k: v for k, v in case.items() if k not in ("timings", "execution_time_ms")}
+                for case in cases
+            ]
+
+        self.assertEqual(
+            untimed(result["cases"]),
+            untimed(executor.execute_batch(code, input_cases=[[3], [1], [2]])["cases"]),
+        )
+
+    def test_compiled_batch_cases_come_back_in_order(self):
+        code = (
+            "#include <stdio.h>\n"
+            "int main(void) { int x; scanf(\"%d\", &x); printf(\"%d\\n\", x * 2); "
+            "return x == 1; }\n"
+        )
+        result = asyncio.run(async_executor.execute_code_async(
+            code, "c", input_cases=[[3], [1], [2]]
+        ))
+        self.assertEqual([case["output"] for case in result["cases"]], ["6", "2", "4"])
+        self.assertEqual([case["success"] for case in result["cases"]], [True, False, True])
+        self.assertEqual(result["error"], "1 of 3 cases failed")
+
+    def test_cancelled_batch_kills_its_process(self):
+        pid_file = os.path.join(tempfile.mkdtemp(), "pid")
+        self.addCleanup(os.unlink, pid_file)
+        code = (
+            "import os\n"
+            f"open({pid_file!r}, 'w').write(str(os.getpid()))\n"
+            "while True:\n"
+            "    pass\n"
+        )
+
+        async def main():
+            run = asyncio.ensure_future(async_executor.execute_code_async(
+                code, input_cases=[[1], [2]], timeout=10
+            ))
+            while not os.path.exists(pid_file) or not os.path.getsize(pid_file):
+                await asyncio.sleep(0.05)
+            run.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await run
+
+        asyncio.run(main())
+        with open(pid_file) as f:
+            pid = int(f.read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+class RendererTests(SimpleTestCase):
+    steps = [
+        {"line": 1, "locals": {"a": 1}},
+        {"line": 2, "changed": {"a": 2}, "heap": {"0": {"type": "Node", "fields": {"a": 2}}}},
+        {"line": 3, "removed": ["a"]},
+    ]
+
+    def test_columnar_steps(self):
+        self.assertEqual(renderers.columnar_steps(self.steps), {
+            "layout": "columnar",
+            "length": 3,
+            "names": ["a", "Node"],
+            "line": [1, 2, 3],
+            "locals": [[0, 1], None, None],
+            "changed": [None, [0, 2], None],
+            "heap": [None, [0, 1, [0, 2]], None],
+            "removed": [None, None, [0]],
+        })
+
+    @unittest.skipUnless(renderers.msgpack, "msgpack is not installed")
+    def test_msgpack(self):
+        body = renderers.MessagePackRenderer().render({"success": True, "steps": self.steps})
+        data = renderers.msgpack.unpackb(body)
+        self.assertTrue(data["success"])
+        self.assertEqual(data["steps"], renderers.columnar_steps(self.steps))
+
+    @unittest.skipUnless(renderers.cbor2, "cbor2 is not installed")
+    def test_cbor(self):
+        body = renderers.CBORRenderer().render({"success": True, "steps": self.steps})
+        self.assertEqual(renderers.cbor2.loads(body)["steps"], renderers.columnar_steps(self.steps))
+
+
+class CompileCacheTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        self.cache = compile_cache.CompileCache(os.path.join(root, "cache"), 1000)
+        self.builds = []
+
+    def build(self, size):
+        def build(workdir):
+            self.builds.append(workdir)
+            time.sleep(0.05)
+            with open(os.path.join(workdir, "artifact"), "wb") as f:
+                f.write(b"x" * size)
+        return build
+
+    def test_second_build_is_a_hit(self):
+        path, hit = self.cache.get_or_build("a", self.build(10))
+        self.assertFalse(hit)
+        self.assertEqual(self.cache.get_or_build("a", self.build(10)), (path, True))
+        self.assertEqual(len(self.builds), 1)
+        self.assertTrue(os.path.isfile(os.path.join(path, "artifact")))
+
+    def test_concurrent_builds_of_a_key_run_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                self.cache.get_or_build("a", self.build(10))
+            ))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.builds), 1)
+        self.assertEqual(sorted(hit for _, hit in results), [False, True, True, True])
+
+    def test_failed_build_is_not_cached(self):
+        def fail(workdir):
+            raise compile_cache.CompilationFailed("error: expected ';'")
+
+        with self.assertRaises(compile_cache.CompilationFailed):
+            self.cache.get_or_build("a", fail)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(os.listdir(self.cache.root), [])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.get_or_build("a", self.build(400))
+        self.cache.get_or_build("b", self.build(400))
+        time.sleep(0.01)
+        self.cache.get("a")
+        self.cache.get_or_build("c", self.build(400))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+
+class JobSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        patcher = mock.patch.object(jobs, "execute_code", self.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.scheduler = jobs.JobScheduler(
+            workers=2, max_queued=3, language_limits={"c": 1}, result_ttl=60
+        )
+
+    def execute(self, code, language="python"):
+        self.release.wait(10)
+        return {"success": True, "output": code, "steps": []}
+
+    def wait_until(self, job, status):
+        deadline = time.monotonic() + 10
+        while job.status != status and time.monotonic() < deadline:
+            self.scheduler.wait_for_change(job, job.version, 0.1)
+        self.assertEqual(job.status, status)
+
+    def test_job_runs_and_keeps_its_result(self):
+        done = []
+        job = self.scheduler.submit(on_done=done.append, code="a")
+        self.wait_until(job, jobs.RUNNING)
+        self.release.set()
+        self.wait_until(job, jobs.DONE)
+        state = self.scheduler.snapshot(job)
+        self.assertEqual(state["result"]["output"], "a")
+        self.assertIn("queue_wait", state["result"]["timings"])
+        self.assertIs(self.scheduler.get(job.id), job)
+        self.assertEqual(done, [job.result])
+
+    def test_language_limit_holds_jobs_back(self):
+        first = self.scheduler.submit(code="a", language="c")
+        second = self.scheduler.submit(code="b", language="c")
+        python = self.scheduler.submit(code="c")
+        self.wait_until(first, jobs.RUNNING)
+        self.wait_until(python, jobs.RUNNING)
+        self.assertEqual(self.scheduler.snapshot(second)["queue_position"], 0)
+        self.release.set()
+        self.wait_until(second, jobs.DONE)
+
+    def test_full_queue_rejects_jobs(self):
+        self.wait_until(self.scheduler.submit(code="a", language="c"), jobs.RUNNING)
+        for code in "bcd":
+            self.scheduler.submit(code=code, language="c")
+        with self.assertRaises(jobs.QueueFull) as raised:
+            self.scheduler.submit(code="e", language="c")
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+
+
+class JobApiTests(SimpleTestCase):
+    def test_submit_and_poll(self):
+        client = Client()
+        response = client.post(
+            "/api/jobs/", {"code": "print(6 * 7)", "language": "python"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()["status_url"]
+        self.assertEqual(response["Location"], status_url)
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            state = client.get(status_url).json()
+            if state["status"] == jobs.DONE:
+                break
+            time.sleep(0.05)
+        self.assertEqual(state["result"]["output"], "42")
+        self.assertEqual(client.get("/api/jobs/missing/").status_code, 404)
+
+
+def replay_deltas(steps):
+    """The ``(line, locals)`` of every step of a delta trace, rebuilt."""
+    frames, replayed = {}, []
+    for step in steps:
+        for frame_id in step.get("exited", ()):
+            frames.pop(frame_id, None)
+        state = frames.setdefault(step["frame"], {})
+        state.update(step.get("changed", {}))
+        for name, patch in step.get("patched", {}).items():
+            state[name] = list(state[name])
+            for index, value in patch.items():
+                state[name][int(index)] = value
+        for name in step.get("removed", ()):
+            del state[name]
+        replayed.append((step["line"], dict(state)))
+    return replayed
+
+
+class DeltaTraceTests(SimpleTestCase):
+    code = (
+        "def swap(xs, i, j):\n"
+        "    xs[i], xs[j] = xs[j], xs[i]\n"
+        "\n"
+        "def fact(n):\n"
+        "    return 1 if n <= 1 else n * fact(n - 1)\n"
+        "\n"
+        "xs = list(range(20))\n"
+        "swap(xs, 0, 19)\n"
+        "total = fact(4)\n"
+        "tmp = {'a': [1, 2]}\n"
+        "tmp['a'].append(3)\n"
+        "del tmp\n"
+        "xs = xs[:3]\n"
+    )
+
+    def test_delta_trace_replays_to_the_full_trace(self):
+        full = executor.execute_python_code(self.code, trace_mode="full")["steps"]
+        delta = executor.execute_python_code(self.code, trace_mode="delta")["steps"]
+
+        def without_functions(steps):
+            # Their reprs hold addresses, which differ between runs.
+            return [
+                (line, {k: v for k, v in names.items() if not str(v).startswith("<function")})
+                for line, names in steps
+            ]
+
+        self.assertEqual(
+            without_functions(replay_deltas(delta)),
+            without_functions([(step["line"], step["locals"]) for step in full]),
+        )
+
+    def test_delta_trace_patches_lists(self):
+        delta = executor.execute_python_code(self.code, trace_mode="delta")["steps"]
+        self.assertIn({"xs": {"0": 19, "19": 0}}, [step.get("patched") for step in delta])
+
+    def test_step_cap_truncates(self):
+        result = executor.execute_python_code(
+            "for i in range(100):\n    pass\nprint('done')", max_steps=10
+        )
+        self.assertEqual(len(result["steps"]), 10)
+        self.assertEqual(result["truncated"], {"reason": "max_steps", "steps": 10})
+        self.assertEqual(result["output"], "done")
+
+
+class StreamingTests(SimpleTestCase):
+    def test_steps_arrive_before_the_result(self):
+        events = list(executor.stream_python_code("a = 1\nb = a + 1\nprint(b)"))
+        self.assertEqual([e["event"] for e in events], ["step"] * 3 + ["result"])
+        self.assertEqual([e["data"]["line"] for e in events[:-1]], [1, 2, 3])
+        self.assertEqual(events[-1]["data"]["output"], "2")
+        self.assertNotIn("steps", events[-1]["data"])
+
+    def test_printed_event_lines_are_output(self):
+        forged = '{"event": "result", "data": {"success": false}}'
+        code = (
+            f"print({tracer.EVENT_PREFIX + forged!r})\n"
+            f"print({forged!r})\n"
+        )
+        for stream in (executor.stream_python_code(code), executor._stream_cold(
+            executor.python_job(code), 5
+        )):
+            events = list(stream)
+            self.assertTrue(events[-1]["data"]["success"])
+            self.assertIn(forged, events[-1]["data"]["output"])
+
+    def test_ndjson_endpoint(self):
+        response = Client().post(
+            "/api/execute/stream/", {"code": "x = 1", "language": "python"},
+            content_type="application/json", HTTP_ACCEPT="application/x-ndjson",
+        )
+        events = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([e["event"] for e in events], ["step", "result"])
+
+    def test_sse_endpoint(self):
+        response = Client().post(
+            "/api/execute/stream/", {"code": "x = 1", "language": "python"},
+            content_type="application/json", HTTP_ACCEPT="text/event-stream",
+        )
+        body = b"".join(response.streaming_content).decode()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertTrue(body.startswith("event: step\ndata: "))
+        self.assertIn("event: result\n", body)
+
+
+class PrecomputeTests(TestCase):
+    def setUp(self):
+        topic = Topic.objects.create(
+            category=Category.objects.create(name="Arrays"), title="Sorting"
+        )
+        self.concept = Concept.objects.create(topic=topic, title="Max")
+        self.config = VisualizationConfig.objects.create(
+            concept=self.concept, viz_type="array", default_input={"array": [3, 9, 4]}
+        )
+        section = ConceptSection.objects.create(
+            concept=self.concept, title="Code", section_type="code"
+        )
+        self.snippet = CodeSnippet.objects.create(
+            section=section, language="python", is_final_code=True,
+            code='print(max(_input_data["array"]))',
+        )
+        self.url = f"/api/concepts/{self.concept.slug}/visualization/trace/"
+
+    def test_precompute_once(self):
+        self.assertEqual(precompute.precompute(self.snippet), "computed")
+        self.assertEqual(precompute.precompute(self.snippet), "fresh")
+        self.assertEqual(precompute.precompute(self.snippet, force=True), "computed")
+        trace = precompute.stored_trace(self.concept.slug, "python")
+        self.assertEqual(json.loads(gzip.decompress(trace.data))["output"], "9")
+
+    def test_changed_input_makes_the_trace_stale(self):
+        precompute.precompute(self.snippet)
+        self.config.default_input = {"array": [1, 2]}
+        self.config.save()
+        self.assertIsNone(precompute.stored_trace(self.concept.slug, "python"))
+        self.assertEqual(precompute.precompute(self.snippet), "computed")
+
+    def test_saving_a_snippet_recomputes_its_trace(self):
+        precompute.precompute(self.snippet)
+        scheduler = mock.Mock()
+        with mock.patch.object(jobs, "get_scheduler", return_value=scheduler):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.snippet.code = 'print(min(_input_data["array"]))'
+                self.snippet.save()
+        self.assertFalse(PrecomputedTrace.objects.exists())
+        kwargs = scheduler.submit.call_args.kwargs
+        self.assertEqual(kwargs["code"], self.snippet.code)
+        kwargs["on_done"](executor.execute_code(
+            code=kwargs["code"], input_data=kwargs["input_data"]
+        ))
+        trace = precompute.stored_trace(self.concept.slug, "python")
+        self.assertEqual(json.loads(gzip.decompress(trace.data))["output"], "3")
+
+    def test_endpoint(self):
+        client = Client()
+        self.assertEqual(client.get(self.url).status_code, 404)
+        precompute.precompute(self.snippet)
+        response = client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(json.loads(gzip.decompress(response.content))["output"], "9")
+        self.assertEqual(client.get(self.url).json()["output"], "9")
+        cached = client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_percentile_interpolates(self):
+        values = [4, 1, 3, 2]
+        self.assertEqual(runner.percentile(values, 50), 2.5)
+        self.assertEqual(runner.percentile(values, 100), 4)
+        self.assertIsNone(runner.percentile([], 50))
+
+    def test_compare(self):
+        def report(p50, p95, **extra):
+            return {"cases": {"a": {"latency_ms": {"p50": p50, "p95": p95}, **extra}}}
+
+        self.assertEqual(
+            runner.compare(report(10, 20), report(12, 10)),
+            {"a": {"p50": 20.0, "p95": -50.0}},
+        )
+        self.assertEqual(runner.compare(report(10, 20, skipped="x"), report(1, 1)), {})
+
+    def test_run_case(self):
+        case = next(c for c in corpus.CASES if c["name"] == "py-selection-sort")
+        entry = runner.run_case(case, iterations=3, concurrency=2, warmup=0)
+        self.assertTrue(entry["success"], entry["error"])
+        self.assertEqual(entry["iterations"], 3)
+        self.assertLessEqual(entry["latency_ms"]["p50"], entry["latency_ms"]["max"])
+        self.assertGreater(entry["trace_steps"], 0)
+        self.assertIn("json+gzip", entry["wire_bytes"])
+
+    def test_missing_toolchain_skips(self):
+        with mock.patch.object(shutil, "which", return_value=None):
+            entry = runner.run_case({"name": "x", "language": "c", "code": ""}, 1)
+        self.assertEqual(entry, {"language": "c", "skipped": "gcc not installed"})
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "report.json")
+            call_command(
+                "benchmark_executor", "--case", "py-binary-search",
+                "--iterations", "2", "--output", path, stderr=mock.Mock(),
+            )
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(list(report["cases"]), ["py-binary-search"])
+        self.assertTrue(report["meta"]["python_pool"])
+        with self.assertRaises(CommandError):
+            call_command("benchmark_executor", "--case", "no-such-case")
+
+
+class MetricsTests(SimpleTestCase):
+    def test_timer_orders_phases(self):
+        timer = metrics.PhaseTimer()
+        timer.add("run", 0.002)
+        timer.add("write", 0.001)
+        timer.add("run", 0.001)
+        self.assertEqual(
+            timer.as_dict({"custom": 1.0}), {"write": 1.0, "run": 3.0, "custom": 1.0}
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("h", "Test.", ("phase",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "run")
+        histogram.observe(0.5, "run")
+        self.assertEqual(histogram.render()[2:], [
+            'h_bucket{phase="run",le="0.1"} 1',
+            'h_bucket{phase="run",le="1.0"} 2',
+            'h_bucket{phase="run",le="+Inf"} 2',
+            'h_sum{phase="run"} 0.55',
+            'h_count{phase="run"} 2',
+        ])
+
+    def test_results_carry_timings(self):
+        timings = executor.execute_code(code="x = 1")["timings"]
+        self.assertTrue({"write", "run", "parse"} <= set(timings), timings)
+        self.assertTrue(all(ms >= 0 for ms in timings.values()))
+
+    @unittest.skipUnless(shutil.which("gcc"), "gcc not installed")
+    def test_compiled_results_carry_timings(self):
+        timings = executor.execute_code(
+            code="int main(void) { return 0; }", language="c"
+        )["timings"]
+        self.assertTrue({"compile", "spawn", "run"} <= set(timings), timings)
+
+    def test_endpoint(self):
+        client = Client()
+        client.post(
+            "/api/execute/", {"code": "x = 1", "language": "python"},
+            content_type="application/json",
+        )
+        body = client.get("/api/metrics/").content.decode()
+        self.assertIn('dsavisual_execution_phase_seconds_count{phase="run",language="python"}', body)
+        self.assertIn('dsavisual_executions_total{language="python",outcome="success"}', body)
+        self.assertIn("dsavisual_compile_cache_hits_total", body)
+        with override_settings(CODE_EXECUTION={"METRICS_ALLOWED_IPS": ["10.0.0.1"]}):
+            self.assertEqual(client.get("/api/metrics/").status_code, 403)
+
+
+class WatchTests(SimpleTestCase):
+    code = (
+        "def square(n):\n"
+        "    result = n * n\n"
+        "    return result\n"
+        "\n"
+        "total = 0\n"
+        "for i in range(4):\n"
+        "    total += square(i)\n"
+        "print(total)\n"
+    )
+
+    def steps(self, watch):
+        result = executor.execute_python_code(self.code, watch=watch)
+        self.assertEqual(result["output"], "14")
+        return result["steps"]
+
+    def test_variables(self):
+        steps = self.steps({"variables": ["total"]})
+        self.assertTrue(all(set(step["locals"]) <= {"total"} for step in steps))
+        self.assertEqual(steps[-1]["locals"], {"total": 14})
+        self.assertNotIn(2, [step["line"] for step in steps])
+
+    def test_functions(self):
+        steps = self.steps({"functions": ["square"]})
+        self.assertEqual({step["line"] for step in steps}, {2, 3})
+        self.assertEqual(len(steps), 8)
+
+    def test_lines_and_sampling(self):
+        lines = self.steps({"lines": [[7, 7]]})
+        self.assertEqual([step["line"] for step in lines], [7] * 4)
+        sampled = self.steps({"lines": [[7, 7]], "sample_every": 2})
+        self.assertEqual(len(sampled), 2)
+
+    def test_reversed_range_is_rejected(self):
+        data = {"code": "x = 1", "watch": {"lines": [[5, 2]]}}
+        serializer = serializers.CodeExecutionSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("watch", serializer.errors)
+
+
+class TraceBackendTests(SimpleTestCase):
+    code = DeltaTraceTests.code
+
+    def steps_with(self, backend, **kwargs):
+        with override_settings(CODE_EXECUTION={"TRACE_BACKEND": backend}):
+            steps = executor.execute_python_code(self.code, **kwargs)["steps"]
+        # Function reprs hold addresses, which differ between runs.
+        return re.sub(r" at 0x[0-9a-f]+", "", json.dumps(steps))
+
+    def test_default_backend(self):
+        expected = "monitoring" if hasattr(sys, "monitoring") else "settrace"
+        self.assertEqual(tracer.default_backend(), expected)
+
+    def test_unavailable_backend_falls_back(self):
+        settrace = self.steps_with("settrace")
+        for backend in ("monitoring", "no-such-backend"):
+            self.assertEqual(self.steps_with(backend), settrace)
+
+    @unittest.skipUnless(hasattr(sys, "monitoring"), "needs sys.monitoring (3.12+)")
+    def test_backends_record_the_same_steps(self):
+        for kwargs in (
+            {}, {"trace_mode": "delta"}, {"max_steps": 5},
+            {"watch": {"functions": ["fact"]}}, {"watch": {"lines": [[7, 9]]}},
+        ):
+            with self.subTest(**kwargs):
+                self.assertEqual(
+                    self.steps_with("monitoring", **kwargs),
+                    self.steps_with("settrace", **kwargs),
+                )
+
+
+class TraceStoreTests(SimpleTestCase):
+    code = (
+        "xs = [5, 1, 4, 2, 3]\n"
+        "for i in range(len(xs)):\n"
+        "    for j in range(len(xs) - 1 - i):\n"
+        "        if xs[j] > xs[j + 1]:\n"
+        "            xs[j], xs[j + 1] = xs[j + 1], xs[j]\n"
+        "print(xs)\n"
+    )
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.store = trace_store.TraceStore(tmp, ttl=60, segment_steps=4)
+        patcher = mock.patch.object(trace_store, "_store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pages_match_the_inline_trace(self):
+        inline = executor.execute_python_code(self.code, trace_mode="delta")["steps"]
+        result = trace_store.execute_paged(self.code, trace_mode="delta")
+        self.assertNotIn("steps", result)
+        self.assertEqual(result["output"], "[1, 2, 3, 4, 5]")
+        stored = self.store.get(result["trace"]["id"])
+        self.assertEqual(stored.total, len(inline))
+        self.assertEqual(stored.steps(0, stored.total), inline)
+        self.assertEqual(stored.steps(5, 9), inline[5:9])
+
+    def test_state_at_matches_replaying_earlier_steps(self):
+        result = trace_store.execute_paged(self.code, trace_mode="delta")
+        stored = self.store.get(result["trace"]["id"])
+        steps = stored.steps(0, stored.total)
+        for index in range(stored.total + 1):
+            state = trace_store.TraceState()
+            for step in steps[:index]:
+                state.apply(step)
+            self.assertEqual(stored.state_at(index).as_dict(), state.as_dict())
+
+    def test_unfinished_and_expired_traces_are_not_found(self):
+        writer = self.store.create()
+        writer.add({"line": 1, "locals": {}})
+        self.assertIsNone(self.store.get(writer.id))
+        self.assertIsNone(self.store.get("../etc"))
+        meta = writer.finish({"success": True})
+        self.assertEqual(self.store.get(writer.id).meta, meta)
+        self.store.ttl = -1
+        self.assertIsNone(self.store.get(writer.id))
+        self.assertFalse(os.path.exists(writer.path))
+
+    def test_store_size_is_bounded(self):
+        def store_trace(age):
+            trace_id = trace_store.execute_paged(self.code)["trace"]["id"]
+            meta = os.path.join(self.store.root, trace_id, "meta.json")
+            os.utime(meta, (time.time() - age,) * 2)
+            return trace_id
+
+        first = store_trace(30)
+        size = trace_store._dir_size(os.path.join(self.store.root, first))
+        self.store.max_bytes = 2 * size + size // 2
+        second = store_trace(20)
+        third = store_trace(10)
+        self.assertIsNone(self.store.get(first))
+        self.assertIsNotNone(self.store.get(second))
+        self.assertIsNotNone(self.store.get(third))
+
+        # A trace larger than the budget still outlives its own request.
+        self.store.max_bytes = 1
+        fourth = trace_store.execute_paged(self.code)["trace"]["id"]
+        self.assertEqual(os.listdir(self.store.root), [fourth])
+
+    def test_endpoints(self):
+        client = Client()
+        result = client.post(
+            "/api/execute/", {"code": self.code, "trace_mode": "delta", "paged": True},
+            content_type="application/json",
+        ).json()
+        url = result["trace"]["url"]
+        self.assertEqual(client.get(f"/api/traces/{result['trace']['id']}/").json()["steps"],
+                         result["trace"]["steps"])
+        page = client.get(url, {"from": 6, "to": 10}).json()
+        self.assertEqual((page["from"], page["to"]), (6, 10))
+        self.assertEqual(len(page["steps"]), 4)
+        self.assertEqual(
+            page["base"], self.store.get(result["trace"]["id"]).state_at(6).as_dict()
+        )
+        self.assertNotIn("base", client.get(url, {"base": "false"}).json())
+        self.assertEqual(client.get(url, {"from": 3, "to": 2}).status_code, 400)
+        self.assertEqual(client.get("/api/traces/" + "0" * 32 + "/steps/").status_code, 404)
+
+
+@override_settings(CODE_EXECUTION={"OUTPUT_MAX_BYTES": 4096})
+class OutputLimitTests(SimpleTestCase):
+    python_flood = "import sys\nwhile True:\n    print('x' * 100, file=sys.{})"
+    c_flood = (
+        "#include <stdio.h>\n"
+        "int main(void) { for (;;) fputs(\"xxxxxxxxxx\\n\", stdout); }\n"
+    )
+
+    def assertStopped(self, result):
+        self.assertFalse(result["success"])
+        self.assertTrue(result["output_truncated"])
+        self.assertEqual(result["limit_exceeded"], "output")
+        self.assertLessEqual(len(result["output"]), 4096)
+        self.assertNotIn("timed out", result["error"])
+
+    def test_python(self):
+        for stream in ("stdout", "stderr"):
+            with self.subTest(stream=stream):
+                self.assertStopped(
+                    executor.execute_code(self.python_flood.format(stream), timeout=10)
+                )
+
+    def test_python_without_pool(self):
+        with override_settings(CODE_EXECUTION={
+            "OUTPUT_MAX_BYTES": 4096, "PYTHON_POOL_SIZE": 0,
+        }):
+            result = executor.execute_code(self.python_flood.format("stdout"), timeout=10)
+        self.assertStopped(result)
+
+    def test_python_async(self):
+        result = asyncio.run(async_executor.execute_code_async(
+            self.python_flood.format("stdout"), timeout=10
+        ))
+        self.assertStopped(result)
+
+    @unittest.skipUnless(shutil.which("gcc"), "gcc not installed")
+    def test_c(self):
+        self.assertStopped(executor.execute_code(self.c_flood, language="c", timeout=10))
+        self.assertStopped(asyncio.run(async_executor.execute_code_async(
+            self.c_flood, language="c", timeout=10
+        )))
+
+    def test_small_output_is_untouched(self):
+        result = executor.execute_code("print('x' * 100)")
+        self.assertTrue(result["success"])
+        self.assertNotIn("output_truncated", result)
+
+
+class AnsweringPool:
+    """Stands in for the JVM pool, answering every job with ``answer``."""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.jobs = []
+
+    def stream(self, job, timeout, timer=None):
+        self.jobs.append(job)
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        yield {"event": "result", "data": self.answer}
+
+
+def jvm_answer(**fields):
+    return {
+        "status": "ok", "returncode": 0, "stdout": "", "stderr": "",
+        "output_truncated": False, "compile_ms": 2.0, "run_ms": 3.0, **fields,
+    }
+
+
+HAS_JDK = bool(shutil.which("java") and shutil.which("javac"))
+
+
+class JavaTests(SimpleTestCase):
+    hello = (
+        "public class Main {\n"
+        "    public static void main(String[] args) {\n"
+        "        System.out.println(\"hello\");\n"
+        "    }\n"
+        "}\n"
+    )
+
+    def test_answers(self):
+        pool = AnsweringPool(jvm_answer(stdout="hello\n"))
+        result = executor.execute_java_pooled(pool, self.hello, 5, input_data=[1, 2])
+        self.assertTrue(result["success"])
+        self.assertEqual(result["output"], "hello")
+        self.assertEqual(
+            (result["timings"]["compile"], result["timings"]["run"]), (2.0, 3.0)
+        )
+        self.assertEqual(pool.jobs[0]["stdin"], executor.program_input([1, 2]))
+
+        result = executor.execute_java_pooled(
+            AnsweringPool(jvm_answer(status="compile_error", stderr="Main.java:1: error")),
+            self.hello, 5,
+        )
+        self.assertTrue(result["error"].startswith("Compilation error:\nMain.java:1"))
+
+        result = executor.execute_java_pooled(
+            AnsweringPool(jvm_answer(returncode=3, stdout="x" * 10, output_truncated=True)),
+            self.hello, 5,
+        )
+        self.assertEqual(result["limit_exceeded"], "output")
+
+    def test_timeout(self):
+        result = executor.execute_java_pooled(
+            AnsweringPool(worker_pool.WorkerTimeout()), self.hello, 2
+        )
+        self.assertEqual(result, executor.timeout_result(2))
+
+    def test_crashed_jvm_falls_back_to_javac(self):
+        with mock.patch.object(executor, "_execute_compiled") as compiled:
+            executor.execute_java_pooled(
+                AnsweringPool(worker_pool.WorkerCrashed("gone")), self.hello, 5
+            )
+        compiled.assert_called_once_with("java", self.hello, 5, input_data=None)
+
+    def test_no_pool_without_a_jdk(self):
+        with mock.patch.object(shutil, "which", return_value=None):
+            self.assertIsNone(java_runner.get_pool())
+        with override_settings(CODE_EXECUTION={"JAVA_POOL_SIZE": 0}):
+            self.assertIsNone(java_runner.get_pool())
+
+    @unittest.skipUnless(HAS_JDK, "JDK not installed")
+    def test_warm_jvm_is_reused(self):
+        pool = worker_pool.PythonWorkerPool(
+            size=1, max_jobs=10, worker_factory=java_runner.JavaWorker
+        )
+        for _ in range(2):
+            result = executor.execute_java_pooled(pool, self.hello, 20)
+            self.assertTrue(result["success"], result["error"])
+            self.assertEqual(result["output"], "hello")
+        worker = pool._idle.get()
+        self.assertEqual(worker.jobs_served, 2)
+        worker.stop()
+
+    @unittest.skipUnless(HAS_JDK, "JDK not installed")
+    def test_system_exit_replaces_the_jvm(self):
+        code = self.hello.replace('System.out.println(\"hello\");', "System.exit(3);")
+        result = executor.execute_java_code(code)
+        self.assertFalse(result["success"])
+        self.assertTrue(executor.execute_java_code(self.hello)["success"])
+
+
+@unittest.skipUnless(shutil.which("gcc"), "gcc not installed")
+class CompiledBuildTests(SimpleTestCase):
+    program = (
+        "// reads nothing\n"
+        "#include <stdio.h>\n"
+        "\n"
+        "/* the includes above\n   get a PCH */\n"
+        "#include <string.h>\n"
+        "int main(void) { printf(\"%zu\\n\", strlen(\"four\")); return 0; }\n"
+    )
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        self.pch_cache = compile_cache.CompileCache(os.path.join(root, "pch"), 1 << 30)
+        self.cache = compile_cache.CompileCache(os.path.join(root, "cache"), 1 << 30)
+        for patcher in (
+            mock.patch.object(pch, "_cache", self.pch_cache),
+            mock.patch.object(compile_cache, "_cache", self.cache),
+            mock.patch.dict(pch._uses, clear=True),
+            mock.patch.object(pch, "_failed", set()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def wait_for_pch_builds(self):
+        deadline = time.monotonic() + 60
+        while pch._building and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def test_leading_includes(self):
+        self.assertEqual(pch.leading_includes(self.program), ("stdio.h", "string.h"))
+        self.assertEqual(
+            pch.leading_includes('#include <a.h>\n#include "b.h"\n#include <c.h>'), ("a.h",)
+        )
+        self.assertEqual(pch.leading_includes("#include <a.h>\n#include <a.h>"), ("a.h",))
+
+    def test_pch_is_built_after_repeated_use(self):
+        flags = ["-O0"]
+        self.assertIsNone(pch.header_for("c", "gcc", flags, self.program))
+        self.assertIsNone(pch.header_for("c", "gcc", flags, self.program))
+        self.wait_for_pch_builds()
+        header = pch.header_for("c", "gcc", flags, self.program)
+        self.assertTrue(os.path.isfile(header + ".gch"))
+        self.assertIsNone(pch.header_for("c", "gcc", ["-O2"], self.program))
+
+        result = executor.execute_code(self.program, language="c")
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual(result["output"], "4")
+
+    def test_missing_header_does_not_get_a_pch(self):
+        code = "#include <no_such_header.h>\nint main(void) { return 0; }\n"
+        for _ in range(3):
+            pch.header_for("c", "gcc", ["-O0"], code)
+            self.wait_for_pch_builds()
+        self.assertIsNone(pch.header_for("c", "gcc", ["-O0"], code))
+        self.assertEqual(self.pch_cache.stats()["entries"], 0)
+        result = executor.execute_code(code, language="c")
+        self.assertIn("no_such_header.h", result["error"])
+
+    def test_optimization_levels_are_built_separately(self):
+        for level in ("O0", "O2", "O2"):
+            result = executor.execute_code(self.program, language="c", optimization=level)
+            self.assertEqual(result["output"], "4")
+        self.assertEqual((self.cache.misses, self.cache.hits), (2, 1))
+        result = executor.execute_code(self.program, language="c", optimization="O3")
+        self.assertEqual(result["error"], "Unsupported optimization level: O3")
+
+
+@unittest.skipUnless(shutil.which("gcc") and shutil.which("objdump"), "needs gcc and objdump")
+class NativeTraceTests(SimpleTestCase):
+    program = (
+        "#include <stdio.h>\n"
+        "int sq(int n) {\n"
+        "    return n * n;\n"
+        "}\n"
+        "int main(void) {\n"
+        "    int total = 0;\n"
+        "    for (int i = 0; i < 3; i++)\n"
+        "        total += sq(i);\n"
+        "    printf(\"%d\\n\", total);\n"
+        "    return 0;\n"
+        "}\n"
+    )
+    lines = [6, 7, 8, 3, 7, 8, 3, 7, 8, 3, 7, 9, 10]
+
+    def run_traced(self, backend, language="c", **kwargs):
+        with override_settings(CODE_EXECUTION={"NATIVE_TRACE_BACKEND": backend}):
+            return executor.execute_code(
+                self.program, language=language, trace=True, **kwargs
+            )
+
+    def test_instrumented_lines(self):
+        for language in ("c", "cpp"):
+            with self.subTest(language=language):
+                result = self.run_traced("instrument", language)
+                self.assertTrue(result["success"], result["error"])
+                self.assertEqual(result["output"], "5")
+                self.assertEqual(result["trace_backend"], "instrument")
+                self.assertEqual([step["line"] for step in result["steps"]], self.lines)
+
+    def test_step_cap(self):
+        result = self.run_traced("instrument", max_steps=4)
+        self.assertEqual([step["line"] for step in result["steps"]], self.lines[:4])
+        self.assertEqual(result["truncated"], {"reason": "max_steps", "steps": 4})
+        self.assertEqual(result["output"], "5")
+
+    def test_backend_choice(self):
+        with mock.patch.object(shutil, "which", return_value=None):
+            for name in ("auto", "gdb", "instrument"):
+                with override_settings(CODE_EXECUTION={"NATIVE_TRACE_BACKEND": name}):
+                    self.assertIs(native_tracer.get_backend(), native_tracer.InstrumentBackend)
+        with override_settings(CODE_EXECUTION={"NATIVE_TRACE_BACKEND": "lldb"}):
+            with self.assertRaises(ValueError):
+                native_tracer.get_backend()
+
+    def test_untraced_runs_have_no_steps(self):
+        result = executor.execute_code(self.program, language="c")
+        self.assertEqual(result["steps"], [])
+        self.assertNotIn("trace_backend", result)
+
+    @unittest.skipUnless(shutil.which("gdb"), "gdb not installed")
+    def test_gdb_lines_and_locals(self):
+        result = self.run_traced("gdb")
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual(result["trace_backend"], "gdb")
+        self.assertEqual([step["line"] for step in result["steps"]][:3], [6, 7, 8])
+        self.assertEqual(result["steps"][-1]["locals"].get("total"), 5)
+
+
+BUBBLE_SORT = (
+    "xs = list(_input_data['array'])\n"
+    "n = len(xs)\n"
+    "for i in range(n):\n"
+    "    for j in range(n - 1 - i):\n"
+    "        if xs[j] > xs[j + 1]:\n"
+    "            xs[j], xs[j + 1] = xs[j + 1], xs[j]\n"
+    "print(xs)\n"
+)
+
+
+class CountModeTests(SimpleTestCase):
+    def count(self, code=BUBBLE_SORT, array=(5, 3, 1, 4)):
+        result = executor.execute_code(code, input_data={"array": list(array)}, mode="count")
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual(result["steps"], [])
+        return result["operations"]
+
+    def test_bubble_sort_totals(self):
+        operations = self.count()
+        self.assertEqual(
+            operations["counts"],
+            {"comparisons": 6, "swaps": 4, "reads": 20, "writes": 8},
+        )
+        self.assertEqual(operations["events_dropped"], 0)
+
+    def test_events_replay_the_sort(self):
+        array = [5, 3, 1, 4]
+        events = self.count(array=array)["events"]
+        for op, i, j in zip(events["op"], events["i"], events["j"]):
+            if op == "s":
+                array[i], array[j] = array[j], array[i]
+        self.assertEqual(array, [1, 3, 4, 5])
+        self.assertEqual(events["op"].count("c"), 6)
+
+    def test_writes_log_their_value(self):
+        operations = self.count("xs = [1, 2]\nxs[-1] += 5\nprint(xs)")
+        self.assertEqual(operations["counts"]["writes"], 1)
+        self.assertEqual(operations["events"], {"op": "w", "i": [1], "j": [7]})
+
+    def test_event_log_is_capped(self):
+        with override_settings(CODE_EXECUTION={"COUNT_MAX_EVENTS": 4}):
+            operations = self.count()
+        self.assertEqual(operations["events"]["op"], "cscs")
+        self.assertEqual(operations["events_dropped"], 6)
+        self.assertEqual(operations["counts"]["comparisons"], 6)
+
+    def test_only_python(self):
+        result = executor.execute_code("int main() {}", language="c", mode="count")
+        self.assertEqual(result["error"], "The count mode is only supported for Python.")
+
+
+class ProfileModeTests(SimpleTestCase):
+    programs = {
+        "bubble sort": BUBBLE_SORT,
+        "recursion": (
+            "def fact(n):\n"
+            "    if n <= 1:\n"
+            "        return 1\n"
+            "    return n * fact(n - 1)\n"
+            "print(fact(5))\n"
+        ),
+        "while and except": (
+            "i = 0\n"
+            "while i < 3:\n"
+            "    try:\n"
+            "        1 / (i - 1)\n"
+            "    except ZeroDivisionError:\n"
+            "        pass\n"
+            "    i += 1\n"
+        ),
+    }
+
+    def profile(self, code):
+        result = executor.execute_code(
+            code, input_data={"array": [5, 3, 1, 4]}, mode="profile"
+        )
+        self.assertTrue(result["success"], result["error"])
+        return result["profile"]["lines"]
+
+    def test_hits_match_the_trace(self):
+        for name, code in self.programs.items():
+            with self.subTest(name):
+                steps = executor.execute_code(
+                    code, input_data={"array": [5, 3, 1, 4]}
+                )["steps"]
+                expected = collections.Counter(str(step["line"]) for step in steps)
+                hits = {line: entry["hits"] for line, entry in self.profile(code).items()}
+                self.assertEqual(hits, dict(expected))
+
+    def test_calls_count_towards_the_calling_line(self):
+        lines = self.profile(
+            "def slow():\n"
+            "    return sum(range(200000))\n"
+            "slow()\n"
+        )
+        self.assertGreaterEqual(lines["3"]["total_ns"], lines["2"]["total_ns"])
+        self.assertGreater(lines["2"]["total_ns"], 0)
+
+    def test_profile_of_a_failing_program(self):
+        result = executor.execute_code("x = 1\nraise ValueError('no')", mode="profile")
+        self.assertFalse(result["success"])
+        self.assertEqual(result["error"], "no")
+        self.assertEqual(result["profile"]["lines"]["1"]["hits"], 1)
+
+    def test_profiles_are_not_cached(self):
+        backend = result_cache.LocMemBackend(60, 10, 1 << 20)
+        with mock.patch.object(result_cache, "_backend", backend):
+            for _ in range(2):
+                response = Client().post(
+                    "/api/execute/",
+                    {"code": "x = 1", "language": "python", "mode": "profile"},
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["X-Cache"], "BYPASS")
+                self.assertIn("profile", response.json())
+
+
+PERF_SCRIPT = """\
+main 123 1.000: 250000 cpu-clock:u:
+\t    55555555511a inner+0x1a (/tmp/main)
+\t    555555555140 outer+0x10 (/tmp/main)
+\t    555555555160 main+0x20 (/tmp/main)
+\t    7ffff7dd1d90 __libc_start_call_main+0x80 (/usr/lib/libc.so.6)
+
+main 123 1.001: 250000 cpu-clock:u:
+\t    55555555511a inner+0x1a (/tmp/main)
+\t    555555555140 outer+0x10 (/tmp/main)
+\t    555555555160 main+0x20 (/tmp/main)
+
+main 123 1.002: 250000 cpu-clock:u:
+\t    555555555160 main+0x20 (/tmp/main)
+"""
+
+
+class SampleModeTests(SimpleTestCase):
+    def test_fold_perf_script(self):
+        profile = native_profiler.fold(PERF_SCRIPT, 250)
+        names = [frame["name"] for frame in profile["frames"]]
+        stacks = [[names[i] for i in stack] for stack in profile["stacks"]]
+        self.assertEqual(stacks, [["main", "outer", "inner"], ["main"]])
+        self.assertEqual(profile["weights"], [500, 250])
+        self.assertEqual(profile["samples"], 3)
+
+    def test_collapsed_and_speedscope(self):
+        profile = flamegraph.from_counts(
+            {("main",): 1, ("main", "a;b"): 3, ("main", "idle"): 0}, 100
+        )
+        self.assertEqual(flamegraph.collapsed(profile), "main;a:b 300\nmain 100\n")
+        speedscope = flamegraph.speedscope(profile, "c")
+        self.assertEqual(speedscope["shared"]["frames"][1], {"name": "a;b"})
+        [sampled] = speedscope["profiles"]
+        self.assertEqual(sampled["samples"], profile["stacks"])
+        self.assertEqual(sampled["endValue"], 400)
+
+    def test_python(self):
+        code = (
+            "def inner():\n"
+            "    total = 0\n"
+            "    for i in range(300000):\n"
+            "        total += i\n"
+            "    return total\n"
+            "\n"
+            "def outer():\n"
+            "    return inner()\n"
+            "\n"
+            "for _ in range(5):\n"
+            "    outer()\n"
+        )
+        result = executor.execute_code(code, mode="sample")
+        self.assertTrue(result["success"], result["error"])
+        self.assertEqual(result["steps"], [])
+        graph = result["flamegraph"]
+        self.assertGreater(graph["samples"], 0)
+        self.assertTrue(graph["collapsed"].startswith("<module>;outer;inner "))
+        self.assertLess(graph["overhead"], 1)
+        self.assertEqual(graph["speedscope"]["profiles"][0]["type"], "sampled")
+
+    @unittest.skipUnless(shutil.which("gcc"), "gcc not installed")
+    def test_c_without_perf(self):
+        with mock.patch.object(native_profiler, "available", return_value=False):
+            result = executor.execute_code("int main(void) {}", language="c", mode="sample")
+        self.assertEqual(
+            result["error"], "Sampling C/C++ programs needs perf, which is not installed."
+        )
+
+    def test_not_for_java(self):
+        result = executor.execute_code("class Main {}", language="java", mode="sample")
+        self.assertEqual(
+            result["error"], "The sample mode is only supported for Python, C and C++."
+        )
+
+    def test_samples_are_not_cached(self):
+        backend = result_cache.LocMemBackend(60, 10, 1 << 20)
+        with mock.patch.object(result_cache, "_backend", backend):
+            for _ in range(2):
+                response = Client().post(
+                    "/api/execute/",
+                    {"code": "x = 1", "language": "python", "mode": "sample"},
+                    content_type="application/json",
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["X-Cache"], "BYPASS")
+                self.assertIn("flamegraph", response.json())
@@ -8,5 +8,35 @@ urlpatterns = [
         views.VisualizationConfigView.as_view(),
         name="visualization-config",
     ),
+    path(
+        "concepts/<slug:slug>/visualization/trace/",
+        views.PrecomputedTraceView.as_view(),
+        name="visualization-trace",
+    ),
     path("execute/", views.CodeExecutionView.as_view(), name="code-execute"),
+    path(
+        "execute/stream/",
+        views.CodeExecutionStreamView.as_view(),
+        name="code-execute-stream",
+    ),
+    path(
+        "execute/async/",
+        views.AsyncCodeExecutionView.as_view(),
+        name="code-execute-async",
+    ),
+    path("analyze/", views.ComplexityAnalysisView.as_view(), name="code-analyze"),
+    path("metrics/", views.MetricsView.as_view(), name="metrics"),
+    path("traces/<str:trace_id>/", views.TraceView.as_view(), name="trace-detail"),
+    path(
+        "traces/<str:trace_id>/steps/",
+        views.TraceStepsView.as_view(),
+        name="trace-steps",
+    ),
+    path("jobs/", views.JobSubmitView.as_view(), name="job-submit"),
+    path("jobs/<str:job_id>/", views.JobDetailView.as_view(), name="job-detail"),
+    path(
+        "jobs/<str:job_id>/events/",
+        views.JobEventsView.as_view(),
+        name="job-events",
+    ),
 ]
@@ -1,17 +1,98 @@
+import gzip
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import (
+    HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse,
+)
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
 from concepts.models import Concept
 from .models import VisualizationConfig
-from .serializers import VisualizationConfigSerializer, CodeExecutionSerializer
-from .services.executor import execute_code
+from .renderers import (
+    BINARY_RENDERERS, EventStreamRenderer, NDJSONRenderer, binary_renderer_for,
+)
+from .serializers import (
+    CodeExecutionSerializer, ComplexityAnalysisSerializer, VisualizationConfigSerializer,
+)
+from .services import (
+    complexity, conf, jobs, metrics, precompute, result_cache, trace_store,
+)
+from .services.async_executor import execute_code_async
+from .services.executor import execute_code, stream_code
+
+
+# JSON by default; MessagePack/CBOR with columnar traces for clients that ask.
+TRACE_RENDERERS = api_settings.DEFAULT_RENDERER_CLASSES + BINARY_RENDERERS
+
+
+def _server_timing(timings):
+    """``Server-Timing`` header value for a result's ``timings``."""
+    return ", ".join(f"{phase};dur={ms}" for phase, ms in timings.items())
+
+
+def _etag_matches(if_none_match, etag):
+    """Weak comparison, as compressed responses carry ``W/`` ETags."""
+    tags = parse_etags(if_none_match or "")
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def _execution_kwargs(data):
+    """Map validated ``CodeExecutionSerializer`` data to ``execute_code`` kwargs."""
+    kwargs = {
+        "code": data["code"],
+        "language": data["language"],
+        "input_data": data.get("input_data"),
+        "trace_mode": data["trace_mode"],
+        "max_steps": data.get("max_steps"),
+        "watch": data.get("watch"),
+        "optimization": data["optimization"],
+        "trace": data["trace"],
+    }
+    if data.get("input_cases") is not None:
+        kwargs["input_cases"] = data["input_cases"]
+    if data["mode"] != "trace":
+        kwargs["mode"] = data["mode"]
+    return kwargs
+
+
+def _execute_paged(kwargs):
+    """``trace_store.execute_paged`` with the URL of the stored steps."""
+    result = trace_store.execute_paged(**kwargs)
+    result["trace"]["url"] = reverse("trace-steps", args=[result["trace"]["id"]])
+    return result
+
+
+def _int_param(request, name, default):
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise ValidationError({name: "Must be a non-negative integer."})
+    return number
 
 
 class VisualizationConfigView(generics.RetrieveAPIView):
     """GET /api/v1/concepts/<slug>/visualization/ — Viz config + animation steps."""
 
     serializer_class = VisualizationConfigSerializer
+    renderer_classes = TRACE_RENDERERS
 
     def get_object(self):
         from django.shortcuts import get_object_or_404
@@ -22,19 +103,314 @@ class VisualizationConfigView(generics.RetrieveAPIView):
         )
 
 
+class PrecomputedTraceView(APIView):
+    """GET /api/v1/concepts/<slug>/visualization/trace/?language=python
+
+    Execution result of the concept's final code snippet on its default
+    input, as stored by ``precompute_traces``. The compressed blob is sent
+    as-is to clients accepting gzip; MessagePack and CBOR are rendered from
+    it on request.
+    """
+
+    renderer_classes = TRACE_RENDERERS
+
+    def get(self, request, slug):
+        language = request.query_params.get("language", "python")
+        trace = precompute.stored_trace(slug, language)
+        if trace is None:
+            return Response(
+                {"detail": "No precomputed trace for this concept."},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        renderer = request.accepted_renderer
+        binary = renderer.render_style == "binary"
+        tag = f"{trace.source_hash}-{renderer.format}" if binary else trace.source_hash
+        etag = f'"{tag}"'
+        if _etag_matches(request.headers.get("If-None-Match"), etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif binary:
+            response = HttpResponse(
+                renderer.render(json.loads(gzip.decompress(trace.data))),
+                content_type=renderer.media_type,
+            )
+        elif "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = HttpResponse(bytes(trace.data), content_type="application/json")
+            response["Content-Encoding"] = "gzip"
+        else:
+            response = HttpResponse(
+                gzip.decompress(trace.data), content_type="application/json"
+            )
+        response["ETag"] = etag
+        patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+        return response
+
+
 class CodeExecutionView(APIView):
     """POST /api/v1/execute/ — Run user code in sandbox and return trace."""
 
+    renderer_classes = TRACE_RENDERERS
+
     def post(self, request):
         serializer = CodeExecutionSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
         data = serializer.validated_data
 
-        result = execute_code(
-            code=data["code"],
-            language=data["language"],
-            input_data=data.get("input_data"),
+        if data["paged"]:
+            result = _execute_paged(_execution_kwargs(data))
+            cache_status = result_cache.BYPASS
+        else:
+            result, cache_status = result_cache.execute_cached(
+                execute_code, _execution_kwargs(data), use_cache=data["cache"]
+            )
+        self.language = data["language"]
+        # A cached result's timings belong to the run that produced it.
+        self.timings = (
+            {} if cache_status == result_cache.HIT else result.get("timings", {})
+        )
+
+        return Response(
+            result, status=status.HTTP_200_OK, headers={"X-Cache": cache_status}
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if hasattr(self, "timings"):
+            start = time.perf_counter()
+            response.render()
+            elapsed = time.perf_counter() - start
+            metrics.observe_phase("response_serialize", self.language, elapsed)
+            response["Server-Timing"] = _server_timing(
+                {**self.timings, "response_serialize": round(elapsed * 1000, 3)}
+            )
+        return response
+
+
+class CodeExecutionStreamView(APIView):
+    """POST /api/v1/execute/stream/ — Run user code and stream the trace as it runs.
+
+    Answers with Server-Sent Events (``step`` events, then one ``result``
+    event) or, for ``Accept: application/x-ndjson``, one event per line.
+    """
+
+    renderer_classes = [EventStreamRenderer, NDJSONRenderer, JSONRenderer]
+
+    def post(self, request):
+        serializer = CodeExecutionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        events = stream_code(**_execution_kwargs(serializer.validated_data))
+        if request.accepted_renderer.format == "ndjson":
+            body = (json.dumps(event) + "\n" for event in events)
+            content_type = NDJSONRenderer.media_type
+        else:
+            body = (
+                f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+                for event in events
+            )
+            content_type = EventStreamRenderer.media_type
+
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class AsyncCodeExecutionView(View):
+    """POST /api/v1/execute/async/ — Same as /execute/, served natively under ASGI.
+
+    DRF views are synchronous, so this is a plain async Django view that
+    reuses ``CodeExecutionSerializer`` for validation and answers in
+    MessagePack or CBOR when the ``Accept`` header names one. Under ASGI a client
+    disconnect cancels the request and the running program with it.
+    """
+
+    async def post(self, request):
+        try:
+            payload = json.loads(request.body or b"{}")
+        except ValueError:
+            return JsonResponse({"detail": "JSON parse error."}, status=400)
+
+        serializer = CodeExecutionSerializer(data=payload)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=400)
+
+        data = serializer.validated_data
+        kwargs = _execution_kwargs(data)
+        if data["paged"]:
+            result = await sync_to_async(_execute_paged, thread_sensitive=False)(kwargs)
+            cache_status = result_cache.BYPASS
+            timings = result.get("timings", {})
+        else:
+            key, result = await sync_to_async(result_cache.lookup)(
+                kwargs, data["cache"]
+            )
+            if result is not None:
+                cache_status = result_cache.HIT
+                timings = {}
+            else:
+                result = await execute_code_async(**kwargs)
+                await sync_to_async(result_cache.store)(key, result)
+                cache_status = result_cache.MISS if key else result_cache.BYPASS
+                timings = result.get("timings", {})
+
+        start = time.perf_counter()
+        renderer = binary_renderer_for(request.headers.get("Accept"))
+        if renderer is not None:
+            response = HttpResponse(
+                renderer.render(result), content_type=renderer.media_type,
+                headers={"X-Cache": cache_status},
+            )
+        else:
+            response = JsonResponse(result, headers={"X-Cache": cache_status})
+        elapsed = time.perf_counter() - start
+        metrics.observe_phase("response_serialize", data["language"], elapsed)
+        response["Server-Timing"] = _server_timing(
+            {**timings, "response_serialize": round(elapsed * 1000, 3)}
         )
+        return response
+
+
+class ComplexityAnalysisView(APIView):
+    """POST /api/v1/analyze/ — Time user code on growing inputs and fit its complexity."""
+
+    def post(self, request):
+        serializer = ComplexityAnalysisSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(complexity.analyze(**serializer.validated_data))
+
+
+class TraceView(APIView):
+    """GET /api/v1/traces/<id>/ — Summary of a trace stored by a paged execution."""
+
+    def get(self, request, trace_id):
+        trace = trace_store.get_store().get(trace_id)
+        if trace is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({**trace.meta, "url": reverse("trace-steps", args=[trace_id])})
+
+
+class TraceStepsView(APIView):
+    """GET /api/v1/traces/<id>/steps/?from=&to= — One page of a stored trace.
 
-        return Response(result, status=status.HTTP_200_OK)
+    Returns steps ``[from, to)``, at most ``TRACE_PAGE_MAX_STEPS`` of them,
+    and ``base``: the locals of live frames and the node table as of step
+    ``from`` (see ``trace_store.TraceState``), so a page can be shown
+    without fetching the ones before it. ``base=false`` leaves it out for
+    clients reading pages in order.
+    """
+
+    renderer_classes = TRACE_RENDERERS
+
+    def get(self, request, trace_id):
+        trace = trace_store.get_store().get(trace_id)
+        if trace is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        start = _int_param(request, "from", 0)
+        page_size = conf.get("TRACE_PAGE_MAX_STEPS")
+        stop = _int_param(request, "to", start + page_size)
+        if start > trace.total:
+            raise ValidationError({"from": f"The trace has {trace.total} steps."})
+        if stop < start:
+            raise ValidationError({"to": "Must not be less than 'from'."})
+        stop = min(stop, start + page_size, trace.total)
+
+        data = {"trace": trace_id, "from": start, "to": stop, "total": trace.total}
+        if request.query_params.get("base", "true").lower() not in ("0", "false"):
+            data["base"] = trace.state_at(start).as_dict()
+        data["steps"] = trace.steps(start, stop)
+        # Stored traces never change.
+        return Response(
+            data, headers={"Cache-Control": f"private, max-age={conf.get('TRACE_STORE_TTL')}"}
+        )
+
+
+class JobSubmitView(APIView):
+    """POST /api/v1/jobs/ — Queue user code for execution and return a job id."""
+
+    def post(self, request):
+        serializer = CodeExecutionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        scheduler = jobs.get_scheduler()
+        try:
+            job = scheduler.submit(**_execution_kwargs(serializer.validated_data))
+        except jobs.QueueFull as e:
+            return Response(
+                {"detail": str(e)},
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+
+        data = scheduler.snapshot(job)
+        data["status_url"] = reverse("job-detail", args=[job.id])
+        data["events_url"] = reverse("job-events", args=[job.id])
+        return Response(
+            data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": data["status_url"]},
+        )
+
+
+class JobDetailView(APIView):
+    """GET /api/v1/jobs/<id>/ — Poll a queued job; includes the result when done."""
+
+    def get(self, request, job_id):
+        scheduler = jobs.get_scheduler()
+        job = scheduler.get(job_id)
+        if job is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(scheduler.snapshot(job))
+
+
+class JobEventsView(APIView):
+    """GET /api/v1/jobs/<id>/events/ — Server-Sent Events with job status changes."""
+
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    def get(self, request, job_id):
+        scheduler = jobs.get_scheduler()
+        job = scheduler.get(job_id)
+        if job is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        response = StreamingHttpResponse(
+            _job_event_stream(scheduler, job),
+            content_type="text/event-stream",
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+def _job_event_stream(scheduler, job):
+    """Yield one SSE event per status change until the job is done."""
+    version = None
+    while True:
+        if job.version != version:
+            version = job.version
+            state = scheduler.snapshot(job)
+            yield f"event: {state['status']}\ndata: {json.dumps(state)}\n\n"
+            if state["status"] == jobs.DONE:
+                return
+        else:
+            yield ": keep-alive\n\n"
+        scheduler.wait_for_change(job, version, timeout=15)
+
+
+class MetricsView(View):
+    """GET /api/v1/metrics/ — Execution metrics in Prometheus text format.
+
+    Only served to the addresses in the ``METRICS_ALLOWED_IPS`` setting.
+    """
+
+    def get(self, request):
+        allowed = conf.get("METRICS_ALLOWED_IPS")
+        if allowed is not None and request.META.get("REMOTE_ADDR") not in allowed:
+            return HttpResponseForbidden()
+        return HttpResponse(
+            metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+        )
@@ -28,5 +28,9 @@ export const getVisualizationConfig = (conceptSlug) =>
 
 export const executeCode = (payload) => api.post('/execute/', payload);
 
+export const submitExecutionJob = (payload) => api.post('/jobs/', payload);
+
+export const getExecutionJob = (jobId) => api.get(`/jobs/${jobId}/`);
+
 export default api;
 